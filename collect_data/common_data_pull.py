@@ -5,16 +5,20 @@ from urllib.request import Request, urlopen
 
 import pandas as pd
 
+from common_functions.profiling import profiled_stage
+
 # Get path of current file's directory
 DIRNAME = os.path.dirname(os.path.realpath(__file__))
 
 
+@profiled_stage
 def download_csv(url: str, filepath: str):
     req = Request(url, headers={"User-Agent": "XYZ/3.0"})
     with urlopen(req, timeout=10) as in_stream, open(filepath, "wb") as out_file:
         copyfileobj(in_stream, out_file)
 
 
+@profiled_stage
 def download_json(url: str) -> dict:
     req = Request(url, headers={"User-Agent": "XYZ/3.0"})
     with urlopen(req, timeout=10) as in_stream:
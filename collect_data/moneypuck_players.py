@@ -1,21 +1,20 @@
 import os
-import sys
 from pathlib import Path
 
+from collect_data.read_local_data import read_mp_bio_data
+from collect_data.common_data_pull import download_csv
+from common_functions.profiling import profiled_stage
+
 # Get path of current file's directory
 dirname = os.path.dirname(os.path.realpath(__file__))
 
 
-sys.path.append(dirname)
-from collect_data.read_local_data import read_mp_bio_data
-from common_data_pull import download_csv
-
-
 class TypeException(Exception):
     def __init__(self, *args: object) -> None:
         super().__init__(*args)
 
 
+@profiled_stage
 def read_in_season_players_stats(season: int, type: str):
     """Pulls the skater data for a given season from moneypuck and stores it.
 
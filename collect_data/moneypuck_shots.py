@@ -0,0 +1,624 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from collect_data.common_data_pull import download_csv
+from common_functions.columnar_store import (
+    ArtifactWriter,
+    read_artifact,
+    write_artifact,
+)
+from common_functions.profiling import get_peak_rss_mb, profiled_stage
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+REPO_PATH = os.path.join(DIRNAME, "..")
+SHOT_DATA_PATH = os.path.join(DIRNAME, "../data/moneypuck/shot_data")
+SHOT_AGGREGATES_PATH = os.path.join(DIRNAME, "../data/moneypuck/shot_aggregates")
+
+# Bump when the aggregate tables change so cached tables are rebuilt
+SHOT_AGGREGATE_FORMAT = 1
+
+# Shots read at a time, memory use follows this and not the file size
+CHUNK_ROWS = 250_000
+
+# Fixture checks: peak memory allowed while streaming 50,000 shot chunks,
+# and how much more the largest fixture may use than the smallest
+MAX_STREAMED_PEAK_MB = 100
+MAX_STREAMED_PEAK_GROWTH = 0.1
+
+# Columns used from MoneyPuck's shot files, which have over 100
+SHOT_COLS = [
+    "season",
+    "game_id",
+    "isPlayoffGame",
+    "shooterPlayerId",
+    "shooterName",
+    "teamCode",
+    "event",
+    "goal",
+    "xGoal",
+    "shotWasOnGoal",
+    "shotDistance",
+    "shotRebound",
+    "shotRush",
+]
+GAME_KEYS = ["season", "game_id", "isPlayoffGame", "playerId"]
+SEASON_KEYS = ["season", "season_type", "playerId"]
+
+# Additive totals, so partial tables of chunks (or files) can be summed
+TOTAL_COLS = [
+    "shots",
+    "shots_on_goal",
+    "goals",
+    "xgoals",
+    "shot_distance_sum",
+    "rebound_shots",
+    "rush_shots",
+]
+COUNT_COLS = ["shots", "shots_on_goal", "goals", "rebound_shots", "rush_shots"]
+TOTAL_AGGREGATIONS = {
+    **{col: "sum" for col in TOTAL_COLS},
+    "name": "last",
+    "team": "last",
+}
+
+
+class ShotIngestionException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+@profiled_stage
+def read_in_season_shots(season: int) -> str:
+    """Pulls the shot level data for a given season from moneypuck and
+    stores it, zipped as published.
+
+    Args:
+        season (int): Season to pull data for. 2023-2024 is 2023.
+
+    Returns:
+        str: Path of the saved file.
+    """
+    # Moneypuck shot data url
+    file_url = f"https://peter-tanner.com/moneypuck/downloads/shots_{season}.zip"
+
+    # Create folder if doesn't exist
+    Path(SHOT_DATA_PATH).mkdir(parents=True, exist_ok=True)
+    filepath = os.path.join(SHOT_DATA_PATH, f"shots_{season}.zip")
+    download_csv(file_url, filepath)
+    return filepath
+
+
+def aggregate_shot_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    # Per player per game totals of a chunk of shots, without unknown shooters
+    chunk = chunk.loc[chunk["shooterPlayerId"].notna()]
+    return (
+        chunk.assign(playerId=chunk["shooterPlayerId"].astype(np.int64))
+        .groupby(GAME_KEYS, sort=False)
+        .agg(
+            shots=("event", "size"),
+            shots_on_goal=("shotWasOnGoal", "sum"),
+            goals=("goal", "sum"),
+            xgoals=("xGoal", "sum"),
+            shot_distance_sum=("shotDistance", "sum"),
+            rebound_shots=("shotRebound", "sum"),
+            rush_shots=("shotRush", "sum"),
+            name=("shooterName", "last"),
+            team=("teamCode", "last"),
+        )
+    )
+
+
+def combine_partials(partials: list, keys: list) -> pd.DataFrame:
+    # Sum the totals of rows with the same keys
+    aggregations = {
+        col: agg
+        for col, agg in TOTAL_AGGREGATIONS.items()
+        if col in partials[0].columns
+    }
+    if "games" in partials[0].columns:
+        aggregations["games"] = "sum"
+    return pd.concat(partials).groupby(level=keys, sort=False).agg(aggregations)
+
+
+def to_game_table(partial: pd.DataFrame) -> pd.DataFrame:
+    game_table = partial.reset_index()
+    game_table.insert(
+        2,
+        "season_type",
+        np.where(game_table.pop("isPlayoffGame") == 1, "playoffs", "regular"),
+    )
+    game_table[COUNT_COLS] = game_table[COUNT_COLS].astype(np.int64)
+    game_table["xgoals"] = game_table["xgoals"].astype(float)
+    game_table["shot_distance_sum"] = game_table["shot_distance_sum"].astype(float)
+    return game_table.loc[
+        :, ["season", "game_id", "season_type", "playerId", "name", "team", *TOTAL_COLS]
+    ]
+
+
+def to_season_partial(game_table: pd.DataFrame) -> pd.DataFrame:
+    # Season totals of player games, each row being one game played
+    return (
+        game_table.assign(games=1)
+        .groupby(SEASON_KEYS, sort=False)
+        .agg({**TOTAL_AGGREGATIONS, "games": "sum"})
+    )
+
+
+def get_source_info(file_path: str) -> dict:
+    stat = os.stat(file_path)
+    return {
+        "source_file": os.path.basename(file_path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "format": SHOT_AGGREGATE_FORMAT,
+    }
+
+
+def get_aggregate_folder_path(file_path: str) -> str:
+    # e.g. data/moneypuck/shot_aggregates/shots_2023 for shots_2023.zip
+    return os.path.join(SHOT_AGGREGATES_PATH, os.path.basename(file_path).split(".")[0])
+
+
+@profiled_stage
+def ingest_shot_file(
+    file_path: str,
+    output_folder_path: str = None,
+    chunk_rows: int = CHUNK_ROWS,
+    force: bool = False,
+) -> dict:
+    """Aggregate a shot level file into per player per game and per player
+    per season tables, reading it in chunks.
+
+    Player games are written out once the file moves past their game, so
+    only the shots of a chunk and the games still open are held. Files
+    ordered by game (as MoneyPuck publishes them) are aggregated in
+    bounded memory whatever their size. Files out of game order are summed
+    again in a final pass over the per game table.
+
+    The tables are saved as columnar artifacts (player_game.colz and
+    player_season.colz) and reused until the source file changes.
+
+    Args:
+        file_path (str): Shot file, csv or zipped csv.
+        output_folder_path (str, optional): Folder to save the tables in.
+            Defaults to the file's folder in SHOT_AGGREGATES_PATH.
+        chunk_rows (int, optional): Shots read at a time. Defaults to
+            CHUNK_ROWS.
+        force (bool, optional): Aggregate even if the saved tables are
+            current. Defaults to False.
+
+    Returns:
+        dict: Summary of the ingestion, with the peak memory of the process.
+    """
+    if output_folder_path is None:
+        output_folder_path = get_aggregate_folder_path(file_path)
+    source_info_path = os.path.join(output_folder_path, "source.json")
+    source_info = get_source_info(file_path)
+
+    # Skip files aggregated since they last changed
+    if not force and os.path.exists(source_info_path):
+        with open(source_info_path) as f:
+            summary = json.load(f)
+        if all(summary.get(k) == v for k, v in source_info.items()):
+            return {**summary, "cached": True, "process_peak_rss_mb": get_peak_rss_mb()}
+
+    Path(output_folder_path).mkdir(parents=True, exist_ok=True)
+    game_path = os.path.join(output_folder_path, "player_game.colz")
+    season_path = os.path.join(output_folder_path, "player_season.colz")
+
+    rows = 0
+    chunks = 0
+    player_games = 0
+    # Whether every game's shots follow the shots of earlier games, checked
+    # on the season and game id of each shot against the last one
+    ordered_by_game = True
+    last_game_key = -1
+    open_games = None
+    season_totals = None
+
+    def write_games(partial: pd.DataFrame):
+        nonlocal player_games, season_totals
+        if partial.shape[0] == 0:
+            return
+        game_table = to_game_table(partial)
+        writer.append(game_table)
+        player_games += game_table.shape[0]
+
+        season_partial = to_season_partial(game_table)
+        season_totals = (
+            season_partial
+            if season_totals is None
+            else combine_partials([season_totals, season_partial], SEASON_KEYS)
+        )
+
+    with ArtifactWriter(game_path) as writer:
+        reader = pd.read_csv(file_path, usecols=SHOT_COLS, chunksize=chunk_rows)
+        for chunk in reader:
+            rows += chunk.shape[0]
+            chunks += 1
+            game_keys = chunk["season"].to_numpy(dtype=np.int64) * 1_000_000 + (
+                chunk["game_id"].to_numpy(dtype=np.int64)
+            )
+            if game_keys[0] < last_game_key or (np.diff(game_keys) < 0).any():
+                ordered_by_game = False
+            last_game_key = game_keys[-1]
+
+            partial = aggregate_shot_chunk(chunk)
+            if open_games is not None:
+                partial = combine_partials([open_games, partial], GAME_KEYS)
+
+            # The chunk's last game may continue in the next chunk
+            last_game = chunk["game_id"].iloc[-1]
+            is_open = partial.index.get_level_values("game_id") == last_game
+            write_games(partial.loc[~is_open])
+            open_games = partial.loc[is_open]
+        if open_games is not None:
+            write_games(open_games)
+
+    if not ordered_by_game:
+        # Sum the player games written more than once. This pass holds the
+        # per game table, still much smaller than the shots.
+        game_table = read_artifact(game_path)
+        game_table = (
+            game_table.groupby(
+                ["season", "game_id", "season_type", "playerId"], sort=False
+            )
+            .agg(TOTAL_AGGREGATIONS)
+            .reset_index()
+            .loc[:, game_table.columns]
+        )
+        write_artifact(game_table, game_path)
+        season_totals = to_season_partial(game_table)
+        player_games = game_table.shape[0]
+
+    season_cols = [*SEASON_KEYS, "name", "team", "games", *TOTAL_COLS]
+    season_table = (
+        pd.DataFrame(columns=season_cols)
+        if season_totals is None
+        else season_totals.reset_index().loc[:, season_cols]
+    )
+    season_table = season_table.sort_values(by=SEASON_KEYS, ignore_index=True)
+    write_artifact(season_table, season_path)
+
+    summary = {
+        **source_info,
+        "rows": rows,
+        "chunks": chunks,
+        "player_games": player_games,
+        "player_seasons": season_table.shape[0],
+        "ordered_by_game": ordered_by_game,
+    }
+    with open(source_info_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    return {**summary, "cached": False, "process_peak_rss_mb": get_peak_rss_mb()}
+
+
+def ingest_all_shot_files(force: bool = False) -> pd.DataFrame:
+    # Aggregate every downloaded shot file, skipping the current ones
+    file_paths = sorted(
+        p for p in Path(SHOT_DATA_PATH).glob("shots_*") if p.suffix in [".csv", ".zip"]
+    )
+    return pd.DataFrame([ingest_shot_file(str(p), force=force) for p in file_paths])
+
+
+def read_shot_aggregates(
+    level: str = "season",
+    columns: list = None,
+    aggregates_path: str = SHOT_AGGREGATES_PATH,
+) -> pd.DataFrame:
+    """Read the aggregated shot data of every ingested file.
+
+    Args:
+        level (str, optional): "season" for player seasons or "game" for
+            player games. Defaults to "season".
+        columns (list, optional): Columns to read. Defaults to all columns
+            and the rates derived from the totals.
+        aggregates_path (str, optional): Folder of the aggregate folders.
+            Defaults to SHOT_AGGREGATES_PATH.
+
+    Raises:
+        ValueError: Level must be season or game.
+
+    Returns:
+        pd.DataFrame: Aggregated shot data.
+    """
+    if level not in ["season", "game"]:
+        raise ValueError(f"Level must be in 'season' or 'game', '{level}' given.")
+    file_paths = sorted(Path(aggregates_path).glob(f"*/player_{level}.colz"))
+    data = pd.concat(
+        [read_artifact(str(p), columns=columns) for p in file_paths],
+        ignore_index=True,
+    )
+
+    if columns is None:
+        shots = data["shots"].where(data["shots"] > 0)
+        data["mean_shot_distance"] = data["shot_distance_sum"] / shots
+        data["shooting_pct"] = data["goals"] / data["shots_on_goal"].where(
+            data["shots_on_goal"] > 0
+        )
+        data["goals_above_expected"] = data["goals"] - data["xgoals"]
+    return data
+
+
+def generate_shot_fixture(
+    file_path: str,
+    num_games: int,
+    shots_per_game: int = 110,
+    num_players: int = 800,
+    season: int = 2023,
+    playoff_games: int = 0,
+    seed: int = 0,
+):
+    """Write a synthetic shot file shaped like MoneyPuck's, a block of games
+    at a time so large files can be generated in little memory.
+
+    Args:
+        file_path (str): Csv to write.
+        num_games (int): Games in the file, ordered by game_id.
+        shots_per_game (int, optional): Shot attempts per game. Defaults to 110.
+        num_players (int, optional): Shooters. Defaults to 800.
+        season (int, optional): Season of the games. Defaults to 2023.
+        playoff_games (int, optional): Last games that are playoff games.
+            Defaults to 0.
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+    rng = np.random.default_rng(seed)
+    player_ids = 8470000 + np.arange(num_players)
+    teams = np.array([f"T{i:02d}" for i in range(32)])
+    # Playoff game ids follow the regular season ids, as in MoneyPuck's files
+    regular_games = num_games - playoff_games
+    playoff_game_id = 30001 + 10000 * (regular_games // 10000)
+    shot_id = 0
+    games_per_block = 500
+    for start in range(0, num_games, games_per_block):
+        games = np.arange(start, min(start + games_per_block, num_games))
+        n = len(games) * shots_per_game
+        game_index = np.repeat(games, shots_per_game)
+        is_playoff = game_index >= num_games - playoff_games
+        shooters = player_ids[rng.integers(0, num_players, n)]
+        event = rng.choice(["SHOT", "MISS", "GOAL"], n, p=[0.62, 0.32, 0.06])
+
+        block = pd.DataFrame(
+            {
+                "shotID": np.arange(shot_id, shot_id + n),
+                "season": season,
+                "game_id": np.where(
+                    is_playoff,
+                    playoff_game_id + game_index - regular_games,
+                    20001 + game_index,
+                ),
+                "isPlayoffGame": is_playoff.astype(int),
+                "period": rng.integers(1, 4, n),
+                "time": rng.integers(0, 3600, n),
+                # Shots without a known shooter, as in MoneyPuck's files
+                "shooterPlayerId": np.where(rng.random(n) < 0.001, np.nan, shooters),
+                "shooterName": [f"Player {p}" for p in shooters],
+                "teamCode": teams[shooters % 32],
+                "event": event,
+                "goal": (event == "GOAL").astype(int),
+                "xGoal": rng.beta(1, 12, n).round(6),
+                "shotWasOnGoal": (event != "MISS").astype(float),
+                "shotDistance": rng.gamma(2, 17, n).round(2),
+                "shotAngle": rng.uniform(-90, 90, n).round(2),
+                "shotRebound": (rng.random(n) < 0.07).astype(int),
+                "shotRush": (rng.random(n) < 0.05).astype(int),
+            }
+        )
+        block.to_csv(
+            file_path, mode="a" if start > 0 else "w", index=False, header=start == 0
+        )
+        shot_id += n
+
+
+def check_shot_aggregates(
+    file_path: str, output_folder_path: str, tolerance: float = 1e-9
+):
+    """Compare the streamed per game and per season tables with the same
+    tables aggregated from the whole file in memory. For fixtures.
+
+    Raises:
+        ShotIngestionException: The tables have different rows or totals.
+    """
+    expected_games = to_game_table(aggregate_shot_chunk(pd.read_csv(file_path)))
+    expected_seasons = to_season_partial(expected_games).reset_index()
+    for level, expected, keys in [
+        (
+            "player_game",
+            expected_games,
+            ["season", "game_id", "season_type", "playerId"],
+        ),
+        ("player_season", expected_seasons, SEASON_KEYS),
+    ]:
+        streamed = read_artifact(os.path.join(output_folder_path, f"{level}.colz"))
+        total_cols = [*TOTAL_COLS, *(["games"] if level == "player_season" else [])]
+        expected = expected.sort_values(by=keys, ignore_index=True)
+        streamed = streamed.sort_values(by=keys, ignore_index=True)
+        if expected.shape[0] != streamed.shape[0] or not (
+            expected[keys] == streamed[keys]
+        ).all(axis=None):
+            raise ShotIngestionException(
+                f"{level} of {file_path} has {streamed.shape[0]} rows, "
+                f"{expected.shape[0]} expected, or different keys."
+            )
+        difference = float(
+            np.abs(expected[total_cols] - streamed[total_cols]).max(axis=None)
+        )
+        if difference > tolerance:
+            raise ShotIngestionException(
+                f"{level} totals of {file_path} differ by {difference}."
+            )
+
+
+def measure_peak_allocated(code: str) -> float:
+    """Peak memory allocated (MB) while running code in a fresh interpreter.
+    Traced allocations are used rather than peak RSS, which a child process
+    inherits from the process that started it.
+    """
+    code = (
+        "import tracemalloc\n"
+        "tracemalloc.start()\n"
+        f"{code}\n"
+        "print(tracemalloc.get_traced_memory()[1] / 1024**2)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_PATH, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def shuffle_shot_fixture(file_path: str, shuffled_file_path: str, seed: int = 0):
+    # Same shots in a random order, so games are spread over every chunk
+    shots = pd.read_csv(file_path)
+    shots.sample(frac=1, random_state=seed).to_csv(shuffled_file_path, index=False)
+
+
+def benchmark_shot_ingestion(
+    num_games: list = None,
+    chunk_rows: int = 50_000,
+    max_peak_mb: float = MAX_STREAMED_PEAK_MB,
+    max_peak_growth: float = MAX_STREAMED_PEAK_GROWTH,
+) -> pd.DataFrame:
+    """Ingest fixture files of growing size, each in a fresh interpreter,
+    and compare the peak memory with reading the whole file at once. A
+    shuffled copy of the smallest fixture is ingested too.
+
+    Every fixture must match the tables aggregated in memory, span several
+    chunks with a game split between two of them, and stay under the peak
+    memory bound.
+
+    Args:
+        num_games (list, optional): Games per fixture, 110 shots each.
+            Defaults to [500, 2000, 8000].
+        chunk_rows (int, optional): Shots read at a time. Defaults to 50,000.
+        max_peak_mb (float, optional): Peak memory allowed while streaming.
+            Defaults to MAX_STREAMED_PEAK_MB.
+        max_peak_growth (float, optional): Share of peak memory the largest
+            fixture may use over the smallest. Defaults to
+            MAX_STREAMED_PEAK_GROWTH.
+
+    Raises:
+        ShotIngestionException: A fixture check failed.
+
+    Returns:
+        pd.DataFrame: Peak memory of each fixture.
+    """
+    if num_games is None:
+        num_games = [500, 2000, 8000]
+
+    def ingest_fixture(file_path: str, output_folder_path: str) -> dict:
+        streamed_mb = measure_peak_allocated(
+            "from collect_data.moneypuck_shots import ingest_shot_file\n"
+            f"ingest_shot_file({file_path!r}, {output_folder_path!r},"
+            f" chunk_rows={chunk_rows})"
+        )
+        with open(os.path.join(output_folder_path, "source.json")) as f:
+            summary = json.load(f)
+        check_shot_aggregates(file_path, output_folder_path)
+        return {
+            "shots": summary["rows"],
+            "file_mb": os.path.getsize(file_path) / 1024**2,
+            "chunks": summary["chunks"],
+            "ordered_by_game": summary["ordered_by_game"],
+            "player_games": summary["player_games"],
+            "streamed_peak_mb": streamed_mb,
+        }
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_folder_path:
+        for i, games in enumerate(sorted(num_games)):
+            file_path = os.path.join(tmp_folder_path, f"shots_{games}.csv")
+            generate_shot_fixture(file_path, games, playoff_games=games // 20)
+            result = ingest_fixture(
+                file_path, os.path.join(tmp_folder_path, f"shots_{games}")
+            )
+
+            # The game of the last shot of the first chunk goes on in the next
+            boundary = pd.read_csv(
+                file_path, usecols=["game_id"], skiprows=range(1, chunk_rows), nrows=2
+            )
+            if result["chunks"] < 2 or boundary["game_id"].nunique() != 1:
+                raise ShotIngestionException(
+                    f"Fixture of {games} games must span chunks with a game "
+                    f"split between them, use more games or other chunk_rows."
+                )
+
+            # Only ordered files are aggregated in bounded memory
+            if not result["ordered_by_game"]:
+                raise ShotIngestionException(f"Fixture of {games} games not ordered.")
+            if result["streamed_peak_mb"] > max_peak_mb:
+                raise ShotIngestionException(
+                    f"Fixture of {games} games peaked at "
+                    f"{result['streamed_peak_mb']:.1f} MB, over {max_peak_mb} MB."
+                )
+            if results and result["streamed_peak_mb"] > results[0][
+                "streamed_peak_mb"
+            ] * (1 + max_peak_growth):
+                raise ShotIngestionException(
+                    f"Peak memory grew from {results[0]['streamed_peak_mb']:.1f} MB "
+                    f"to {result['streamed_peak_mb']:.1f} MB with the file size."
+                )
+
+            result["full_read_peak_mb"] = measure_peak_allocated(
+                f"import pandas as pd\npd.read_csv({file_path!r})"
+            )
+            results.append({"games": games, **result})
+
+            if i == 0:
+                # Games spread over every chunk go through the final pass
+                shuffled_file_path = os.path.join(tmp_folder_path, "shuffled.csv")
+                shuffle_shot_fixture(file_path, shuffled_file_path)
+                shuffled = ingest_fixture(
+                    shuffled_file_path, os.path.join(tmp_folder_path, "shuffled")
+                )
+                if shuffled["ordered_by_game"]:
+                    raise ShotIngestionException("Shuffled fixture read as ordered.")
+                shuffled_result = {"games": f"{games} shuffled", **shuffled}
+                os.remove(shuffled_file_path)
+            os.remove(file_path)
+    return pd.DataFrame([*results, shuffled_result])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Aggregate MoneyPuck shot data into player game and season tables."
+    )
+    parser.add_argument("--seasons", nargs="+", type=int, help="Seasons to download")
+    parser.add_argument("--ingest", help="Aggregate one shot file")
+    parser.add_argument("--output-folder", help="Folder to save its tables")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--force", action="store_true", help="Ignore saved tables")
+    parser.add_argument(
+        "--benchmark",
+        nargs="*",
+        type=int,
+        help="Peak memory on fixtures of these numbers of games",
+    )
+    args = parser.parse_args()
+
+    if args.benchmark is not None:
+        print(benchmark_shot_ingestion(args.benchmark or None).to_string(index=False))
+    elif args.ingest is not None:
+        print(
+            ingest_shot_file(
+                args.ingest,
+                args.output_folder,
+                chunk_rows=args.chunk_rows,
+                force=args.force,
+            )
+        )
+    else:
+        for season in args.seasons or []:
+            read_in_season_shots(season)
+        print(ingest_all_shot_files(force=args.force).to_string(index=False))
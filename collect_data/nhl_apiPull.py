@@ -1,16 +1,11 @@
 import json
-import os
-import sys
 import urllib
 from shutil import copyfileobj
 
 import pandas as pd
 
-# Get path of current file's directory
-DIRNAME = os.path.dirname(os.path.realpath(__file__))
-
-sys.path.insert(0, os.path.join(DIRNAME, ".."))
 from collect_data.common_data_pull import download_json
+from common_functions.profiling import profiled_stage
 
 
 def read_in_current_team_roster(team_abr: str, season: int) -> pd.DataFrame:
@@ -42,6 +37,7 @@ def read_in_all_team_names() -> pd.DataFrame:
     return pd.DataFrame(team_data["data"])
 
 
+@profiled_stage
 def get_all_nhl_rosters(season: int) -> pd.DataFrame:
     team_data = read_in_all_team_names()
 
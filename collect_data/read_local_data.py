@@ -3,10 +3,13 @@ import sys
 
 import pandas as pd
 
+from common_functions.profiling import profiled_stage
+
 # Get path of current file's directory
 DIRNAME = os.path.dirname(os.path.realpath(__file__))
 
 
+@profiled_stage
 def read_in_all_mp_data(season_type: str) -> pd.DataFrame:
     mp_player_data_filepath = os.path.join(DIRNAME, "../data/moneypuck/player_data")
     mp_files = os.listdir(mp_player_data_filepath)
@@ -22,12 +25,14 @@ def read_in_all_mp_data(season_type: str) -> pd.DataFrame:
     return all_data.sort_values(by=["season", "playerId"], ascending=True)
 
 
+@profiled_stage
 def read_mp_bio_data() -> pd.DataFrame:
     mp_data_filepath = os.path.join(DIRNAME, "../data/moneypuck")
     bio_data = pd.read_csv(os.path.join(mp_data_filepath, "player_biography_data.csv"))
     return bio_data
 
 
+@profiled_stage
 def read_in_salary_data_puckpedia() -> pd.DataFrame:
     mp_data_filepath = os.path.join(DIRNAME, "../data")
     salary_data = pd.read_csv(
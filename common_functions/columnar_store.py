@@ -0,0 +1,246 @@
+import json
+import os
+import struct
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Single file compressed frames: column chunks per row group, then a json
+# footer with the schema and chunk offsets, its length and the magic bytes
+ARTIFACT_MAGIC = b"HACOL1"
+ARTIFACT_FORMAT = 1
+
+
+class ColumnarSchemaException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+def shuffle_bytes(values: np.ndarray) -> bytes:
+    # Group the nth byte of every value together, which compresses numeric
+    # columns far better than the values' raw bytes
+    return values.view(np.uint8).reshape(-1, values.itemsize).T.tobytes()
+
+
+def unshuffle_bytes(data: bytes, dtype: str) -> np.ndarray:
+    itemsize = np.dtype(dtype).itemsize
+    shuffled = np.frombuffer(data, dtype=np.uint8).reshape(itemsize, -1)
+    return np.ascontiguousarray(shuffled.T).view(dtype).ravel()
+
+
+class ArtifactWriter:
+    """Writes DataFrame chunks to a single compressed columnar file. Each
+    appended chunk is a row group, so readers only decompress the row groups
+    and columns they ask for. Text columns are dictionary encoded. The index
+    is saved as a column and restored on read.
+
+    The file is written to a temporary path and moved into place on close.
+    """
+
+    def __init__(self, file_path: str, compression_level: int = 6):
+        self.file_path = file_path
+        self.compression_level = compression_level
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        self.tmp_path = f"{file_path}.tmp"
+        self.file = open(self.tmp_path, "wb")
+        self.file.write(ARTIFACT_MAGIC)
+        self.columns = None
+        self.categories = None
+        self.row_groups = []
+        self.num_rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            # Leave no partial file behind
+            self.file.close()
+            os.remove(self.tmp_path)
+
+    def get_column_values(self, values: pd.Series) -> tuple:
+        if values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object)
+            missing = values.isna().to_numpy()
+            if not values[~missing].map(lambda x: isinstance(x, str)).all():
+                raise ColumnarSchemaException(
+                    f"Column {values.name} mixes text with other types."
+                )
+            return "text", values.to_numpy(), missing
+        if values.dtype.kind not in "biufM" or isinstance(
+            values.dtype, pd.api.extensions.ExtensionDtype
+        ):
+            raise ColumnarSchemaException(
+                f"Column {values.name} has unsupported dtype {values.dtype}."
+            )
+        return "numeric", values.to_numpy(), None
+
+    def append(self, data: pd.DataFrame):
+        # The index is stored as the first column
+        index_name = data.index.name
+        data = data.reset_index(names="__index__")
+
+        if self.columns is None:
+            self.columns = []
+            self.categories = {}
+            for i, col in enumerate(data.columns):
+                kind, values, _ = self.get_column_values(data[col])
+                self.columns.append(
+                    {
+                        "name": str(col),
+                        "kind": kind,
+                        "dtype": "<i4" if kind == "text" else values.dtype.str,
+                    }
+                )
+                if kind == "text":
+                    self.categories[i] = {}
+            self.index_name = index_name
+        elif [str(c) for c in data.columns] != [c["name"] for c in self.columns]:
+            raise ColumnarSchemaException(
+                f"Columns must be {[c['name'] for c in self.columns[1:]]}. "
+                f"{list(data.columns[1:])} given."
+            )
+
+        chunks = []
+        for i, column in enumerate(self.columns):
+            kind, values, missing = self.get_column_values(data.iloc[:, i])
+            if kind != column["kind"]:
+                raise ColumnarSchemaException(
+                    f"Column {column['name']} must be {column['kind']}."
+                )
+            if kind == "text":
+                # Codes into the column's categories, -1 for missing
+                categories = self.categories[i]
+                for value in pd.unique(values[~missing]):
+                    categories.setdefault(value, len(categories))
+                values = pd.Series(values).map(categories).fillna(-1).to_numpy()
+            values = np.ascontiguousarray(values.astype(column["dtype"]))
+
+            offset = self.file.tell()
+            self.file.write(
+                zlib.compress(shuffle_bytes(values), self.compression_level)
+            )
+            chunks.append([offset, self.file.tell() - offset])
+
+        self.row_groups.append({"num_rows": data.shape[0], "chunks": chunks})
+        self.num_rows += data.shape[0]
+
+    def close(self):
+        for i, categories in (self.categories or {}).items():
+            self.columns[i]["categories"] = list(categories)
+        footer = json.dumps(
+            {
+                "format": ARTIFACT_FORMAT,
+                "num_rows": self.num_rows,
+                "index_name": getattr(self, "index_name", None),
+                "columns": self.columns or [],
+                "row_groups": self.row_groups,
+            }
+        ).encode()
+        self.file.write(footer)
+        self.file.write(struct.pack("<Q", len(footer)))
+        self.file.write(ARTIFACT_MAGIC)
+        self.file.close()
+        os.replace(self.tmp_path, self.file_path)
+
+
+def write_artifact(
+    data: pd.DataFrame,
+    file_path: str,
+    row_group_size: int = 65536,
+    compression_level: int = 6,
+):
+    with ArtifactWriter(file_path, compression_level=compression_level) as writer:
+        for start in range(0, max(data.shape[0], 1), row_group_size):
+            writer.append(data.iloc[start : start + row_group_size])
+
+
+def read_artifact_schema(file_path: str) -> dict:
+    with open(file_path, "rb") as f:
+        return _read_artifact_footer(f)
+
+
+def _read_artifact_footer(f) -> dict:
+    tail_size = 8 + len(ARTIFACT_MAGIC)
+    f.seek(-tail_size, os.SEEK_END)
+    tail = f.read(tail_size)
+    if tail[8:] != ARTIFACT_MAGIC:
+        raise ColumnarSchemaException(f"{f.name} is not a columnar artifact.")
+    (footer_size,) = struct.unpack("<Q", tail[:8])
+    f.seek(-tail_size - footer_size, os.SEEK_END)
+    footer = json.loads(f.read(footer_size))
+    if footer["format"] != ARTIFACT_FORMAT:
+        raise ColumnarSchemaException(
+            f"Artifact format must be {ARTIFACT_FORMAT}. {footer['format']} given."
+        )
+    return footer
+
+
+def read_artifact(
+    file_path: str, columns: list = None, start: int = 0, stop: int = None
+) -> pd.DataFrame:
+    """Read selected columns and rows of a columnar artifact. Only the row
+    groups holding the rows and the chunks of the columns are read and
+    decompressed.
+
+    Args:
+        file_path (str): File written by ArtifactWriter.
+        columns (list, optional): Columns to read. Defaults to all columns.
+        start (int, optional): First row to read. Defaults to 0.
+        stop (int, optional): Row to stop before. Defaults to the last row.
+
+    Raises:
+        ColumnarSchemaException: Unknown columns requested.
+
+    Returns:
+        pd.DataFrame: Requested data with its saved index.
+    """
+    with open(file_path, "rb") as f:
+        schema = _read_artifact_footer(f)
+        names = [c["name"] for c in schema["columns"]]
+        if columns is None:
+            columns = names[1:]
+        unknown_columns = set(columns) - set(names[1:])
+        if len(unknown_columns) > 0:
+            raise ColumnarSchemaException(f"Unknown columns {sorted(unknown_columns)}.")
+        stop = schema["num_rows"] if stop is None else min(stop, schema["num_rows"])
+        start = min(start, stop)
+
+        name_positions = {name: i for i, name in enumerate(names)}
+        positions = [0] + [name_positions[c] for c in columns]
+        parts = {i: [] for i in positions}
+        group_start = 0
+        for row_group in schema["row_groups"]:
+            group_stop = group_start + row_group["num_rows"]
+            if group_stop > start and group_start < stop:
+                for i in positions:
+                    offset, size = row_group["chunks"][i]
+                    f.seek(offset)
+                    values = unshuffle_bytes(
+                        zlib.decompress(f.read(size)), schema["columns"][i]["dtype"]
+                    )
+                    parts[i].append(
+                        values[max(start - group_start, 0) : stop - group_start]
+                    )
+            group_start = group_stop
+
+    data = {}
+    for i in positions:
+        column = schema["columns"][i]
+        values = (
+            np.concatenate(parts[i])
+            if len(parts[i]) > 0
+            else np.array([], dtype=column["dtype"])
+        )
+        if column["kind"] == "text":
+            values = pd.Categorical.from_codes(
+                values, categories=column["categories"]
+            ).astype(object)
+        data[column["name"]] = values
+
+    index = pd.Index(data.pop("__index__"), name=schema["index_name"])
+    return pd.DataFrame(data, index=index).loc[:, columns]
@@ -0,0 +1,50 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+
+
+def write_feature_partition(
+    partition: pd.DataFrame, partition_folder: str, partition_number: int
+) -> str:
+    # Create folder if doesn't exist
+    Path(partition_folder).mkdir(parents=True, exist_ok=True)
+    partition_path = os.path.join(
+        partition_folder, f"partition_{partition_number:05d}.pkl"
+    )
+    partition.to_pickle(partition_path)
+    return partition_path
+
+
+def write_feature_partitions(
+    feature_data: pd.DataFrame, partition_folder: str, rows_per_partition: int
+) -> list:
+    """Split feature data into pickled partitions of at most rows_per_partition
+    rows.
+
+    Args:
+        feature_data (pd.DataFrame): Feature data with identifiers and target.
+        partition_folder (str): Folder to save partitions to.
+        rows_per_partition (int): Max number of rows in a partition.
+
+    Returns:
+        list: Filepaths of the partitions.
+    """
+    partition_paths = []
+    for i, start in enumerate(range(0, feature_data.shape[0], rows_per_partition)):
+        partition_paths.append(
+            write_feature_partition(
+                feature_data.iloc[start : start + rows_per_partition],
+                partition_folder,
+                i,
+            )
+        )
+    return partition_paths
+
+
+def get_partition_paths(partition_folder: str) -> list:
+    return sorted(
+        os.path.join(partition_folder, f)
+        for f in os.listdir(partition_folder)
+        if f.startswith("partition_") and f.endswith(".pkl")
+    )
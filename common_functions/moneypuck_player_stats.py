@@ -1,16 +1,10 @@
-import os
-import sys
 from datetime import datetime
 
 import numpy as np
 import pandas as pd
 
-# Get path of current file's directory
-DIRNAME = os.path.dirname(os.path.realpath(__file__))
-
-# Insert path to all hockey analytics files
-sys.path.insert(0, os.path.join(DIRNAME, ".."))
 from collect_data.read_local_data import read_in_all_mp_data
+from common_functions.profiling import profiled_stage
 
 
 class InvalidSeasonType(Exception):
@@ -39,6 +33,7 @@ def check_season_type_valid_mp(season_type: str) -> bool:
         return True
 
 
+@profiled_stage
 def get_mp_player_data_for_year(
     season: int,
     season_type: str,
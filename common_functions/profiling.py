@@ -0,0 +1,366 @@
+import contextvars
+import functools
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is not recorded there
+    resource = None
+
+# Name of the run report saved in a batch (or model) folder, per run name
+RUN_REPORT_FILENAME = "run_report_{run_name}.json"
+
+# Seconds between samples of the sampling profile
+SAMPLE_INTERVAL = 0.005
+
+# Run being profiled in the current context, stages outside a run are not
+# recorded. Worker threads only see it when run with bind_context.
+_ACTIVE_RUN = contextvars.ContextVar("active_run", default=None)
+# Innermost open stage of the current context, the parent of new stages
+_ACTIVE_STAGE = contextvars.ContextVar("active_stage", default=None)
+
+
+def get_peak_rss_mb() -> float:
+    # High-water mark of the whole process so far, not of the current stage
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak_rss / (1024**2 if sys.platform == "darwin" else 1024)
+
+
+def count_rows(value) -> int:
+    # Rows of the first frame or array in a value (or tuple of values)
+    if isinstance(value, tuple):
+        return next((r for r in map(count_rows, value) if r is not None), None)
+    # Frames, series and arrays
+    if hasattr(value, "shape") and len(value.shape) > 0:
+        return int(value.shape[0])
+    return None
+
+
+class Stage:
+    """Timings, memory, rows and cache lookups of one call of a stage."""
+
+    def __init__(self, name: str, parent: "Stage" = None, rows_in: int = None):
+        self.name = name
+        self.parent = parent
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.cache_hits = 0
+        self.cache_lookups = 0
+        self.child_seconds = 0.0
+        self.error = None
+
+    def record_cache(self, hits: int, lookups: int):
+        self.cache_hits += int(hits)
+        self.cache_lookups += int(lookups)
+
+    def start(self):
+        self.start_rss_mb = get_peak_rss_mb()
+        self.start_cpu = time.process_time()
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        self.wall_seconds = time.perf_counter() - self.start_time
+        self.cpu_seconds = time.process_time() - self.start_cpu
+        self.process_peak_rss_mb = get_peak_rss_mb()
+
+    @property
+    def self_seconds(self) -> float:
+        # Time not spent in nested stages, nested stages run in parallel can
+        # add up to more than the stage
+        return max(self.wall_seconds - self.child_seconds, 0.0)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "parent": None if self.parent is None else self.parent.name,
+            "depth": self.depth,
+            "wall_seconds": self.wall_seconds,
+            "self_seconds": self.self_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            # ru_maxrss is the process high-water mark, so a stage only shows
+            # growth when it raised the peak of the whole process
+            "process_peak_rss_mb": self.process_peak_rss_mb,
+            "process_peak_growth_mb": (
+                None
+                if self.process_peak_rss_mb is None
+                else self.process_peak_rss_mb - self.start_rss_mb
+            ),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "cache_hits": self.cache_hits,
+            "cache_lookups": self.cache_lookups,
+            "error": self.error,
+        }
+
+
+class StackSampler(threading.Thread):
+    """Samples the call stack of a thread at a fixed interval, counting the
+    collapsed stacks seen in each stage.
+    """
+
+    def __init__(self, run: "ProfiledRun", interval: float = SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.run_being_sampled = run
+        self.thread_id = threading.get_ident()
+        self.interval = interval
+        self.samples = defaultdict(Counter)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            stage = self.run_being_sampled.open_stages.get(self.thread_id)
+            frame = sys._current_frames().get(self.thread_id)
+            if stage is None or frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                    f":{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            # Samples count for the innermost stage only, like self time
+            self.samples[stage][";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class ProfiledRun:
+    """Stages recorded during a pipeline run (e.g. scoring a batch). Stages
+    can be recorded from several threads at once.
+    """
+
+    def __init__(self, run_name: str, sample_profile: bool = False):
+        self.run_name = run_name
+        self.stages = []
+        # Innermost open stage of each thread
+        self.open_stages = {}
+        self._lock = threading.Lock()
+        self.sampler = StackSampler(self) if sample_profile else None
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int = None):
+        # The parent can be open in another thread, e.g. the thread that
+        # submitted this stage to a pool
+        parent = _ACTIVE_STAGE.get()
+        stage = Stage(name, parent, rows_in)
+        thread_id = threading.get_ident()
+        with self._lock:
+            self.stages.append(stage)
+            outer_stage = self.open_stages.get(thread_id)
+            self.open_stages[thread_id] = stage
+        token = _ACTIVE_STAGE.set(stage)
+        stage.start()
+        try:
+            yield stage
+        except BaseException as e:
+            stage.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            stage.stop()
+            _ACTIVE_STAGE.reset(token)
+            with self._lock:
+                if parent is not None:
+                    parent.child_seconds += stage.wall_seconds
+                self.open_stages[thread_id] = outer_stage
+
+    def get_slowest_stage(self) -> Stage:
+        # Slowest by self time, where the time is spent rather than waited on
+        if len(self.stages) == 0:
+            return None
+        return max(self.stages, key=lambda s: s.self_seconds)
+
+    def get_profile(self, stage: Stage, top: int = 15) -> dict:
+        stacks = self.sampler.samples.get(stage, Counter())
+        self_samples = Counter()
+        total_samples = Counter()
+        for stack, count in stacks.items():
+            functions = stack.split(";")
+            self_samples[functions[-1]] += count
+            # Recursive functions count once per sample
+            for function in set(functions):
+                total_samples[function] += count
+        return {
+            "stage": stage.name,
+            "interval_seconds": self.sampler.interval,
+            "samples": sum(stacks.values()),
+            "top_self": [
+                {"function": f, "samples": c} for f, c in self_samples.most_common(top)
+            ],
+            "top_total": [
+                {"function": f, "samples": c} for f, c in total_samples.most_common(top)
+            ],
+            "stacks": stacks,
+        }
+
+    def write_report(self, folder_path: str, extra: dict = None) -> str:
+        """Write the run report (and the sampling profile of the slowest
+        stage, if sampled) to a folder.
+
+        Args:
+            folder_path (str): Folder to save the report in, e.g. the batch.
+            extra (dict, optional): More fields for the report, e.g. the
+                arguments of the run. Defaults to None.
+
+        Returns:
+            str: Path of the report.
+        """
+        Path(folder_path).mkdir(parents=True, exist_ok=True)
+        top_level = [s for s in self.stages if s.parent is None]
+        slowest = self.get_slowest_stage()
+        report = {
+            "run": self.run_name,
+            "started_at": self.started_at,
+            "python": platform.python_version(),
+            "pid": os.getpid(),
+            **(extra or {}),
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "process_peak_rss_mb": get_peak_rss_mb(),
+            "staged_seconds": sum(s.wall_seconds for s in top_level),
+            "slowest_stage": None if slowest is None else slowest.name,
+            "stages": [s.to_dict() for s in self.stages],
+        }
+
+        if self.sampler is not None and slowest is not None:
+            profile = self.get_profile(slowest)
+            # Collapsed stacks, readable by flamegraph tools
+            profile_path = os.path.join(
+                folder_path, f"profile_{self.run_name}_{slowest.name}.collapsed"
+            )
+            with open(profile_path, "w") as f:
+                for stack, count in profile.pop("stacks").most_common():
+                    f.write(f"{stack} {count}\n")
+            report["profile"] = {**profile, "path": profile_path}
+
+        report_path = os.path.join(
+            folder_path, RUN_REPORT_FILENAME.format(run_name=self.run_name)
+        )
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        return report_path
+
+
+@contextmanager
+def profile_run(run_name: str, sample_profile: bool = False):
+    """Record the stages run in this context until the block exits. Work
+    submitted to a thread pool is recorded when wrapped with bind_context.
+    Work in other processes is not recorded.
+
+    Args:
+        run_name (str): Name of the run, e.g. "score".
+        sample_profile (bool, optional): Sample the call stack to profile
+            the slowest stage. Defaults to False.
+
+    Yields:
+        ProfiledRun: The run, to write its report with.
+    """
+    run = ProfiledRun(run_name, sample_profile)
+    token = _ACTIVE_RUN.set(run)
+    # Stages of an enclosing run are not parents of this run's stages
+    stage_token = _ACTIVE_STAGE.set(None)
+    run.started_at = datetime.now().isoformat(timespec="seconds")
+    start_cpu = time.process_time()
+    start_time = time.perf_counter()
+    if run.sampler is not None:
+        run.sampler.start()
+    try:
+        yield run
+    finally:
+        if run.sampler is not None:
+            run.sampler.stop()
+        run.wall_seconds = time.perf_counter() - start_time
+        run.cpu_seconds = time.process_time() - start_cpu
+        _ACTIVE_STAGE.reset(stage_token)
+        _ACTIVE_RUN.reset(token)
+
+
+class _NoStage:
+    # Stands in for a stage outside a profiled run
+    rows_in = None
+    rows_out = None
+
+    def record_cache(self, hits: int, lookups: int):
+        pass
+
+
+@contextmanager
+def profile_stage(name: str, rows_in: int = None):
+    """Record a stage of the active run. Does nothing outside a run.
+
+    Args:
+        name (str): Stage name.
+        rows_in (int, optional): Rows going into the stage. Defaults to None.
+
+    Yields:
+        Stage: The stage, to set rows_out or record cache lookups on.
+    """
+    run = _ACTIVE_RUN.get()
+    if run is None:
+        yield _NoStage()
+        return
+    with run.stage(name, rows_in) as stage:
+        yield stage
+
+
+def profiled_stage(func=None, name: str = None):
+    """Decorator recording each call of a function as a stage. Rows in and
+    out are taken from the first frame argument and the returned frame.
+    """
+    if func is None:
+        return functools.partial(profiled_stage, name=name)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _ACTIVE_RUN.get() is None:
+            return func(*args, **kwargs)
+        rows_in = next(
+            (r for r in map(count_rows, [*args, *kwargs.values()]) if r is not None),
+            None,
+        )
+        with profile_stage(name or func.__qualname__, rows_in) as stage:
+            result = func(*args, **kwargs)
+            if stage.rows_out is None:
+                stage.rows_out = count_rows(result)
+            return result
+
+    return wrapper
+
+
+def record_cache_lookup(hits: int, lookups: int):
+    # Count cache hits in the innermost stage of the active run
+    stage = _ACTIVE_STAGE.get()
+    if _ACTIVE_RUN.get() is not None and stage is not None:
+        stage.record_cache(hits, lookups)
+
+
+def bind_context(func):
+    """Run a function in the context it was bound in, e.g. in a thread pool
+    worker, so its stages are recorded in the active run under the stage
+    that submitted it. Each call gets its own copy of the context, so the
+    bound function can run in several threads at once.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+
+    return wrapper
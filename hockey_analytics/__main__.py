@@ -0,0 +1,4 @@
+from hockey_analytics.cli import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+import argparse
+import importlib
+import os
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+PIPELINE_RESULTS_PATH = os.path.join(
+    DIRNAME, "../playoff_performance_model/pipeline_results"
+)
+MODELS_PATH = os.path.join(DIRNAME, "../playoff_performance_model/models")
+TRAINING_DATA_PATH = os.path.join(
+    DIRNAME, "../playoff_performance_model/train_model/training_data"
+)
+MP_DATA_PATH = os.path.join(DIRNAME, "../data/moneypuck")
+
+# Modules each subcommand needs, imported only when the subcommand runs so
+# e.g. analyze never loads the training libraries
+COMMAND_MODULES = {
+    "ingest": ["collect_data.moneypuck_players", "collect_data.moneypuck_shots"],
+    "target": ["playoff_performance_model.train_model.target_variable"],
+    "features": ["playoff_performance_model.train_model.feature_collection"],
+    "train": ["playoff_performance_model.train_model.train_model"],
+    "score": ["playoff_performance_model.pipeline.score"],
+    "analyze": ["playoff_performance_model.analysis.batch_analysis"],
+    "simulate": ["playoff_performance_model.analysis.series_simulator"],
+    "optimize": ["playoff_performance_model.analysis.roster_optimizer"],
+    "comparables": ["playoff_performance_model.analysis.player_comparables"],
+    "pipeline": ["playoff_performance_model.pipeline.orchestrator"],
+    "startup-benchmark": ["hockey_analytics.startup_benchmark"],
+}
+
+
+def import_command_modules(command: str) -> list:
+    return [importlib.import_module(module) for module in COMMAND_MODULES[command]]
+
+
+def get_pipeline_folder_path(action_date: str) -> str:
+    return os.path.join(PIPELINE_RESULTS_PATH, f"batch_{action_date}")
+
+
+def run_ingest(args: argparse.Namespace):
+    moneypuck_players, moneypuck_shots = import_command_modules("ingest")
+    if args.shots:
+        for season in args.seasons or []:
+            moneypuck_shots.read_in_season_shots(season)
+        # Aggregates every downloaded shot file not aggregated yet
+        print(moneypuck_shots.ingest_all_shot_files().to_string(index=False))
+        return
+    if args.seasons is None:
+        moneypuck_players.read_in_all_seasons_players_stats()
+        return
+    for season in args.seasons:
+        for season_type in args.season_types:
+            moneypuck_players.read_in_season_players_stats(season, season_type)
+
+
+def run_target(args: argparse.Namespace):
+    (target_variable,) = import_command_modules("target")
+    target_variable_data = target_variable.create_target_variable_data(
+        start_year=args.start_year,
+        min_games_played=args.min_games_played,
+        situation=args.situation,
+    )
+    target_variable_data.to_csv(os.path.join(TRAINING_DATA_PATH, "target_variable.csv"))
+    print(f"Saved target variable data for {target_variable_data.shape[0]} rows.")
+
+
+def run_features(args: argparse.Namespace):
+    (feature_collection,) = import_command_modules("features")
+    feature_data = feature_collection.collect_training_features()
+    feature_data.to_csv(os.path.join(TRAINING_DATA_PATH, "training_feature_data.csv"))
+    feature_data.to_pickle(
+        os.path.join(TRAINING_DATA_PATH, "training_feature_data.pkl")
+    )
+    print(f"Saved training features for {feature_data.shape[0]} rows.")
+
+
+def run_train(args: argparse.Namespace):
+    (train_model,) = import_command_modules("train")
+    train_model.train_model(args.model_version, plot_importance=args.plot)
+
+    if args.bootstrap_members > 0:
+        from playoff_performance_model.train_model.bootstrap_training import (
+            train_bootstrap_ensemble,
+        )
+
+        train_bootstrap_ensemble(args.model_version, args.bootstrap_members)
+
+
+def run_score(args: argparse.Namespace):
+    (score,) = import_command_modules("score")
+    pipeline_folder_path = get_pipeline_folder_path(args.action_date)
+
+    if not args.skip_batch_data:
+        from playoff_performance_model.pipeline.create_batch_data import (
+            create_batch_data,
+        )
+
+        create_batch_data(
+            pipeline_folder_path,
+            args.action_date,
+            nhl_rosters_flag=args.nhl_rosters,
+            csv_export=args.csv_export,
+        )
+    score.score_players(
+        pipeline_folder_path,
+        model_version=args.model_version,
+        prediction_intervals=args.prediction_intervals,
+        use_cache=not args.no_cache,
+        contributions=args.contributions,
+        csv_export=args.csv_export,
+    )
+
+
+def run_analyze(args: argparse.Namespace):
+    (batch_analysis,) = import_command_modules("analyze")
+    batch_analysis.batch_analysis(get_pipeline_folder_path(args.action_date))
+
+
+def run_simulate(args: argparse.Namespace):
+    (series_simulator,) = import_command_modules("simulate")
+    series_simulator.run_simulation(args)
+
+
+def run_optimize(args: argparse.Namespace):
+    (roster_optimizer,) = import_command_modules("optimize")
+    roster_optimizer.run_optimizer(args)
+
+
+def run_comparables(args: argparse.Namespace):
+    (player_comparables,) = import_command_modules("comparables")
+    player_comparables.run_comparables(args)
+
+
+def run_pipeline(args: argparse.Namespace):
+    (orchestrator,) = import_command_modules("pipeline")
+    results = orchestrator.run_production_pipeline(args)
+    if not args.dry_run:
+        print(results.to_string(index=False))
+        if (results["status"] == "failed").any():
+            raise SystemExit("Pipeline stages failed.")
+
+
+def run_startup_benchmark(args: argparse.Namespace):
+    (startup_benchmark,) = import_command_modules("startup-benchmark")
+    results = startup_benchmark.benchmark_startup(
+        commands=args.commands, repeat=args.repeat, history_path=args.history
+    )
+    print(results.to_string(index=False))
+
+    # Exit with an error when a subcommand starts slower than the budget
+    if args.budget is not None:
+        slow = results.loc[results["import_seconds"] > args.budget, "command"]
+        if len(slow) > 0:
+            raise SystemExit(
+                f"Import time over {args.budget}s budget: {', '.join(slow)}"
+            )
+
+
+def get_report_folder_path(args: argparse.Namespace) -> str:
+    # Run reports are saved next to what the run writes
+    if args.command in ["score", "analyze", "simulate", "optimize", "comparables"]:
+        return get_pipeline_folder_path(args.action_date)
+    if args.command == "train":
+        return os.path.join(MODELS_PATH, args.model_version)
+    if args.command in ["target", "features"]:
+        return TRAINING_DATA_PATH
+    if args.command == "ingest":
+        return MP_DATA_PATH
+    return None
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="hockey_analytics", description="Playoff performance model pipeline."
+    )
+    parser.add_argument(
+        "--no-report", action="store_true", help="Don't save a JSON run report"
+    )
+    parser.add_argument(
+        "--sample-profile",
+        action="store_true",
+        help="Save a sampling profile of the slowest stage with the run report",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="Download MoneyPuck player data")
+    ingest.add_argument(
+        "--seasons", nargs="+", type=int, help="Seasons, defaults to all seasons"
+    )
+    ingest.add_argument(
+        "--season-types",
+        nargs="+",
+        default=["regular", "playoffs"],
+        choices=["regular", "playoffs"],
+    )
+    ingest.add_argument(
+        "--shots",
+        action="store_true",
+        help="Download shot data instead and aggregate it by player game and season",
+    )
+    ingest.set_defaults(func=run_ingest)
+
+    target = subparsers.add_parser("target", help="Create the target variable data")
+    target.add_argument("--start-year", type=int, default=2014)
+    # Healthy for at least one series
+    target.add_argument("--min-games-played", type=int, default=4)
+    target.add_argument("--situation", default="all")
+    target.set_defaults(func=run_target)
+
+    features = subparsers.add_parser(
+        "features", help="Collect the training features of the target data"
+    )
+    features.set_defaults(func=run_features)
+
+    train = subparsers.add_parser("train", help="Train a model version")
+    train.add_argument("--model-version", default="version_2")
+    train.add_argument(
+        "--bootstrap-members",
+        type=int,
+        default=0,
+        help="Also train a bootstrap ensemble for prediction intervals",
+    )
+    train.add_argument(
+        "--no-plot", dest="plot", action="store_false", help="Skip feature importance"
+    )
+    train.set_defaults(func=run_train)
+
+    score = subparsers.add_parser("score", help="Build and score a batch")
+    score.add_argument("--action-date", default="2024-06-29", help="YYYY-MM-DD")
+    score.add_argument("--model-version", default="version_2")
+    score.add_argument("--nhl-rosters", action="store_true")
+    score.add_argument(
+        "--skip-batch-data",
+        action="store_true",
+        help="Score the batch's saved features without rebuilding them",
+    )
+    score.add_argument("--prediction-intervals", action="store_true")
+    score.add_argument("--contributions", action="store_true")
+    score.add_argument("--no-cache", action="store_true")
+    score.add_argument("--csv-export", action="store_true")
+    score.set_defaults(func=run_score)
+
+    analyze = subparsers.add_parser("analyze", help="Rank teams and players")
+    analyze.add_argument("--action-date", default="2024-06-29", help="YYYY-MM-DD")
+    analyze.set_defaults(func=run_analyze)
+
+    simulate = subparsers.add_parser(
+        "simulate", help="Simulate playoff series from a batch's predictions"
+    )
+    simulate.add_argument("--action-date", default="2024-06-29", help="YYYY-MM-DD")
+    simulate.add_argument("--sims", type=int, default=100_000)
+    simulate.add_argument(
+        "--jobs", type=int, default=1, help="Processes to shard the sims across"
+    )
+    simulate.add_argument("--seed", type=int, default=0)
+    simulate.add_argument(
+        "--bracket", nargs="+", help="Teams in bracket order, defaults to the best 16"
+    )
+    simulate.add_argument(
+        "--series", nargs=2, metavar=("HOME", "AWAY"), help="Simulate one series"
+    )
+    simulate.set_defaults(func=run_simulate)
+
+    optimize = subparsers.add_parser(
+        "optimize", help="Best lineup or UFA signings under a cap budget"
+    )
+    optimize.add_argument("--action-date", default="2024-06-29", help="YYYY-MM-DD")
+    optimize.add_argument("--budget", type=float, default=88_000_000)
+    optimize.add_argument("--forwards", type=int, default=12)
+    optimize.add_argument("--defense", type=int, default=6)
+    optimize.add_argument(
+        "--team", help="Best lineup of the team's players under contract and UFAs"
+    )
+    optimize.add_argument("--cap-unit", type=float, default=25_000)
+    optimize.add_argument(
+        "--benchmark",
+        nargs="*",
+        type=int,
+        help="Time the batch and synthetic pools of these sizes instead",
+    )
+    optimize.set_defaults(func=run_optimize)
+
+    comparables = subparsers.add_parser(
+        "comparables", help="Player seasons most similar to a player"
+    )
+    comparables.add_argument("--action-date", default="2024-06-29", help="YYYY-MM-DD")
+    player = comparables.add_mutually_exclusive_group()
+    player.add_argument("--player-id", type=int)
+    player.add_argument("--name", help="Player name, e.g. 'Connor McDavid'")
+    comparables.add_argument(
+        "--season", type=int, help="Season of the player, defaults to the batch's"
+    )
+    comparables.add_argument("--k", type=int, default=10)
+    comparables.add_argument("--model-version", default="version_2")
+    comparables.add_argument(
+        "--top-features",
+        type=int,
+        help="Only compare the features contributing most (needs contributions)",
+    )
+    comparables.add_argument("--rebuild", action="store_true")
+    comparables.add_argument(
+        "--benchmark",
+        nargs="*",
+        type=int,
+        help="Time synthetic indexes of these numbers of rows instead",
+    )
+    comparables.set_defaults(func=run_comparables)
+
+    pipeline = subparsers.add_parser(
+        "pipeline", help="Run the out of date stages of the production flow"
+    )
+    pipeline.add_argument("--action-date", default="2024-06-29", help="YYYY-MM-DD")
+    pipeline.add_argument("--model-version", default="version_2")
+    pipeline.add_argument("--nhl-rosters", action="store_true")
+    pipeline.add_argument(
+        "--train", action="store_true", help="Also rebuild the model when stale"
+    )
+    pipeline.add_argument("--max-workers", type=int, default=None)
+    pipeline.add_argument("--force", action="store_true", help="Run every stage")
+    pipeline.add_argument(
+        "--dry-run", action="store_true", help="Print the plan without running"
+    )
+    pipeline.set_defaults(func=run_pipeline)
+
+    startup_benchmark = subparsers.add_parser(
+        "startup-benchmark", help="Measure the import time of each subcommand"
+    )
+    startup_benchmark.add_argument(
+        "--commands", nargs="+", help="Subcommands, defaults to all"
+    )
+    startup_benchmark.add_argument("--repeat", type=int, default=3)
+    startup_benchmark.add_argument(
+        "--history", help="CSV to append the results to, to track them over time"
+    )
+    startup_benchmark.add_argument(
+        "--budget", type=float, help="Fail when an import takes longer (seconds)"
+    )
+    startup_benchmark.set_defaults(func=run_startup_benchmark)
+
+    return parser
+
+
+def main(argv: list = None):
+    args = get_parser().parse_args(argv)
+    report_folder_path = get_report_folder_path(args)
+    if args.no_report or report_folder_path is None:
+        args.func(args)
+        return
+
+    from common_functions.profiling import profile_run
+
+    # The report is written for failed runs too, with the failing stage, once
+    # the run has its timings. There is no report if the run fails to start.
+    run = None
+    try:
+        with profile_run(args.command, sample_profile=args.sample_profile) as run:
+            args.func(args)
+    finally:
+        if run is not None:
+            report_path = run.write_report(
+                report_folder_path,
+                extra={"args": {k: v for k, v in vars(args).items() if k != "func"}},
+            )
+            print(f"Run report: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from hockey_analytics.cli import COMMAND_MODULES
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+REPO_PATH = os.path.join(DIRNAME, "..")
+
+# Name of the bare CLI import, the cost of every subcommand and of --help
+CLI_BASELINE = "(cli)"
+
+
+def parse_importtime(stderr: str) -> pd.DataFrame:
+    """Parse the output of python -X importtime.
+
+    Returns:
+        pd.DataFrame: Self and cumulative seconds of every imported module,
+            with its nesting depth (0 for modules imported by the command).
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        rows.append(
+            {
+                "module": name.strip(),
+                "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                "self_seconds": int(self_us) / 1e6,
+                "cumulative_seconds": int(cumulative_us) / 1e6,
+            }
+        )
+    return pd.DataFrame(
+        rows, columns=["module", "depth", "self_seconds", "cumulative_seconds"]
+    )
+
+
+def measure_command_startup(command: str) -> dict:
+    """Import the modules of a subcommand in a fresh interpreter.
+
+    Args:
+        command (str): Subcommand, or CLI_BASELINE for the CLI alone.
+
+    Returns:
+        dict: Process wall time, total import time, modules imported, the
+            heaviest packages and the error of a failed import.
+    """
+    code = "import hockey_analytics.cli"
+    if command != CLI_BASELINE:
+        code += f"; hockey_analytics.cli.import_command_modules({command!r})"
+
+    start_time = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_PATH,
+        capture_output=True,
+        text=True,
+    )
+    wall_seconds = time.perf_counter() - start_time
+
+    imports = parse_importtime(result.stderr)
+    # Packages (not their submodules) wherever they are first imported
+    packages = imports.loc[~imports["module"].str.contains(".", regex=False)]
+    packages = packages.nlargest(3, "cumulative_seconds")
+    error = None
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1]
+    return {
+        "command": command,
+        "wall_seconds": wall_seconds,
+        "import_seconds": imports["self_seconds"].sum(),
+        "modules": imports.shape[0],
+        "heaviest_imports": ", ".join(
+            f"{m} {s:.3f}s"
+            for m, s in zip(packages["module"], packages["cumulative_seconds"])
+        ),
+        "error": error,
+    }
+
+
+def benchmark_startup(
+    commands: list = None, repeat: int = 3, history_path: str = None
+) -> pd.DataFrame:
+    """Median startup cost of each subcommand over fresh interpreters.
+
+    Args:
+        commands (list, optional): Subcommands. Defaults to all of them.
+        repeat (int, optional): Runs per subcommand. Defaults to 3.
+        history_path (str, optional): CSV to append the results to. Defaults
+            to not saving them.
+
+    Returns:
+        pd.DataFrame: Startup cost per subcommand, the bare CLI first.
+    """
+    if commands is None:
+        commands = list(COMMAND_MODULES)
+
+    results = []
+    for command in [CLI_BASELINE, *commands]:
+        runs = [measure_command_startup(command) for _ in range(repeat)]
+        results.append(
+            {
+                **runs[-1],
+                "wall_seconds": statistics.median(r["wall_seconds"] for r in runs),
+                "import_seconds": statistics.median(r["import_seconds"] for r in runs),
+            }
+        )
+    results = pd.DataFrame(results)
+
+    if history_path is not None:
+        history = results.copy()
+        history.insert(0, "run_at", datetime.now().isoformat(timespec="seconds"))
+        history.insert(1, "python", sys.version.split()[0])
+        history.to_csv(
+            history_path,
+            mode="a",
+            header=not os.path.exists(history_path),
+            index=False,
+        )
+    return results
+
+
+if __name__ == "__main__":
+    print(benchmark_startup().to_string(index=False))
@@ -0,0 +1,58 @@
+import pandas as pd
+
+from collect_data.read_local_data import read_mp_bio_data
+from common_functions.profiling import profiled_stage
+from playoff_performance_model.analysis.contract_crosswalk import add_contract_data
+from playoff_performance_model.pipeline.batch_artifacts import read_batch_frame
+
+
+@profiled_stage
+def add_player_bio_data(scored_data: pd.DataFrame) -> pd.DataFrame:
+    # Name and position of every player from one read of the bio data
+    bio_data = (
+        read_mp_bio_data().drop_duplicates(subset=["playerId"]).set_index("playerId")
+    )
+    scored_data["name"] = scored_data["playerId"].map(bio_data["name"]).fillna("")
+    scored_data["position"] = scored_data["playerId"].map(bio_data["position"])
+    return scored_data
+
+
+@profiled_stage
+def get_batch_analysis_data(pipeline_folder_path: str) -> pd.DataFrame:
+    """Scored players of a batch with their name, position, team and
+    contract data, as used by the batch analysis.
+
+    Args:
+        pipeline_folder_path (str): Batch folder.
+
+    Returns:
+        pd.DataFrame: Scored data with player and contract columns and the
+            predicted game score per dollar of cap hit.
+    """
+    # Read in scored data
+    scored_data = read_batch_frame(pipeline_folder_path, "scored_data")
+
+    # Add player name and position
+    scored_data = add_player_bio_data(scored_data)
+    # If no MoneyPuck match to player name, then remove the row from analysis
+    scored_data = scored_data[~scored_data["name"].isin(["", None])]
+
+    # Add team name from batch data
+    batch_data = read_batch_frame(
+        pipeline_folder_path, "batch_data", columns=["playerId", "team"]
+    )
+    scored_data = pd.merge(
+        scored_data,
+        batch_data.loc[:, ["playerId", "team"]],
+        on="playerId",
+        how="left",
+    )
+
+    # Add contract data (slary, ufa status, etc.)
+    scored_data = add_contract_data(scored_data)
+
+    # Add game score per dollar of cap hit
+    scored_data["pred_gs_toi_cap_hit"] = (
+        scored_data["prediction"].values / scored_data["current_cap_hit"].values
+    )
+    return scored_data
@@ -0,0 +1,248 @@
+import argparse
+import os
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from playoff_performance_model.pipeline.batch_artifacts import (
+    read_batch_frame,
+    save_batch_frame,
+)
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+PIPELINE_RESULTS_PATH = os.path.join(DIRNAME, "../pipeline_results")
+
+IDENTIFIER_COLS = ["playerId", "action_season", "action_date"]
+
+
+class KeyedBatch:
+    """Scored data of a batch as column arrays sorted by playerId."""
+
+    def __init__(self, pipeline_folder_path: str, features: bool = True):
+        self.name = os.path.basename(os.path.normpath(pipeline_folder_path))
+        # Without features only the key and prediction columns are read
+        columns = None if features else ["playerId", "prediction"]
+        data = read_batch_frame(pipeline_folder_path, "scored_data", columns=columns)
+        data = data.drop_duplicates(subset=["playerId"])
+
+        order = np.argsort(data["playerId"].to_numpy(), kind="stable")
+        self.keys = data["playerId"].to_numpy(dtype=np.int64)[order]
+        self.prediction = data["prediction"].to_numpy(dtype=float)[order]
+        self.feature_names = [
+            c for c in data.columns if c not in [*IDENTIFIER_COLS, "prediction"]
+        ]
+        self.features = data.loc[:, self.feature_names].to_numpy(dtype=float)[order]
+
+
+def merge_sorted_keys(keys_1: np.ndarray, keys_2: np.ndarray) -> tuple:
+    """Merge two sorted unique key arrays.
+
+    Returns:
+        tuple: Positions of the common keys in each array, and masks of the
+            keys only in the first and only in the second array.
+    """
+    positions = np.minimum(np.searchsorted(keys_2, keys_1), max(len(keys_2) - 1, 0))
+    in_2 = (
+        keys_2[positions] == keys_1
+        if len(keys_2) > 0
+        else np.zeros(len(keys_1), dtype=bool)
+    )
+    in_1 = np.zeros(len(keys_2), dtype=bool)
+    in_1[positions[in_2]] = True
+    return np.flatnonzero(in_2), positions[in_2], ~in_2, ~in_1
+
+
+def diff_keyed_batches(
+    batch_1: KeyedBatch, batch_2: KeyedBatch, top_features: int = 3
+) -> dict:
+    """Diff two batches on playerId.
+
+    Args:
+        batch_1 (KeyedBatch): Earlier batch.
+        batch_2 (KeyedBatch): Later batch.
+        top_features (int, optional): Largest feature changes listed per
+            player. Defaults to 3.
+
+    Returns:
+        dict: Prediction changes of common players ("changes"), new and
+            removed players ("new", "removed") and the change of every
+            feature in both batches ("features").
+    """
+    rows_1, rows_2, removed, new = merge_sorted_keys(batch_1.keys, batch_2.keys)
+
+    changes = pd.DataFrame(
+        {
+            "playerId": batch_1.keys[rows_1],
+            "prediction_1": batch_1.prediction[rows_1],
+            "prediction_2": batch_2.prediction[rows_2],
+        }
+    )
+    changes["prediction_change"] = changes["prediction_2"] - changes["prediction_1"]
+
+    # Features in both batches, changes scaled by the feature's spread so
+    # they compare across features
+    feature_names = [f for f in batch_1.feature_names if f in batch_2.feature_names]
+    feature_summary = pd.DataFrame(
+        columns=["feature", "players_changed", "mean_abs_change", "mean_change"]
+    )
+    if len(feature_names) > 0:
+        features_1 = batch_1.features[
+            :, [batch_1.feature_names.index(f) for f in feature_names]
+        ][rows_1]
+        features_2 = batch_2.features[
+            :, [batch_2.feature_names.index(f) for f in feature_names]
+        ][rows_2]
+        feature_changes = features_2 - features_1
+        # A value appearing or disappearing is a change too
+        changed = ~np.isclose(features_1, features_2, equal_nan=True)
+
+        spread = np.nanstd(np.vstack([features_1, features_2]), axis=0)
+        spread[~(spread > 0)] = 1
+        scaled = np.where(changed, np.abs(np.nan_to_num(feature_changes) / spread), 0)
+
+        changes["features_changed"] = changed.sum(axis=1)
+        k = min(top_features, len(feature_names))
+        top = np.argsort(-scaled, axis=1)[:, :k]
+        changes["top_feature_changes"] = [
+            ", ".join(
+                f"{feature_names[j]} {features_1[i, j]:.3g} -> {features_2[i, j]:.3g}"
+                for j in top[i]
+                if changed[i, j]
+            )
+            for i in range(len(top))
+        ]
+
+        with warnings.catch_warnings():
+            # Features missing for every common player have no mean change
+            warnings.simplefilter("ignore", RuntimeWarning)
+            feature_summary = pd.DataFrame(
+                {
+                    "feature": feature_names,
+                    "players_changed": changed.sum(axis=0),
+                    "mean_abs_change": np.nanmean(np.abs(feature_changes), axis=0),
+                    "mean_change": np.nanmean(feature_changes, axis=0),
+                }
+            )
+
+    changes = changes.iloc[
+        np.argsort(-np.abs(changes["prediction_change"].to_numpy()), kind="stable")
+    ].reset_index(drop=True)
+
+    return {
+        "changes": changes,
+        "new": pd.DataFrame(
+            {"playerId": batch_2.keys[new], "prediction": batch_2.prediction[new]}
+        ),
+        "removed": pd.DataFrame(
+            {
+                "playerId": batch_1.keys[removed],
+                "prediction": batch_1.prediction[removed],
+            }
+        ),
+        "features": feature_summary.sort_values(
+            by=["players_changed"], ascending=False
+        ).reset_index(drop=True),
+    }
+
+
+def diff_batches(
+    pipeline_folder_paths: list,
+    features: bool = True,
+    top_features: int = 3,
+    output_folder_path: str = None,
+) -> pd.DataFrame:
+    """Diff each batch with the one before it. Every batch is read once.
+
+    Args:
+        pipeline_folder_paths (list): Batch folders in order.
+        features (bool, optional): Diff features too. Defaults to True.
+        top_features (int, optional): Largest feature changes listed per
+            player. Defaults to 3.
+        output_folder_path (str, optional): Folder to save each diff's
+            tables in. Defaults to not saving.
+
+    Returns:
+        pd.DataFrame: Summary of every consecutive diff.
+    """
+    summaries = []
+    previous = None
+    for pipeline_folder_path in pipeline_folder_paths:
+        batch = KeyedBatch(pipeline_folder_path, features=features)
+        if previous is not None:
+            diff = diff_keyed_batches(previous, batch, top_features=top_features)
+            changes = diff["changes"]
+            summaries.append(
+                {
+                    "batch_1": previous.name,
+                    "batch_2": batch.name,
+                    "common_players": changes.shape[0],
+                    "new_players": diff["new"].shape[0],
+                    "removed_players": diff["removed"].shape[0],
+                    "mean_prediction_change": changes["prediction_change"].mean(),
+                    "mean_abs_prediction_change": changes["prediction_change"]
+                    .abs()
+                    .mean(),
+                    "largest_mover": (
+                        changes.loc[0, "playerId"] if changes.shape[0] > 0 else None
+                    ),
+                }
+            )
+
+            if output_folder_path is not None:
+                diff_folder_path = os.path.join(
+                    output_folder_path, f"{previous.name}__{batch.name}"
+                )
+                Path(diff_folder_path).mkdir(parents=True, exist_ok=True)
+                for name, table in diff.items():
+                    save_batch_frame(table, diff_folder_path, name, csv_export=True)
+        previous = batch
+
+    return pd.DataFrame(summaries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Diff scored batches on playerId.")
+    parser.add_argument(
+        "batches",
+        nargs="*",
+        default=["batch_2023-06-28", "batch_2024-06-29"],
+        help="Batch folder names in order, each diffed with the one before it",
+    )
+    parser.add_argument("--all", action="store_true", help="Diff every batch")
+    parser.add_argument("--no-features", action="store_true")
+    parser.add_argument("--top", type=int, default=10, help="Movers to print")
+    parser.add_argument("--output-folder", help="Folder to save the diff tables")
+    args = parser.parse_args()
+
+    batches = args.batches
+    if args.all:
+        batches = sorted(
+            f for f in os.listdir(PIPELINE_RESULTS_PATH) if f.startswith("batch_")
+        )
+    pipeline_folder_paths = [os.path.join(PIPELINE_RESULTS_PATH, b) for b in batches]
+
+    if len(pipeline_folder_paths) == 2:
+        diff = diff_keyed_batches(
+            KeyedBatch(pipeline_folder_paths[0], features=not args.no_features),
+            KeyedBatch(pipeline_folder_paths[1], features=not args.no_features),
+        )
+        print(f"\nLargest prediction changes {batches[0]} -> {batches[1]}:")
+        print(diff["changes"].head(args.top).to_string())
+        print(f"\nNew players: {diff['new'].shape[0]}")
+        print(f"Removed players: {diff['removed'].shape[0]}")
+        print("\nMost changed features:")
+        print(diff["features"].head(args.top).to_string())
+
+    # Summary of every consecutive pair, saving the tables if asked
+    if len(pipeline_folder_paths) > 2 or args.output_folder is not None:
+        print(
+            diff_batches(
+                pipeline_folder_paths,
+                features=not args.no_features,
+                output_folder_path=args.output_folder,
+            ).to_string()
+        )
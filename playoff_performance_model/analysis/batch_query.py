@@ -0,0 +1,202 @@
+import argparse
+import os
+import shlex
+import sys
+
+import numpy as np
+import pandas as pd
+
+from playoff_performance_model.analysis.analysis_data import get_batch_analysis_data
+from playoff_performance_model.analysis.contract_crosswalk import get_source_hash
+from playoff_performance_model.pipeline.batch_artifacts import get_batch_frame_path
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+PIPELINE_RESULTS_PATH = os.path.join(DIRNAME, "../pipeline_results")
+
+# Columns with a value to rows index, matched case insensitively
+INDEXED_COLS = ["team", "position", "expiry_status", "expiry_year"]
+DEFAULT_COLS = ["playerId", "name", "team", "prediction", "pred_gs_toi_cap_hit"]
+
+# Loaded tables by batch folder, scored data mtime and contract data hash
+_TABLES = {}
+
+
+def build_index(values: pd.Series) -> dict:
+    # Sorted row positions of every value
+    keys = values.astype(str).str.lower().where(values.notna())
+    return {k: np.asarray(rows) for k, rows in keys.groupby(keys).indices.items()}
+
+
+class ScoredBatchTable:
+    """Scored batch analysis data held in memory with indexes on team,
+    position, expiry status and expiry year. Filters are index lookups and
+    rankings select the top rows without sorting the whole table.
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self.data = data.reset_index(drop=True)
+        self.indexes = {col: build_index(self.data[col]) for col in INDEXED_COLS}
+
+        # UFA statuses, e.g. "UFA", "UFA no QO", "UFA-Group6"
+        self.ufa_rows = np.flatnonzero(
+            self.data["expiry_status"].str.lower().str.contains("ufa", na=False)
+        )
+        self.ufa_year = self.data["ufa_year"].to_numpy(dtype=float)
+
+    @classmethod
+    def from_batch(cls, pipeline_folder_path: str):
+        return cls(get_batch_analysis_data(pipeline_folder_path))
+
+    def select_rows(
+        self,
+        team=None,
+        position=None,
+        expiry_status=None,
+        expiry_year=None,
+        ufa: bool = False,
+        max_ufa_year: int = None,
+    ) -> np.ndarray:
+        """Rows matching every given filter. Filters take a value or a list
+        of values.
+
+        Returns:
+            np.ndarray: Sorted row positions.
+        """
+        filters = {
+            "team": team,
+            "position": position,
+            "expiry_status": expiry_status,
+            "expiry_year": expiry_year,
+        }
+        rows = np.arange(self.data.shape[0])
+        for col, values in filters.items():
+            if values is None:
+                continue
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            index = self.indexes[col]
+            matches = [
+                index.get(str(v).lower(), np.array([], dtype=int)) for v in values
+            ]
+            # Values can repeat once lowercased, e.g. "TOR" and "tor"
+            matched_rows = np.unique(np.concatenate(matches))
+            rows = np.intersect1d(rows, matched_rows, assume_unique=True)
+
+        if ufa:
+            rows = np.intersect1d(rows, self.ufa_rows, assume_unique=True)
+        if max_ufa_year is not None:
+            rows = rows[self.ufa_year[rows] <= max_ufa_year]
+        return rows
+
+    def query(
+        self,
+        sort_by: str = "prediction",
+        k: int = 10,
+        ascending: bool = False,
+        columns: list = DEFAULT_COLS,
+        **filters,
+    ) -> pd.DataFrame:
+        """Top k players by a column among the rows matching the filters.
+        Players missing the column are left out.
+
+        Args:
+            sort_by (str, optional): Column to rank by. Defaults to "prediction".
+            k (int, optional): Players to return. Defaults to 10.
+            ascending (bool, optional): Lowest first. Defaults to False.
+            columns (list, optional): Columns to return. Defaults to DEFAULT_COLS.
+            **filters: Filters of select_rows.
+
+        Returns:
+            pd.DataFrame: Ranked players.
+        """
+        rows = self.select_rows(**filters)
+        values = self.data[sort_by].to_numpy(dtype=float)[rows]
+        present = ~np.isnan(values)
+        rows, values = rows[present], values[present]
+
+        # Partition out the top k, then only sort those
+        keys = values if ascending else -values
+        k = min(k, len(rows))
+        if k < len(rows):
+            top = np.argpartition(keys, k - 1)[:k]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(keys[top], kind="stable")]
+        return self.data.loc[rows[top], columns]
+
+
+def get_scored_batch_table(pipeline_folder_path: str) -> ScoredBatchTable:
+    # Reuse the loaded table until the batch is rescored or contracts change
+    key = (
+        os.path.realpath(pipeline_folder_path),
+        os.path.getmtime(get_batch_frame_path(pipeline_folder_path, "scored_data")),
+        get_source_hash(),
+    )
+    if key not in _TABLES:
+        _TABLES[key] = ScoredBatchTable.from_batch(pipeline_folder_path)
+    return _TABLES[key]
+
+
+def get_query_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Rank players of a scored batch.", exit_on_error=False
+    )
+    parser.add_argument("--batch", help="Batch folder name, e.g. batch_2024-06-29")
+    parser.add_argument("--sort-by", default="prediction")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ascending", action="store_true")
+    parser.add_argument("--columns", nargs="+", default=DEFAULT_COLS)
+    parser.add_argument("--team", nargs="+")
+    parser.add_argument("--position", nargs="+")
+    parser.add_argument("--expiry-status", nargs="+")
+    parser.add_argument("--expiry-year", nargs="+")
+    parser.add_argument("--ufa", action="store_true", help="Only UFA statuses")
+    parser.add_argument("--max-ufa-year", type=int)
+    parser.add_argument(
+        "--interactive",
+        action="store_true",
+        help="Read further queries (same options) from stdin",
+    )
+    return parser
+
+
+def run_query(args: argparse.Namespace) -> pd.DataFrame:
+    table = get_scored_batch_table(os.path.join(PIPELINE_RESULTS_PATH, args.batch))
+    return table.query(
+        sort_by=args.sort_by,
+        k=args.k,
+        ascending=args.ascending,
+        columns=args.columns,
+        team=args.team,
+        position=args.position,
+        expiry_status=args.expiry_status,
+        expiry_year=args.expiry_year,
+        ufa=args.ufa,
+        max_ufa_year=args.max_ufa_year,
+    )
+
+
+if __name__ == "__main__":
+    parser = get_query_parser()
+    args = parser.parse_args()
+    if args.batch is None:
+        args.batch = "batch_2024-06-29"
+    print(run_query(args).to_string())
+
+    # Later queries default to the first query's batch and reuse its table
+    if args.interactive:
+        batch = args.batch
+        for line in sys.stdin:
+            if line.strip() in ["", "exit", "quit"]:
+                break
+            try:
+                query_args = parser.parse_args(shlex.split(line))
+                query_args.batch = query_args.batch or batch
+                print(run_query(query_args).to_string())
+            except SystemExit:
+                # argparse has already printed the usage error
+                continue
+            except (argparse.ArgumentError, KeyError) as e:
+                print(f"Invalid query: {e}")
@@ -0,0 +1,214 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from collect_data.read_local_data import read_in_salary_data_puckpedia
+from common_functions.profiling import profiled_stage, record_cache_lookup
+from playoff_performance_model.analysis.name_matching import NameMatcher
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+DATA_PATH = os.path.join(DIRNAME, "../../data")
+SALARY_DATA_PATH = os.path.join(DATA_PATH, "nhl_salaries_2024-2025.csv")
+# Built from the salary data, rebuilt when it or the overrides change
+CROSSWALK_PATH = os.path.join(DATA_PATH, "contract_crosswalk.csv")
+# Hand checked contracts of players the name match can't tell apart, e.g.
+# the two Sebastian Ahos. A blank player means the player has no contract,
+# e.g. Nikita Nesterov, whose name matches Nikita Nesterenko's contract.
+OVERRIDES_PATH = os.path.join(DATA_PATH, "contract_crosswalk_overrides.csv")
+
+CROSSWALK_COLS = [
+    "playerId",
+    "name",
+    "contract_row",
+    "contract_player",
+    "score",
+    "source",
+    "source_hash",
+]
+
+
+def get_contract_data() -> pd.DataFrame:
+    contract_data = read_in_salary_data_puckpedia()
+
+    # modify name format
+    contract_data["name"] = contract_data["player"].apply(
+        lambda x: x.split(",")[1].strip() + " " + x.split(",")[0].strip()
+    )
+    contract_data["contract_row"] = contract_data.index
+    return contract_data
+
+
+def read_overrides() -> pd.DataFrame:
+    if not os.path.exists(OVERRIDES_PATH):
+        return pd.DataFrame(columns=["playerId", "player", "current_cap_hit"])
+    return pd.read_csv(OVERRIDES_PATH, dtype={"playerId": int})
+
+
+def get_source_hash() -> str:
+    # Contract rows are positions in the salary data, so any change to it or
+    # to the overrides invalidates the crosswalk
+    source_hash = hashlib.sha256()
+    for path in [SALARY_DATA_PATH, OVERRIDES_PATH]:
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                source_hash.update(f.read())
+    return source_hash.hexdigest()
+
+
+def read_contract_crosswalk(source_hash: str = None) -> pd.DataFrame:
+    """Read the saved crosswalk. Missing or stale crosswalks are empty.
+
+    Args:
+        source_hash (str, optional): Hash of the current salary data and
+            overrides. Defaults to the hash of the files on disk.
+
+    Returns:
+        pd.DataFrame: Contract row, match score and source of every player
+            matched so far.
+    """
+    if source_hash is None:
+        source_hash = get_source_hash()
+    if os.path.exists(CROSSWALK_PATH):
+        crosswalk = pd.read_csv(CROSSWALK_PATH, dtype={"contract_row": "Int64"})
+        if (crosswalk["source_hash"] == source_hash).all():
+            return crosswalk
+    return pd.DataFrame(
+        {
+            c: pd.Series(dtype="Int64" if c == "contract_row" else None)
+            for c in CROSSWALK_COLS
+        }
+    )
+
+
+@profiled_stage
+def match_contracts(
+    players: pd.DataFrame, contract_data: pd.DataFrame, threshold: int = 80
+) -> pd.DataFrame:
+    """Crosswalk rows of players by overrides, then by name.
+
+    Args:
+        players (pd.DataFrame): playerId and name of the players to match.
+        contract_data (pd.DataFrame): Salary data from get_contract_data.
+        threshold (int, optional): Minimum name match score. Defaults to 80.
+
+    Returns:
+        pd.DataFrame: Crosswalk rows of the players. Names matching a name
+            shared by several contracts are ambiguous and left without a
+            contract unless overridden.
+    """
+    matches = NameMatcher(contract_data["name"].tolist()).match(
+        players["name"].tolist(), threshold=threshold
+    )
+    crosswalk = players.loc[:, ["playerId", "name"]].reset_index(drop=True)
+    crosswalk["score"] = matches["score"].values
+    crosswalk["contract_player"] = None
+    crosswalk["contract_row"] = pd.Series(pd.NA, index=crosswalk.index, dtype="Int64")
+
+    # Name matches are only kept when the contract name is unique
+    name_rows = contract_data.groupby("name")["contract_row"].agg(list)
+    matched_rows = matches["match"].map(name_rows)
+    unique = matched_rows.map(lambda rows: isinstance(rows, list) and len(rows) == 1)
+    crosswalk["source"] = np.where(
+        unique,
+        "name",
+        np.where(matches["match"] != "", "ambiguous", "unmatched"),
+    )
+    crosswalk.loc[unique, "contract_row"] = [rows[0] for rows in matched_rows[unique]]
+
+    # Manual overrides replace the name match
+    overrides = read_overrides().merge(
+        contract_data.loc[:, ["player", "current_cap_hit", "contract_row"]],
+        on=["player", "current_cap_hit"],
+        how="left",
+    )
+    overrides = overrides.set_index("playerId")
+    overridden = crosswalk["playerId"].isin(overrides.index)
+    crosswalk.loc[overridden, "contract_row"] = (
+        overrides.loc[crosswalk.loc[overridden, "playerId"], "contract_row"]
+        .astype("Int64")
+        .values
+    )
+    crosswalk.loc[overridden, "source"] = "override"
+    crosswalk.loc[overridden, "score"] = np.nan
+
+    has_contract = crosswalk["contract_row"].notna()
+    crosswalk.loc[has_contract, "contract_player"] = contract_data.loc[
+        crosswalk.loc[has_contract, "contract_row"].astype(int), "player"
+    ].values
+    return crosswalk
+
+
+def update_contract_crosswalk(
+    players: pd.DataFrame, contract_data: pd.DataFrame = None
+) -> pd.DataFrame:
+    """Add players not yet in the saved crosswalk and save it. Only the new
+    players are name matched.
+
+    Args:
+        players (pd.DataFrame): playerId and name of the players to link.
+        contract_data (pd.DataFrame, optional): Salary data from
+            get_contract_data. Defaults to reading it.
+
+    Returns:
+        pd.DataFrame: The updated crosswalk.
+    """
+    source_hash = get_source_hash()
+    crosswalk = read_contract_crosswalk(source_hash)
+
+    players = players.drop_duplicates(subset=["playerId"])
+    new_players = players.loc[~players["playerId"].isin(crosswalk["playerId"])]
+    # Players already in the crosswalk are hits
+    record_cache_lookup(players.shape[0] - new_players.shape[0], players.shape[0])
+    if new_players.shape[0] > 0:
+        if contract_data is None:
+            contract_data = get_contract_data()
+        new_rows = match_contracts(new_players, contract_data)
+        new_rows["source_hash"] = source_hash
+
+        crosswalk = pd.concat(
+            [crosswalk, new_rows.loc[:, CROSSWALK_COLS]]
+            if crosswalk.shape[0] > 0
+            else [new_rows.loc[:, CROSSWALK_COLS]]
+        ).reset_index(drop=True)
+        crosswalk.to_csv(CROSSWALK_PATH, index=False)
+    return crosswalk
+
+
+@profiled_stage
+def add_contract_data(scored_data) -> pd.DataFrame:
+    # read in salary data
+    contract_data = get_contract_data()
+
+    # Contract row of each player from the crosswalk, only players new to the
+    # crosswalk are matched by name. Duplicate names (Sebastian Aho, Elias
+    # Pettersson) are set in the crosswalk overrides.
+    crosswalk = update_contract_crosswalk(
+        scored_data.loc[:, ["playerId", "name"]], contract_data
+    )
+
+    # Select contract row and cap hit column
+    contract_data = contract_data.loc[
+        :,
+        ["contract_row", "current_cap_hit", "ufa_year", "expiry_status", "expiry_year"],
+    ]
+
+    # Merge salary with data
+    scored_data = pd.merge(
+        scored_data,
+        crosswalk.loc[:, ["playerId", "contract_row"]],
+        on="playerId",
+        how="left",
+    )
+    scored_data = pd.merge(scored_data, contract_data, on="contract_row", how="left")
+    scored_data = scored_data.drop(columns=["contract_row"])
+
+    # Turn salary into a number
+    scored_data["current_cap_hit"] = scored_data["current_cap_hit"].apply(
+        lambda x: float(str(x).replace("$", "").replace(",", ""))
+    )
+
+    return scored_data
@@ -0,0 +1,184 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Names are compared as bit masks of their characters, one 64 bit word each
+MAX_WORD_NAME_LENGTH = 64
+
+
+def normalize_name(name: str) -> str:
+    # Same normalization as fuzzywuzzy's default processor: non letters and
+    # numbers to spaces, lower case and stripped
+    return re.sub(r"(?ui)\W", " ", str(name)).lower().strip()
+
+
+def lcs_length(name_1: str, name_2: str) -> int:
+    # Longest common subsequence for names too long for a 64 bit word
+    previous = [0] * (len(name_2) + 1)
+    for c_1 in name_1:
+        current = [0]
+        for j, c_2 in enumerate(name_2):
+            current.append(
+                previous[j] + 1 if c_1 == c_2 else max(previous[j + 1], current[j])
+            )
+        previous = current
+    return previous[-1]
+
+
+class NameMatcher:
+    """Best fuzzy match of names against a fixed list of choices. Scores are
+    fuzz.ratio scores (100 * 2 * common subsequence / total length, rounded)
+    of the normalized names.
+
+    Choices are indexed by their character counts. A pair can only share as
+    many characters as the smaller of each character's counts, so that bound
+    blocks out every pair that cannot reach the threshold before any pair is
+    scored. The remaining pairs are scored together with a bit parallel
+    common subsequence over all pairs at once.
+    """
+
+    def __init__(self, choices: list):
+        self.choices = list(choices)
+        self.normalized_choices = [normalize_name(c) for c in self.choices]
+
+        # Character codes of every normalized choice
+        self.alphabet = {
+            c: i for i, c in enumerate(sorted(set("".join(self.normalized_choices))))
+        }
+        self.choice_lengths = np.array([len(c) for c in self.normalized_choices])
+        self.choice_codes = self.encode(self.normalized_choices)
+        self.choice_counts = self.count_characters(self.choice_codes)
+
+    @property
+    def padding_code(self) -> int:
+        # Padding and characters of names not in any choice
+        return len(self.alphabet)
+
+    def encode(self, names: list) -> np.ndarray:
+        max_length = max([len(n) for n in names], default=0)
+        codes = np.full((len(names), max_length), self.padding_code, dtype=np.int64)
+        for i, name in enumerate(names):
+            codes[i, : len(name)] = [
+                self.alphabet.get(c, self.padding_code) for c in name
+            ]
+        return codes
+
+    def count_characters(self, codes: np.ndarray) -> np.ndarray:
+        counts = np.zeros((codes.shape[0], self.padding_code + 1), dtype=np.int16)
+        rows = np.repeat(np.arange(codes.shape[0]), codes.shape[1])
+        np.add.at(counts, (rows, codes.ravel()), 1)
+        # Characters not in any choice can never be shared
+        return counts[:, : self.padding_code]
+
+    def get_candidate_pairs(
+        self, name_codes: np.ndarray, name_lengths: np.ndarray, threshold: int
+    ) -> tuple:
+        name_counts = self.count_characters(name_codes)
+        total_lengths = name_lengths[:, None] + self.choice_lengths[None, :]
+
+        # Pairs whose shared character bound could round up to the threshold
+        max_shared = np.zeros(total_lengths.shape, dtype=np.int16)
+        for code in range(self.padding_code):
+            max_shared += np.minimum(
+                name_counts[:, code, None], self.choice_counts[None, :, code]
+            )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            max_score = np.where(
+                total_lengths > 0, 200 * max_shared / total_lengths, 100
+            )
+        return np.nonzero(max_score >= threshold - 0.5)
+
+    def score_pairs(
+        self,
+        name_codes: np.ndarray,
+        name_lengths: np.ndarray,
+        name_idx: np.ndarray,
+        choice_idx: np.ndarray,
+    ) -> np.ndarray:
+        # Match masks: bit i is set where the name's character i is the code
+        match_masks = np.zeros(
+            (name_codes.shape[0], self.padding_code + 1), dtype=np.uint64
+        )
+        rows, positions = np.nonzero(
+            (name_codes < self.padding_code)
+            & (np.arange(name_codes.shape[1]) < MAX_WORD_NAME_LENGTH)
+        )
+        np.bitwise_or.at(
+            match_masks,
+            (rows, name_codes[rows, positions]),
+            np.left_shift(np.uint64(1), positions.astype(np.uint64)),
+        )
+
+        # Bit parallel common subsequence, one step per choice character
+        # (Allison-Dix / Hyyro), run for every pair at once. Padding has an
+        # empty match mask and leaves the pair unchanged.
+        v = np.full(len(name_idx), np.iinfo(np.uint64).max, dtype=np.uint64)
+        pair_choice_codes = self.choice_codes[choice_idx]
+        for j in range(pair_choice_codes.shape[1]):
+            u = v & match_masks[name_idx, pair_choice_codes[:, j]]
+            v = (v + u) | (v - u)
+
+        lengths = name_lengths[name_idx].astype(np.uint64)
+        name_masks = np.where(
+            lengths >= MAX_WORD_NAME_LENGTH,
+            np.iinfo(np.uint64).max,
+            np.left_shift(np.uint64(1), lengths) - np.uint64(1),
+        ).astype(np.uint64)
+        common = np.bitwise_count(~v & name_masks).astype(np.int64)
+
+        total_lengths = name_lengths[name_idx] + self.choice_lengths[choice_idx]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = np.where(
+                total_lengths > 0, np.round(100 * (2 * common / total_lengths)), 100
+            )
+        return scores.astype(np.int64)
+
+    def match(self, names: list, threshold: int = 80) -> pd.DataFrame:
+        """Best matching choice of every name. Ties go to the first choice,
+        as with fuzzywuzzy's process.extractOne.
+
+        Args:
+            names (list): Names to match.
+            threshold (int, optional): Minimum score of a match. Defaults to 80.
+
+        Returns:
+            pd.DataFrame: Best match ("" if none reach the threshold) and its
+                score (nan if none reach the threshold) of every name.
+        """
+        normalized_names = [normalize_name(n) for n in names]
+        name_lengths = np.array([len(n) for n in normalized_names], dtype=np.int64)
+        name_codes = self.encode(normalized_names)
+
+        name_idx, choice_idx = self.get_candidate_pairs(
+            name_codes, name_lengths, threshold
+        )
+
+        # Names longer than a word are scored one pair at a time
+        long_pairs = name_lengths[name_idx] > MAX_WORD_NAME_LENGTH
+        scores = np.zeros(len(name_idx), dtype=np.int64)
+        scores[~long_pairs] = self.score_pairs(
+            name_codes, name_lengths, name_idx[~long_pairs], choice_idx[~long_pairs]
+        )
+        for k in np.nonzero(long_pairs)[0]:
+            name = normalized_names[name_idx[k]]
+            choice = self.normalized_choices[choice_idx[k]]
+            scores[k] = round(
+                100 * (2 * lcs_length(name, choice) / (len(name) + len(choice)))
+            )
+
+        # Highest score of each name, first choice on ties
+        keep = scores >= threshold
+        name_idx, choice_idx, scores = name_idx[keep], choice_idx[keep], scores[keep]
+        order = np.lexsort((choice_idx, -scores, name_idx))
+        name_idx, choice_idx, scores = name_idx[order], choice_idx[order], scores[order]
+        first = np.diff(name_idx, prepend=-1) != 0
+
+        matches = pd.DataFrame(
+            {"match": "", "score": np.nan}, index=range(len(normalized_names))
+        )
+        matches.loc[name_idx[first], "match"] = [
+            self.choices[i] for i in choice_idx[first]
+        ]
+        matches.loc[name_idx[first], "score"] = scores[first]
+        return matches
@@ -0,0 +1,542 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from collect_data.read_local_data import read_mp_bio_data
+from common_functions.profiling import profiled_stage
+from playoff_performance_model.analysis.name_matching import normalize_name
+from playoff_performance_model.analysis.team_cube import get_batch_paths
+from playoff_performance_model.pipeline.batch_artifacts import (
+    get_batch_frame_path,
+    read_batch_frame,
+)
+from playoff_performance_model.pipeline.contributions import CONTRIBUTIONS_FRAME
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+PIPELINE_RESULTS_PATH = os.path.join(DIRNAME, "../pipeline_results")
+MODELS_PATH = os.path.join(DIRNAME, "../models")
+TRAINING_DATA_PATH = os.path.join(DIRNAME, "../train_model/training_data")
+TRAINING_FEATURES_PATH = os.path.join(TRAINING_DATA_PATH, "training_feature_data.pkl")
+TARGET_VARIABLE_PATH = os.path.join(TRAINING_DATA_PATH, "target_variable.csv")
+# History source used instead of the training features when they are not built
+MP_PLAYER_DATA_PATH = os.path.join(DIRNAME, "../../data/moneypuck/player_data")
+SEASON_DATES_PATH = os.path.join(DIRNAME, "../../data/nhl_season_start_end_dates.csv")
+
+# Name of the index saved in a batch folder, rebuilt when its sources change
+COMPARABLES_INDEX_FILENAME = "comparables_index.npz"
+
+KEY_COLS = ["playerId", "action_season", "action_date"]
+
+# Index rows compared with the queries at once, bounding memory
+BLOCK_ROWS = 65536
+
+# Loaded indexes by path and file mtime
+_INDEXES = {}
+
+
+def get_history_sources(pipeline_folder_path: str) -> list:
+    # Training features (or the MoneyPuck seasons when they are not built)
+    # and the feature data of every batch up to this one, oldest first
+    batch_name = os.path.basename(os.path.normpath(pipeline_folder_path))
+    sources = []
+    if os.path.exists(TRAINING_FEATURES_PATH):
+        sources.append(TRAINING_FEATURES_PATH)
+    else:
+        sources.append(MP_PLAYER_DATA_PATH)
+    for batch_path in get_batch_paths(
+        os.path.dirname(os.path.normpath(pipeline_folder_path))
+    ):
+        if os.path.basename(batch_path) > batch_name:
+            continue
+        try:
+            sources.append(get_batch_frame_path(batch_path, "feature_data"))
+        except FileNotFoundError:
+            # Batches not built yet
+            continue
+    return sources
+
+
+@profiled_stage
+def build_moneypuck_feature_data(last_action_season: int = None) -> pd.DataFrame:
+    """Store features of every player season in the MoneyPuck data, each
+    player scored for the season after every regular season they played.
+    Action dates are the end of that regular season, like the training data.
+
+    Args:
+        last_action_season (int, optional): Last action season to build.
+            Defaults to every season.
+
+    Returns:
+        pd.DataFrame: Key and feature columns, rows with missing data kept.
+    """
+    from playoff_performance_model.pipeline.feature_store import PlayerFeatureStore
+
+    feature_store = PlayerFeatureStore()
+    season_end_dates = pd.read_csv(SEASON_DATES_PATH, index_col="Season")[
+        "Finish (incl. playoffs)"
+    ]
+    ids = pd.DataFrame(
+        {
+            "playerId": feature_store.regular.player_ids,
+            "action_season": feature_store.regular.seasons + 1,
+        }
+    ).drop_duplicates()
+    ids["action_date"] = (ids["action_season"] - 1).map(season_end_dates)
+    ids = ids.loc[ids["action_date"].notna()]
+    if last_action_season is not None:
+        ids = ids.loc[ids["action_season"] <= last_action_season]
+    return feature_store.get_features(ids.reset_index(drop=True))
+
+
+@profiled_stage
+def read_history_feature_data(
+    sources: list, feature_names: list, last_action_season: int = None
+) -> pd.DataFrame:
+    """Feature rows of every (playerId, action_season) in the sources, the
+    latest source winning.
+
+    Args:
+        sources (list): Training feature pickle (or the MoneyPuck player data
+            folder) and batch feature data files.
+        feature_names (list): Features to read.
+        last_action_season (int, optional): Last action season built from the
+            MoneyPuck data. Defaults to every season.
+
+    Returns:
+        pd.DataFrame: Key and feature columns.
+    """
+    frames = []
+    for source in sources:
+        if source == TRAINING_FEATURES_PATH:
+            data = pd.read_pickle(source)
+        elif source == MP_PLAYER_DATA_PATH:
+            print(
+                f"No training features at {os.path.normpath(TRAINING_FEATURES_PATH)}"
+                ", building the history from the MoneyPuck seasons."
+            )
+            data = build_moneypuck_feature_data(last_action_season)
+        else:
+            data = read_batch_frame(os.path.dirname(source), "feature_data")
+        # Features the source doesn't have are missing
+        frames.append(data.reindex(columns=[*KEY_COLS, *feature_names]))
+    history = pd.concat(frames, ignore_index=True)
+    history["action_date"] = history["action_date"].astype(str)
+    history = history.drop_duplicates(subset=["playerId", "action_season"], keep="last")
+    return history.reset_index(drop=True)
+
+
+def get_feature_weights(
+    pipeline_folder_path: str, feature_names: list, top_features: int = None
+) -> pd.Series:
+    """Weight of each feature in the distance. All features weigh the same
+    unless top_features is given, then only the features with the largest
+    mean absolute contribution in the batch are used, weighted by it.
+
+    Raises:
+        FileNotFoundError: top_features given for a batch scored without
+            contributions.
+    """
+    if top_features is None:
+        return pd.Series(1.0, index=feature_names)
+
+    try:
+        contributions = read_batch_frame(
+            pipeline_folder_path, CONTRIBUTIONS_FRAME, columns=feature_names
+        )
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"No contributions in {pipeline_folder_path}, score the batch with "
+            "contributions."
+        )
+    importance = contributions.abs().mean().nlargest(top_features)
+    return importance / importance.mean()
+
+
+def get_source_signature(sources: list, weights: pd.Series) -> str:
+    # Changes when a source is rewritten or the features change. A folder
+    # changes with the files in it
+    signature = hashlib.sha256()
+    for source in sources:
+        if os.path.isdir(source):
+            mtime = max(
+                os.path.getmtime(os.path.join(source, f)) for f in os.listdir(source)
+            )
+        else:
+            mtime = os.path.getmtime(source)
+        signature.update(f"{source}:{mtime}".encode())
+    signature.update(weights.to_json().encode())
+    return signature.hexdigest()
+
+
+class ComparablesIndex:
+    """Standardized, weighted feature vectors of historical player seasons
+    with k nearest neighbor queries. Queries compare against the index in
+    blocks of rows with one matrix product each, exact and without a tree,
+    which doesn't help with this many features.
+    """
+
+    def __init__(
+        self,
+        keys: pd.DataFrame,
+        vectors: np.ndarray,
+        feature_names: list,
+        mean: np.ndarray,
+        scale: np.ndarray,
+        signature: str = "",
+    ):
+        self.keys = keys.reset_index(drop=True)
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.feature_names = list(feature_names)
+        self.mean = mean
+        self.scale = scale
+        self.signature = signature
+
+        self.player_ids = self.keys["playerId"].to_numpy(dtype=np.int64)
+        self.squared_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        # Row of every (playerId, action_season)
+        self.rows = dict(
+            zip(
+                zip(self.player_ids, self.keys["action_season"].to_numpy(dtype=int)),
+                range(self.keys.shape[0]),
+            )
+        )
+
+    @classmethod
+    def build(
+        cls, history: pd.DataFrame, weights: pd.Series, signature: str = ""
+    ) -> "ComparablesIndex":
+        # Standardize every feature over the history, missing values at the
+        # mean, then scale by the feature's weight
+        feature_names = list(weights.index)
+        X = history.loc[:, feature_names].to_numpy(dtype=float)
+        mean = np.nanmean(X, axis=0)
+        std = np.nanstd(X, axis=0)
+        std[~(std > 0)] = 1
+        mean = np.nan_to_num(mean)
+        scale = weights.to_numpy(dtype=float) / std
+        return cls(
+            history.loc[:, KEY_COLS],
+            np.nan_to_num((X - mean) * scale),
+            feature_names,
+            mean,
+            scale,
+            signature,
+        )
+
+    def transform(self, data: pd.DataFrame) -> np.ndarray:
+        X = data.loc[:, self.feature_names].to_numpy(dtype=float)
+        return np.nan_to_num((X - self.mean) * self.scale).astype(np.float32)
+
+    def save(self, file_path: str):
+        np.savez(
+            file_path,
+            player_id=self.player_ids,
+            action_season=self.keys["action_season"].to_numpy(dtype=np.int64),
+            action_date=self.keys["action_date"].to_numpy(dtype=str),
+            vectors=self.vectors,
+            feature_names=np.array(self.feature_names),
+            mean=self.mean,
+            scale=self.scale,
+            signature=self.signature,
+        )
+
+    @classmethod
+    def load(cls, file_path: str) -> "ComparablesIndex":
+        with np.load(file_path) as index:
+            keys = pd.DataFrame(
+                {
+                    "playerId": index["player_id"],
+                    "action_season": index["action_season"],
+                    "action_date": index["action_date"].astype(object),
+                }
+            )
+            return cls(
+                keys,
+                index["vectors"],
+                index["feature_names"].tolist(),
+                index["mean"],
+                index["scale"],
+                str(index["signature"]),
+            )
+
+    def nearest(
+        self, vectors: np.ndarray, k: int = 10, exclude_player_ids: np.ndarray = None
+    ) -> tuple:
+        """k nearest index rows of each query vector by euclidean distance.
+
+        Args:
+            vectors (np.ndarray): Query vectors (queries x features).
+            k (int, optional): Neighbors per query. Defaults to 10.
+            exclude_player_ids (np.ndarray, optional): Player of each query
+                whose rows are left out. Defaults to None.
+
+        Returns:
+            tuple: Rows and distances of the neighbors, nearest first
+                (queries x k).
+        """
+        vectors = np.atleast_2d(vectors).astype(np.float32)
+        k = min(k, self.vectors.shape[0])
+        query_norms = np.einsum("ij,ij->i", vectors, vectors)[:, None]
+        best_rows = np.empty((vectors.shape[0], 0), dtype=np.int64)
+        best_distances = np.empty((vectors.shape[0], 0), dtype=np.float32)
+
+        for start in range(0, self.vectors.shape[0], BLOCK_ROWS):
+            block = slice(start, start + BLOCK_ROWS)
+            # |a - b|^2 = |a|^2 - 2 a.b + |b|^2, one product per block
+            distances = (
+                query_norms
+                - 2 * vectors @ self.vectors[block].T
+                + self.squared_norms[block]
+            )
+            if exclude_player_ids is not None:
+                same_player = (
+                    self.player_ids[block] == np.asarray(exclude_player_ids)[:, None]
+                )
+                distances[same_player] = np.inf
+            rows = np.broadcast_to(
+                np.arange(start, start + distances.shape[1]), distances.shape
+            )
+
+            # Keep the k best of the block and the blocks before it
+            distances = np.hstack([best_distances, distances])
+            rows = np.hstack([best_rows, rows])
+            top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            best_rows = np.take_along_axis(rows, top, axis=1)
+            best_distances = np.take_along_axis(distances, top, axis=1)
+
+        order = np.argsort(best_distances, axis=1, kind="stable")
+        best_distances = np.take_along_axis(best_distances, order, axis=1)
+        return (
+            np.take_along_axis(best_rows, order, axis=1),
+            np.sqrt(np.maximum(best_distances, 0)),
+        )
+
+    def query(
+        self,
+        player_id: int,
+        action_season: int,
+        k: int = 10,
+        exclude_player: bool = True,
+    ) -> pd.DataFrame:
+        """Player seasons most similar to a player season in the index.
+
+        Args:
+            player_id (int): Player.
+            action_season (int): Season of the player, e.g. 2024.
+            k (int, optional): Comparables. Defaults to 10.
+            exclude_player (bool, optional): Leave out the player's other
+                seasons. Defaults to True.
+
+        Raises:
+            KeyError: Player season not in the index.
+
+        Returns:
+            pd.DataFrame: Keys of the comparables and their distance.
+        """
+        row = self.rows.get((player_id, action_season))
+        if row is None:
+            raise KeyError(f"No {action_season} season of {player_id} in the index.")
+        rows, distances = self.nearest(
+            self.vectors[row],
+            k=k + (0 if exclude_player else 1),
+            exclude_player_ids=[player_id] if exclude_player else None,
+        )
+        comparables = self.keys.loc[rows[0]].assign(distance=distances[0])
+        # Without exclusion the player season itself is nearest
+        comparables = comparables.loc[comparables.index != row]
+        return comparables.head(k).reset_index(drop=True)
+
+
+@profiled_stage
+def get_comparables_index(
+    pipeline_folder_path: str,
+    model_version: str = "version_2",
+    top_features: int = None,
+    rebuild: bool = False,
+) -> ComparablesIndex:
+    """Comparables index of a batch over the model version's features,
+    loaded from the batch folder while its sources are unchanged.
+
+    Args:
+        pipeline_folder_path (str): Batch folder.
+        model_version (str, optional): Model version whose features are
+            compared. Defaults to "version_2".
+        top_features (int, optional): Only compare the features with the
+            largest mean contribution in the batch. Defaults to all features.
+        rebuild (bool, optional): Build the index even if saved. Defaults
+            to False.
+
+    Returns:
+        ComparablesIndex: Index of the training rows (or the MoneyPuck
+            seasons up to the batch's when they are not built) and every
+            batch up to this one.
+    """
+    with open(os.path.join(MODELS_PATH, model_version, "feature_names.json")) as f:
+        feature_names = json.load(f)
+    weights = get_feature_weights(pipeline_folder_path, feature_names, top_features)
+    sources = get_history_sources(pipeline_folder_path)
+    signature = get_source_signature(sources, weights)
+
+    index_path = os.path.join(pipeline_folder_path, COMPARABLES_INDEX_FILENAME)
+    if not rebuild and os.path.exists(index_path):
+        key = (os.path.realpath(index_path), os.path.getmtime(index_path))
+        if key not in _INDEXES:
+            _INDEXES[key] = ComparablesIndex.load(index_path)
+        if _INDEXES[key].signature == signature:
+            return _INDEXES[key]
+
+    from playoff_performance_model.pipeline.create_batch_data import (
+        get_season_from_action_date,
+    )
+
+    batch_name = os.path.basename(os.path.normpath(pipeline_folder_path))
+    history = read_history_feature_data(
+        sources,
+        list(weights.index),
+        int(get_season_from_action_date(batch_name.replace("batch_", ""))),
+    )
+    index = ComparablesIndex.build(history, weights, signature)
+    index.save(index_path)
+    return index
+
+
+def add_comparable_details(comparables: pd.DataFrame) -> pd.DataFrame:
+    # Names, and playoff game score of past seasons from the target data
+    bio_data = read_mp_bio_data().drop_duplicates(subset=["playerId"])
+    comparables.insert(
+        1,
+        "name",
+        comparables["playerId"].map(bio_data.set_index("playerId")["name"]),
+    )
+    if os.path.exists(TARGET_VARIABLE_PATH):
+        target_data = pd.read_csv(
+            TARGET_VARIABLE_PATH,
+            usecols=["playerId", "action_season", "gamescore_toi"],
+        ).drop_duplicates(subset=["playerId", "action_season"])
+        comparables = pd.merge(
+            comparables, target_data, on=["playerId", "action_season"], how="left"
+        )
+    return comparables
+
+
+def find_player_id(name: str) -> int:
+    bio_data = read_mp_bio_data()
+    matches = bio_data.loc[bio_data["name"].map(normalize_name) == normalize_name(name)]
+    if matches.empty:
+        raise KeyError(f"No player named {name}.")
+    return int(matches["playerId"].iloc[0])
+
+
+def benchmark_comparables(
+    num_rows: list = None, num_features: int = 100, queries: int = 200
+) -> pd.DataFrame:
+    """Build and query indexes of synthetic feature rows.
+
+    Returns:
+        pd.DataFrame: Build seconds and median and 99th percentile query
+            milliseconds by index size.
+    """
+    if num_rows is None:
+        num_rows = [15_000, 60_000, 240_000]
+
+    rng = np.random.default_rng(0)
+    results = []
+    for n in num_rows:
+        feature_names = [f"feature_{i}" for i in range(num_features)]
+        history = pd.DataFrame(
+            rng.normal(size=(n, num_features)), columns=feature_names
+        )
+        history.insert(0, "playerId", rng.integers(0, n // 8, n))
+        history.insert(1, "action_season", np.arange(n) % 17 + 2008)
+        history.insert(2, "action_date", "")
+        history = history.drop_duplicates(subset=["playerId", "action_season"])
+
+        start_time = time.perf_counter()
+        index = ComparablesIndex.build(history, pd.Series(1.0, index=feature_names))
+        build_seconds = time.perf_counter() - start_time
+
+        query_seconds = []
+        for i in rng.integers(0, history.shape[0], queries):
+            start_time = time.perf_counter()
+            index.query(history["playerId"].iloc[i], history["action_season"].iloc[i])
+            query_seconds.append(time.perf_counter() - start_time)
+        results.append(
+            {
+                "rows": history.shape[0],
+                "features": num_features,
+                "build_seconds": build_seconds,
+                "median_query_ms": np.median(query_seconds) * 1000,
+                "p99_query_ms": np.percentile(query_seconds, 99) * 1000,
+            }
+        )
+    return pd.DataFrame(results)
+
+
+def get_comparables_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Player seasons most similar to a player entering the playoffs."
+    )
+    parser.add_argument("--action-date", default="2024-06-29", help="YYYY-MM-DD")
+    player = parser.add_mutually_exclusive_group()
+    player.add_argument("--player-id", type=int)
+    player.add_argument("--name", help="Player name, e.g. 'Connor McDavid'")
+    parser.add_argument(
+        "--season", type=int, help="Season of the player, defaults to the batch's"
+    )
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--model-version", default="version_2")
+    parser.add_argument(
+        "--top-features",
+        type=int,
+        help="Only compare the features contributing most (needs contributions)",
+    )
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument(
+        "--benchmark",
+        nargs="*",
+        type=int,
+        help="Time synthetic indexes of these numbers of rows instead",
+    )
+    return parser
+
+
+def run_comparables(args: argparse.Namespace):
+    if args.benchmark is not None:
+        print(benchmark_comparables(args.benchmark or None).to_string(index=False))
+        return
+
+    pipeline_folder_path = os.path.join(
+        PIPELINE_RESULTS_PATH, f"batch_{args.action_date}"
+    )
+    index = get_comparables_index(
+        pipeline_folder_path,
+        model_version=args.model_version,
+        top_features=args.top_features,
+        rebuild=args.rebuild,
+    )
+    player_id = args.player_id
+    if args.name is not None:
+        player_id = find_player_id(args.name)
+    if player_id is None:
+        raise SystemExit("Give a --player-id or --name.")
+    season = args.season or int(args.action_date[:4])
+
+    start_time = time.perf_counter()
+    comparables = index.query(player_id, season, k=args.k)
+    query_ms = (time.perf_counter() - start_time) * 1000
+    print(add_comparable_details(comparables).to_string(index=False))
+    print(
+        f"{args.k} comparables of {player_id} ({season}) among "
+        f"{index.keys.shape[0]} player seasons in {query_ms:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    run_comparables(get_comparables_parser().parse_args())
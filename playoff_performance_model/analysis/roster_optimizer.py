@@ -0,0 +1,445 @@
+import argparse
+import itertools
+import os
+import time
+from bisect import bisect_right, insort
+
+import numpy as np
+import pandas as pd
+
+from common_functions.profiling import get_peak_rss_mb, profiled_stage
+from playoff_performance_model.analysis.analysis_data import get_batch_analysis_data
+from playoff_performance_model.analysis.batch_query import ScoredBatchTable
+from playoff_performance_model.analysis.series_simulator import (
+    DEFENSE_POSITIONS,
+    FORWARD_POSITIONS,
+    LINEUP,
+)
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+PIPELINE_RESULTS_PATH = os.path.join(DIRNAME, "../pipeline_results")
+
+# 2024-25 upper limit
+SALARY_CAP = 88_000_000
+# Cap hits are rounded up to this for the knapsack, see optimize_roster
+CAP_UNIT = 25_000
+POSITION_GROUPS = {"forwards": FORWARD_POSITIONS, "defense": DEFENSE_POSITIONS}
+
+
+class RosterException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+def prune_dominated(cost: np.ndarray, value: np.ndarray, k: int) -> np.ndarray:
+    """Players that can be in a best set of k. A player with at least k
+    others as cheap and as good can always be swapped for one of them.
+
+    Returns:
+        np.ndarray: Positions of the players kept.
+    """
+    # Cheapest first, the best of equally cheap players first
+    order = np.lexsort((-value, cost))
+    kept = []
+    # Values of the players seen so far, negated to count the better ones
+    seen = []
+    for i in order:
+        if bisect_right(seen, -value[i]) < k:
+            kept.append(i)
+        insort(seen, -value[i])
+    return np.sort(np.array(kept, dtype=int))
+
+
+def best_sets_by_cost(cost: np.ndarray, value: np.ndarray, k: int, budget: int):
+    """0/1 knapsack of exactly k players for every budget up to the budget,
+    in integer cost units.
+
+    Returns:
+        tuple: Best value of j players within each budget (k + 1 x budget + 1,
+            -inf when there is no such set) and the choices to rebuild the
+            sets with.
+    """
+    best = np.full((k + 1, budget + 1), -np.inf)
+    best[0] = 0
+    choices = []
+    for c, v in zip(cost, value):
+        taken = np.zeros((k + 1, budget + 1), dtype=bool)
+        if c <= budget and k > 0:
+            # Adding the player to every set of one fewer players
+            candidate = best[:-1, : budget + 1 - c] + v
+            taken[1:, c:] = candidate > best[1:, c:]
+            best[1:, c:] = np.where(taken[1:, c:], candidate, best[1:, c:])
+        choices.append(taken)
+    return best, choices
+
+
+def rebuild_set(cost: np.ndarray, choices: list, k: int, budget: int) -> list:
+    # Walk the choices back from the last player
+    chosen = []
+    for i in range(len(choices) - 1, -1, -1):
+        if k == 0:
+            break
+        if choices[i][k, budget]:
+            chosen.append(i)
+            budget -= cost[i]
+            k -= 1
+    return chosen[::-1]
+
+
+def solve_groups(groups: list, budget: int) -> tuple:
+    """Best value of the groups' sets together within the budget.
+
+    Args:
+        groups (list): Best value by budget of each group's set.
+        budget (int): Budget in cost units.
+
+    Returns:
+        tuple: Best value and the budget given to each group.
+    """
+    # Best of the groups so far by budget, with the split of each budget
+    total = groups[0]
+    splits = []
+    for group in groups[1:]:
+        combined = np.full(budget + 1, -np.inf)
+        split = np.zeros(budget + 1, dtype=int)
+        for spent in range(budget + 1):
+            candidate = total[spent] + group[: budget + 1 - spent]
+            better = candidate > combined[spent:]
+            combined[spent:][better] = candidate[better]
+            split[spent:][better] = spent
+        total = combined
+        splits.append(split)
+
+    # Budgets of the groups from the last split back
+    group_budgets = [budget]
+    for split in reversed(splits):
+        spent = split[group_budgets[0]]
+        group_budgets[0] -= spent
+        group_budgets.insert(0, spent)
+    return total[budget], group_budgets
+
+
+def solve_knapsack(
+    pool: pd.DataFrame, cost: np.ndarray, requirements: dict, budget: int
+) -> tuple:
+    # Best players of every group in integer cost units
+    groups = []
+    for group, k in requirements.items():
+        rows = np.flatnonzero(pool["group"].to_numpy() == group)
+        best, choices = best_sets_by_cost(
+            cost[rows], pool["value"].to_numpy()[rows], k, budget
+        )
+        groups.append((rows, best[k], choices, k))
+
+    value, group_budgets = solve_groups([g[1] for g in groups], budget)
+    if not np.isfinite(value):
+        return value, np.array([], dtype=int)
+    chosen = [
+        rows[rebuild_set(cost[rows], choices, k, group_budget)]
+        for (rows, _, choices, k), group_budget in zip(groups, group_budgets)
+    ]
+    return value, np.concatenate(chosen)
+
+
+@profiled_stage
+def optimize_roster(
+    data: pd.DataFrame,
+    budget: float = SALARY_CAP,
+    requirements: dict = LINEUP,
+    cost_col: str = "current_cap_hit",
+    value_col: str = "prediction",
+    cap_unit: float = CAP_UNIT,
+) -> dict:
+    """Players with the highest summed prediction under a cap budget, with
+    the number of players set for each position group.
+
+    Exact 0/1 knapsack by dynamic programming for each position group over
+    budgets in cap units, the groups then sharing the budget. Cap hits are
+    rounded up to cap units, so the players found always fit the budget,
+    and solved again rounded down for an upper bound on the best value.
+    The gap between the two is 0 when every cap hit is a multiple of the
+    unit. Players that can't be in the best set are pruned first.
+
+    Args:
+        data (pd.DataFrame): Players with position, cost and value columns,
+            e.g. batch analysis data. Players missing either are left out.
+        budget (float, optional): Cap budget. Defaults to SALARY_CAP.
+        requirements (dict, optional): Players of each position group
+            (forwards, defense). Defaults to 12 forwards and 6 defense.
+        cost_col (str, optional): Cost column. Defaults to "current_cap_hit".
+        value_col (str, optional): Value column. Defaults to "prediction".
+        cap_unit (float, optional): Cap unit of the knapsack, smaller is
+            closer to exact and slower. Defaults to CAP_UNIT.
+
+    Raises:
+        RosterException: Unknown position groups or no set fits the budget.
+
+    Returns:
+        dict: The players ("players"), their value and cost, the upper
+            bound on the best value and its gap, and the pool sizes.
+    """
+    start_time = time.perf_counter()
+    unknown_groups = set(requirements) - set(POSITION_GROUPS)
+    if len(unknown_groups) > 0:
+        raise RosterException(f"Unknown position groups {sorted(unknown_groups)}.")
+
+    pool = data.loc[data[cost_col].notna() & data[value_col].notna()]
+    pool = pool.reset_index(drop=True)
+    pool["group"] = None
+    for group, positions in POSITION_GROUPS.items():
+        pool.loc[pool["position"].isin(positions), "group"] = group
+    pool = pool.loc[pool["group"].isin(list(requirements))].copy()
+    pool["cost"] = pool[cost_col].astype(float)
+    pool["value"] = pool[value_col].astype(float)
+    pool_size = pool.shape[0]
+
+    # Only players that can be in the best set of their group
+    kept = []
+    for group, k in requirements.items():
+        group_pool = pool.loc[pool["group"] == group]
+        rows = prune_dominated(
+            group_pool["cost"].to_numpy(), group_pool["value"].to_numpy(), k
+        )
+        kept.append(group_pool.index[rows])
+    pool = pool.loc[np.concatenate(kept)].reset_index(drop=True)
+
+    budget_units = int(budget // cap_unit)
+    units = pool["cost"].to_numpy() / cap_unit
+    value, chosen = solve_knapsack(
+        pool, np.ceil(units - 1e-9).astype(int), requirements, budget_units
+    )
+    if not np.isfinite(value):
+        raise RosterException(
+            f"No set of {requirements} fits a budget of ${budget:,.0f}."
+        )
+    upper_bound, _ = solve_knapsack(
+        pool, np.floor(units + 1e-9).astype(int), requirements, budget_units
+    )
+
+    players = pool.loc[chosen].drop(columns=["cost", "value"])
+    return {
+        "players": players.sort_values(by=["group", value_col], ascending=False),
+        "value": value,
+        "cost": players[cost_col].sum(),
+        "upper_bound": upper_bound,
+        "gap": upper_bound - value,
+        "pool": pool_size,
+        "pruned_pool": pool.shape[0],
+        "seconds": time.perf_counter() - start_time,
+    }
+
+
+@profiled_stage
+def optimize_signings(
+    data: pd.DataFrame,
+    team: str,
+    budget: float = SALARY_CAP,
+    requirements: dict = LINEUP,
+    cap_unit: float = CAP_UNIT,
+) -> dict:
+    """Best lineup of a team from its players under contract next season
+    and this summer's UFAs, signing UFAs at their current cap hit.
+
+    The team's players under contract count against the budget whether in
+    the lineup or not, so they cost nothing to pick and the UFAs share what
+    is left of the budget.
+
+    Args:
+        data (pd.DataFrame): Batch analysis data.
+        team (str): Team, e.g. "TOR".
+        budget (float, optional): Cap budget. Defaults to SALARY_CAP.
+        requirements (dict, optional): Players of each position group.
+            Defaults to 12 forwards and 6 defense.
+        cap_unit (float, optional): Cap unit of the knapsack. Defaults to
+            CAP_UNIT.
+
+    Returns:
+        dict: Output of optimize_roster, with a "signed" column on the
+            players and the cap space left for the UFAs.
+    """
+    table = ScoredBatchTable(data)
+    ufa_year = max(table.data["action_season"]) + 1
+    ufa_rows = table.select_rows(
+        ufa=True,
+        max_ufa_year=ufa_year,
+        expiry_year=f"{ufa_year-1}-{str(ufa_year)[-2:]}",
+    )
+    ufas = table.data.loc[ufa_rows]
+    team_rows = np.setdiff1d(table.select_rows(team=team), ufa_rows)
+    under_contract = table.data.loc[team_rows]
+    under_contract = under_contract.loc[under_contract["current_cap_hit"].notna()]
+
+    cap_space = budget - under_contract["current_cap_hit"].sum()
+    pool = pd.concat(
+        [under_contract.assign(signed=False), ufas.assign(signed=True)],
+        ignore_index=True,
+    )
+    pool["signing_cost"] = np.where(pool["signed"], pool["current_cap_hit"], 0)
+
+    result = optimize_roster(
+        pool,
+        budget=max(cap_space, 0),
+        requirements=requirements,
+        cost_col="signing_cost",
+        cap_unit=cap_unit,
+    )
+    return {**result, "cap_space": cap_space}
+
+
+def generate_player_pool(num_players: int, seed: int = 0) -> pd.DataFrame:
+    # Synthetic pool shaped like the batch analysis data, cap hits in
+    # $2,500 steps as real contracts aren't multiples of the cap unit
+    rng = np.random.default_rng(seed)
+    cap_hit = np.round(np.exp(rng.normal(14.6, 0.8, num_players)) / 2500) * 2500
+    return pd.DataFrame(
+        {
+            "playerId": np.arange(num_players),
+            "position": rng.choice(["C", "L", "R", "D"], num_players),
+            "current_cap_hit": np.clip(cap_hit, 775_000, 15_000_000),
+            # Better players cost more, loosely
+            "prediction": 450
+            + 30 * np.log(cap_hit / 775_000)
+            + rng.normal(0, 40, num_players),
+        }
+    )
+
+
+def brute_force_roster(data: pd.DataFrame, budget: float, requirements: dict) -> float:
+    # Best value over every set, for checking the optimizer on small pools
+    group_sets = []
+    for group, k in requirements.items():
+        group_data = data.loc[data["position"].isin(POSITION_GROUPS[group])]
+        group_sets.append(
+            [
+                (
+                    group_data["current_cap_hit"].iloc[list(s)].sum(),
+                    group_data["prediction"].iloc[list(s)].sum(),
+                )
+                for s in itertools.combinations(range(group_data.shape[0]), k)
+            ]
+        )
+    best = -np.inf
+    for sets in itertools.product(*group_sets):
+        if sum(s[0] for s in sets) <= budget:
+            best = max(best, sum(s[1] for s in sets))
+    return best
+
+
+def benchmark_roster_optimizer(
+    pipeline_folder_path: str,
+    pool_sizes: list = None,
+    budget: float = SALARY_CAP,
+    cap_unit: float = CAP_UNIT,
+) -> pd.DataFrame:
+    """Time the optimizer on a batch's players and on synthetic pools of
+    growing size, and check it against brute force on small pools.
+
+    Returns:
+        pd.DataFrame: Time, pool sizes and gap of each run.
+    """
+    if pool_sizes is None:
+        pool_sizes = [1_000, 4_000, 16_000, 64_000]
+
+    # Brute force over every set of 2 forwards and 2 defense of 14 players
+    small_requirements = {"forwards": 2, "defense": 2}
+    for seed in range(5):
+        small_pool = generate_player_pool(14, seed=seed)
+        small_budget = small_pool["current_cap_hit"].median() * 4
+        expected = brute_force_roster(small_pool, small_budget, small_requirements)
+        found = optimize_roster(
+            small_pool, small_budget, small_requirements, cap_unit=2500
+        )["value"]
+        if not np.isclose(found, expected):
+            raise RosterException(f"Optimizer found {found}, brute force {expected}.")
+
+    pools = [
+        (
+            os.path.basename(pipeline_folder_path),
+            get_batch_analysis_data(pipeline_folder_path),
+        )
+    ] + [(f"synthetic_{n}", generate_player_pool(n)) for n in pool_sizes]
+    results = []
+    for name, pool in pools:
+        result = optimize_roster(pool, budget=budget, cap_unit=cap_unit)
+        results.append(
+            {
+                "pool_name": name,
+                "pool": result["pool"],
+                "pruned_pool": result["pruned_pool"],
+                "seconds": result["seconds"],
+                "value": result["value"],
+                "gap": result["gap"],
+                "cost": result["cost"],
+                "process_peak_rss_mb": get_peak_rss_mb(),
+            }
+        )
+    return pd.DataFrame(results)
+
+
+def get_optimizer_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Best lineup or UFA signings under a cap budget."
+    )
+    parser.add_argument("--action-date", default="2024-06-29", help="YYYY-MM-DD")
+    parser.add_argument("--budget", type=float, default=SALARY_CAP)
+    parser.add_argument("--forwards", type=int, default=LINEUP["forwards"])
+    parser.add_argument("--defense", type=int, default=LINEUP["defense"])
+    parser.add_argument(
+        "--team", help="Best lineup of the team's players under contract and UFAs"
+    )
+    parser.add_argument("--cap-unit", type=float, default=CAP_UNIT)
+    parser.add_argument(
+        "--benchmark",
+        nargs="*",
+        type=int,
+        help="Time the batch and synthetic pools of these sizes instead",
+    )
+    return parser
+
+
+def run_optimizer(args: argparse.Namespace):
+    pipeline_folder_path = os.path.join(
+        PIPELINE_RESULTS_PATH, f"batch_{args.action_date}"
+    )
+    if args.benchmark is not None:
+        print(
+            benchmark_roster_optimizer(
+                pipeline_folder_path,
+                args.benchmark or None,
+                budget=args.budget,
+                cap_unit=args.cap_unit,
+            ).to_string(index=False)
+        )
+        return
+
+    data = get_batch_analysis_data(pipeline_folder_path)
+    requirements = {"forwards": args.forwards, "defense": args.defense}
+    if args.team is None:
+        result = optimize_roster(
+            data, args.budget, requirements, cap_unit=args.cap_unit
+        )
+        columns = ["playerId", "name", "team", "position"]
+    else:
+        result = optimize_signings(
+            data, args.team, args.budget, requirements, cap_unit=args.cap_unit
+        )
+        columns = ["playerId", "name", "team", "position", "signed"]
+        print(f"Cap space for UFAs: ${result['cap_space']:,.0f}")
+
+    print(
+        result["players"]
+        .loc[:, [*columns, "prediction", "current_cap_hit"]]
+        .to_string(index=False)
+    )
+    print(
+        f"Total prediction {result['value']:.1f} (upper bound "
+        f"{result['upper_bound']:.1f}) for ${result['cost']:,.0f}, from "
+        f"{result['pruned_pool']} of {result['pool']} players in "
+        f"{result['seconds']:.3f}s"
+    )
+
+
+if __name__ == "__main__":
+    run_optimizer(get_optimizer_parser().parse_args())
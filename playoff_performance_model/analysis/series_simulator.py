@@ -0,0 +1,424 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from common_functions.profiling import profiled_stage
+from playoff_performance_model.analysis.analysis_data import get_batch_analysis_data
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+PIPELINE_RESULTS_PATH = os.path.join(DIRNAME, "../pipeline_results")
+
+# Playoff lineup the team strength is summed over
+LINEUP = {"forwards": 12, "defense": 6}
+FORWARD_POSITIONS = ["C", "L", "R"]
+DEFENSE_POSITIONS = ["D"]
+
+# Spread of a prediction without a bootstrap interval, as a share of it
+PREDICTION_SD_FRACTION = 0.25
+# z of the 5th and 95th percentiles, to turn an interval into a spread
+INTERVAL_Z = 1.645
+
+# Game win log odds of a team one league standard deviation of (expected)
+# strength better, about a 60% chance
+GAME_LOGIT_PER_SD = 0.4
+# Home ice game win log odds, about a 52.5% chance
+HOME_ICE_LOGIT = 0.1
+# Games at the home ice team (2-2-1-1-1). With every game played, the
+# team winning 4 of the 7 is the one getting to 4 wins first
+HOME_GAMES = np.array([1, 1, 0, 0, 1, 0, 1], dtype=bool)
+WINS_NEEDED = 4
+
+# First round pairs by seed, in bracket order
+BRACKET_SEEDS = [1, 16, 8, 9, 5, 12, 4, 13, 6, 11, 3, 14, 7, 10, 2, 15]
+
+# Simulations drawn at once, bounding memory whatever the number of sims
+SIMS_PER_BLOCK = 50_000
+CONVERGENCE_CHECKPOINTS = [1_000, 2_000, 5_000, 10_000, 20_000, 50_000, 100_000]
+
+
+class BracketException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+@profiled_stage
+def get_team_strengths(
+    data: pd.DataFrame,
+    lineup: dict = LINEUP,
+    prediction_sd_fraction: float = PREDICTION_SD_FRACTION,
+) -> pd.DataFrame:
+    """Strength of every team as the summed predictions of its playoff
+    lineup (the best forwards and defense by prediction).
+
+    Prediction spreads come from the bootstrap interval when the batch was
+    scored with one (prediction_p05 and prediction_p95), else a share of the
+    prediction. Players are independent, so the strength is normal with the
+    summed variance.
+
+    Args:
+        data (pd.DataFrame): Batch analysis data with team, position and
+            prediction columns.
+        lineup (dict, optional): Forwards and defense in the lineup.
+            Defaults to 12 forwards and 6 defense.
+        prediction_sd_fraction (float, optional): Spread of a prediction
+            without an interval. Defaults to PREDICTION_SD_FRACTION.
+
+    Returns:
+        pd.DataFrame: Strength mean and standard deviation by team, strongest
+            first.
+    """
+    data = data.loc[data["team"].notna() & data["prediction"].notna()].copy()
+    if "prediction_p05" in data.columns and "prediction_p95" in data.columns:
+        data["prediction_sd"] = (data["prediction_p95"] - data["prediction_p05"]) / (
+            2 * INTERVAL_Z
+        )
+    else:
+        data["prediction_sd"] = data["prediction"].abs() * prediction_sd_fraction
+
+    data["lineup_group"] = np.select(
+        [
+            data["position"].isin(FORWARD_POSITIONS),
+            data["position"].isin(DEFENSE_POSITIONS),
+        ],
+        ["forwards", "defense"],
+        default="",
+    )
+    data = data.loc[data["lineup_group"] != ""]
+    # Best players of each team and lineup group
+    data = data.sort_values(by="prediction", ascending=False)
+    rank = data.groupby(["team", "lineup_group"]).cumcount()
+    data = data.loc[rank < data["lineup_group"].map(lineup)]
+
+    strengths = data.groupby("team").agg(
+        players=("prediction", "size"),
+        strength_mean=("prediction", "sum"),
+        strength_variance=("prediction_sd", lambda sd: (sd**2).sum()),
+    )
+    strengths["strength_sd"] = np.sqrt(strengths.pop("strength_variance"))
+    return strengths.sort_values(by="strength_mean", ascending=False)
+
+
+def get_strength_scale(
+    team_strengths: pd.DataFrame, game_logit_per_sd: float = GAME_LOGIT_PER_SD
+) -> float:
+    # Strength difference worth one log odds of winning a game
+    spread = team_strengths["strength_mean"].std()
+    return float(spread / game_logit_per_sd) if spread > 0 else 1.0
+
+
+def simulate_series_wins(
+    home_strength: np.ndarray,
+    away_strength: np.ndarray,
+    rng: np.random.Generator,
+    strength_scale: float,
+    home_ice_logit: float = HOME_ICE_LOGIT,
+) -> tuple:
+    """Best of seven series between arrays of home ice and away teams, every
+    series drawn at once.
+
+    Returns:
+        tuple: Whether the home ice team won each series and the games it
+            took.
+    """
+    logit = (home_strength - away_strength)[..., None] / strength_scale
+    logit = logit + np.where(HOME_GAMES, home_ice_logit, -home_ice_logit)
+    home_wins = rng.random(logit.shape) < 1 / (1 + np.exp(-logit))
+
+    home_total = np.cumsum(home_wins, axis=-1)
+    away_total = np.arange(1, len(HOME_GAMES) + 1) - home_total
+    decided = (home_total == WINS_NEEDED) | (away_total == WINS_NEEDED)
+    return home_total[..., -1] >= WINS_NEEDED, np.argmax(decided, axis=-1) + 1
+
+
+def simulate_bracket_shard(
+    strength_mean: np.ndarray,
+    strength_sd: np.ndarray,
+    bracket: np.ndarray,
+    seed_rank: np.ndarray,
+    n_sims: int,
+    seed: np.random.SeedSequence,
+    strength_scale: float,
+    home_ice_logit: float = HOME_ICE_LOGIT,
+) -> tuple:
+    """Simulate a bracket n_sims times, a block of simulations at a time.
+    Each simulation draws every team's strength once for the whole playoffs.
+
+    Returns:
+        tuple: Times each team reached each round (teams x rounds + 1, the
+            last column being titles) and the champion of every simulation.
+    """
+    rng = np.random.default_rng(seed)
+    n_teams = len(strength_mean)
+    n_rounds = int(np.log2(len(bracket)))
+    round_counts = np.zeros((n_teams, n_rounds + 1), dtype=np.int64)
+    champions = []
+
+    for start in range(0, n_sims, SIMS_PER_BLOCK):
+        block_sims = min(SIMS_PER_BLOCK, n_sims - start)
+        strengths = strength_mean + strength_sd * rng.standard_normal(
+            (block_sims, n_teams)
+        )
+        alive = np.broadcast_to(bracket, (block_sims, len(bracket)))
+        round_counts[:, 0] += block_sims * np.bincount(bracket, minlength=n_teams)
+
+        for round_number in range(1, n_rounds + 1):
+            team_a, team_b = alive[:, 0::2], alive[:, 1::2]
+            # The better seed has home ice
+            a_home = seed_rank[team_a] < seed_rank[team_b]
+            home = np.where(a_home, team_a, team_b)
+            away = np.where(a_home, team_b, team_a)
+            home_won, _ = simulate_series_wins(
+                np.take_along_axis(strengths, home, axis=1),
+                np.take_along_axis(strengths, away, axis=1),
+                rng,
+                strength_scale,
+                home_ice_logit,
+            )
+            alive = np.where(home_won, home, away)
+            round_counts[:, round_number] += np.bincount(
+                alive.ravel(), minlength=n_teams
+            )
+        champions.append(alive[:, 0].astype(np.int16))
+
+    return round_counts, np.concatenate(champions)
+
+
+def get_convergence(
+    champions: np.ndarray, n_teams: int, checkpoints: list = CONVERGENCE_CHECKPOINTS
+) -> pd.DataFrame:
+    """Title odds after growing numbers of simulations, against the final
+    odds.
+
+    Returns:
+        pd.DataFrame: Largest change from the final title odds and largest
+            standard error of the title odds at each checkpoint.
+    """
+    n_sims = len(champions)
+    final = np.bincount(champions, minlength=n_teams) / n_sims
+    rows = []
+    for sims in [c for c in checkpoints if c < n_sims] + [n_sims]:
+        odds = np.bincount(champions[:sims], minlength=n_teams) / sims
+        rows.append(
+            {
+                "sims": sims,
+                "max_abs_change_from_final": np.abs(odds - final).max(),
+                "max_standard_error": np.sqrt(odds * (1 - odds) / sims).max(),
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def get_default_bracket(team_strengths: pd.DataFrame) -> list:
+    # Best 16 teams by expected strength in one league-wide bracket, seeded
+    # 1 v 16, 8 v 9, ... There are no conferences, team data has none
+    seeded = team_strengths.index[: len(BRACKET_SEEDS)]
+    if len(seeded) < len(BRACKET_SEEDS):
+        raise BracketException(
+            f"A bracket needs {len(BRACKET_SEEDS)} teams, {len(seeded)} given."
+        )
+    return [seeded[seed - 1] for seed in BRACKET_SEEDS]
+
+
+@profiled_stage
+def simulate_playoffs(
+    team_strengths: pd.DataFrame,
+    bracket: list = None,
+    n_sims: int = 100_000,
+    n_jobs: int = 1,
+    seed: int = 0,
+    home_ice_logit: float = HOME_ICE_LOGIT,
+    game_logit_per_sd: float = GAME_LOGIT_PER_SD,
+) -> dict:
+    """Monte Carlo simulation of a playoff bracket.
+
+    Args:
+        team_strengths (pd.DataFrame): Output of get_team_strengths.
+        bracket (list, optional): Teams in bracket order, first round pairs
+            next to each other. Defaults to the best 16 teams by strength
+            in one league-wide bracket (1 v 16, 8 v 9, ...), not the NHL's
+            two conference brackets.
+        n_sims (int, optional): Simulations. Defaults to 100,000.
+        n_jobs (int, optional): Processes the simulations are sharded
+            across, at most one per simulation. Defaults to 1.
+        seed (int, optional): Random seed, results are the same for a seed
+            and number of processes. Defaults to 0.
+        home_ice_logit (float, optional): Home game win log odds. Defaults
+            to HOME_ICE_LOGIT.
+        game_logit_per_sd (float, optional): Game win log odds per league
+            standard deviation of strength. Defaults to GAME_LOGIT_PER_SD.
+
+    Raises:
+        BracketException: Bracket size is not a power of two or has teams
+            without a strength.
+
+    Returns:
+        dict: Odds of each team reaching each round ("teams"), convergence
+            of the title odds ("convergence") and the seconds taken.
+    """
+    start_time = time.perf_counter()
+    if bracket is None:
+        bracket = get_default_bracket(team_strengths)
+    if len(bracket) < 2 or len(bracket) & (len(bracket) - 1) != 0:
+        raise BracketException(
+            f"Bracket size must be a power of two, {len(bracket)} given."
+        )
+    unknown_teams = set(bracket) - set(team_strengths.index)
+    if len(unknown_teams) > 0:
+        raise BracketException(f"No strength for teams {sorted(unknown_teams)}.")
+
+    # Only the bracket's teams are drawn. Teams are seeded by expected
+    # strength, the better seed having home ice
+    teams = team_strengths.loc[list(bracket)]
+    seed_rank = np.argsort(np.argsort(-teams["strength_mean"].to_numpy()))
+    shard_args = (
+        teams["strength_mean"].to_numpy(dtype=float),
+        teams["strength_sd"].to_numpy(dtype=float),
+        np.arange(len(bracket)),
+        seed_rank,
+    )
+    strength_scale = get_strength_scale(team_strengths, game_logit_per_sd)
+
+    # Every shard has its own independent stream of draws, and at least one
+    # simulation
+    n_jobs = max(1, min(n_jobs, n_sims))
+    shard_sims = [len(s) for s in np.array_split(np.arange(n_sims), n_jobs)]
+    seeds = np.random.SeedSequence(seed).spawn(n_jobs)
+    shard_calls = [
+        (*shard_args, sims, s, strength_scale, home_ice_logit)
+        for sims, s in zip(shard_sims, seeds)
+    ]
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            shards = list(executor.map(simulate_bracket_shard, *zip(*shard_calls)))
+    else:
+        shards = [simulate_bracket_shard(*shard_calls[0])]
+    round_counts = sum(counts for counts, _ in shards)
+    champions = np.concatenate([c for _, c in shards])
+
+    round_names = [f"reach_round_{r}" for r in range(1, round_counts.shape[1])]
+    odds = pd.DataFrame(
+        round_counts[:, 1:] / n_sims,
+        index=teams.index,
+        columns=[*round_names[1:], "champion"],
+    )
+    odds.insert(0, "seed", seed_rank + 1)
+    odds.insert(1, "strength_mean", teams["strength_mean"])
+    odds.insert(2, "strength_sd", teams["strength_sd"])
+    odds["champion_standard_error"] = np.sqrt(
+        odds["champion"] * (1 - odds["champion"]) / n_sims
+    )
+
+    return {
+        "teams": odds.sort_values(by="champion", ascending=False),
+        "convergence": get_convergence(champions, len(bracket)),
+        "seconds": time.perf_counter() - start_time,
+    }
+
+
+def simulate_series(
+    team_strengths: pd.DataFrame,
+    home_team: str,
+    away_team: str,
+    n_sims: int = 100_000,
+    seed: int = 0,
+    home_ice_logit: float = HOME_ICE_LOGIT,
+    game_logit_per_sd: float = GAME_LOGIT_PER_SD,
+) -> dict:
+    """Monte Carlo simulation of one best of seven series.
+
+    Args:
+        team_strengths (pd.DataFrame): Output of get_team_strengths.
+        home_team (str): Team with home ice.
+        away_team (str): Other team.
+        n_sims (int, optional): Simulations. Defaults to 100,000.
+        seed (int, optional): Random seed. Defaults to 0.
+        home_ice_logit (float, optional): Home game win log odds. Defaults
+            to HOME_ICE_LOGIT.
+        game_logit_per_sd (float, optional): Game win log odds per league
+            standard deviation of strength. Defaults to GAME_LOGIT_PER_SD.
+
+    Returns:
+        dict: Series win odds of the home ice team with its standard error,
+            and the odds of the series going 4 to 7 games.
+    """
+    rng = np.random.default_rng(seed)
+    strength_scale = get_strength_scale(team_strengths, game_logit_per_sd)
+
+    def draw(team: str) -> np.ndarray:
+        return team_strengths.loc[team, "strength_mean"] + team_strengths.loc[
+            team, "strength_sd"
+        ] * rng.standard_normal(n_sims)
+
+    home_won, games = simulate_series_wins(
+        draw(home_team), draw(away_team), rng, strength_scale, home_ice_logit
+    )
+    win_odds = home_won.mean()
+    return {
+        "home_team": home_team,
+        "away_team": away_team,
+        "home_win_odds": win_odds,
+        "standard_error": np.sqrt(win_odds * (1 - win_odds) / n_sims),
+        "games": pd.Series(
+            np.bincount(games, minlength=len(HOME_GAMES) + 1)[WINS_NEEDED:] / n_sims,
+            index=range(WINS_NEEDED, len(HOME_GAMES) + 1),
+            name="odds",
+        ),
+    }
+
+
+def get_simulation_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Simulate playoff series from a batch's predictions."
+    )
+    parser.add_argument("--action-date", default="2024-06-29", help="YYYY-MM-DD")
+    parser.add_argument("--sims", type=int, default=100_000)
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="Processes to shard the sims across"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--bracket", nargs="+", help="Teams in bracket order, defaults to the best 16"
+    )
+    parser.add_argument(
+        "--series", nargs=2, metavar=("HOME", "AWAY"), help="Simulate one series"
+    )
+    return parser
+
+
+def run_simulation(args: argparse.Namespace):
+    pipeline_folder_path = os.path.join(
+        PIPELINE_RESULTS_PATH, f"batch_{args.action_date}"
+    )
+    team_strengths = get_team_strengths(get_batch_analysis_data(pipeline_folder_path))
+
+    if args.series is not None:
+        result = simulate_series(
+            team_strengths, *args.series, n_sims=args.sims, seed=args.seed
+        )
+        print(
+            f"{result['home_team']} beats {result['away_team']}: "
+            f"{result['home_win_odds']:.1%} (+/- {result['standard_error']:.2%})"
+        )
+        print(result["games"].to_string())
+        return
+
+    result = simulate_playoffs(
+        team_strengths,
+        bracket=args.bracket,
+        n_sims=args.sims,
+        n_jobs=args.jobs,
+        seed=args.seed,
+    )
+    print(result["teams"].to_string())
+    print(result["convergence"].to_string(index=False))
+    print(f"{args.sims} simulations in {result['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    run_simulation(get_simulation_parser().parse_args())
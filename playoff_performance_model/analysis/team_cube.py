@@ -0,0 +1,232 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from common_functions.columnar_store import read_artifact, write_artifact
+from playoff_performance_model.analysis.analysis_data import get_batch_analysis_data
+from playoff_performance_model.analysis.contract_crosswalk import get_source_hash
+from playoff_performance_model.pipeline.batch_artifacts import get_batch_frame_path
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+PIPELINE_RESULTS_PATH = os.path.join(DIRNAME, "../pipeline_results")
+TEAM_CUBE_PATH = os.path.join(PIPELINE_RESULTS_PATH, "team_cube.colz")
+
+CUBE_KEYS = ["action_date", "team", "position"]
+# Position of the team totals over every position
+ALL_POSITIONS = "ALL"
+PERCENTILES = [10, 50, 90]
+
+
+def aggregate_team_metrics(
+    data: pd.DataFrame, percentiles: list = PERCENTILES
+) -> pd.DataFrame:
+    """Every team metric by team and position (and over all positions) in a
+    single sort of the players. Metrics skip missing values like pandas
+    groupby does.
+
+    Args:
+        data (pd.DataFrame): Batch analysis data with team, position,
+            prediction, current_cap_hit and pred_gs_toi_cap_hit columns.
+        percentiles (list, optional): Prediction percentiles. Defaults to
+            [10, 50, 90].
+
+    Returns:
+        pd.DataFrame: Metrics indexed by team and position.
+    """
+    # Players without a team are left out, as with a groupby on team
+    data = data.loc[data["team"].notna()]
+
+    # Every player counts for its position and for the team total
+    teams = np.concatenate([data["team"].to_numpy()] * 2).astype(str)
+    positions = np.concatenate(
+        [
+            data["position"].fillna(ALL_POSITIONS).to_numpy(),
+            np.full(data.shape[0], ALL_POSITIONS),
+        ]
+    ).astype(str)
+    group_codes, groups = pd.factorize(
+        pd.MultiIndex.from_arrays([teams, positions], names=["team", "position"])
+    )
+    # Players without a position are only in the team total
+    keep = (positions != ALL_POSITIONS) | (np.arange(len(positions)) >= data.shape[0])
+    group_codes = group_codes[keep]
+
+    prediction = np.tile(data["prediction"].to_numpy(dtype=float), 2)[keep]
+    cap_hit = np.tile(data["current_cap_hit"].to_numpy(dtype=float), 2)[keep]
+    gs_cap_hit = np.tile(data["pred_gs_toi_cap_hit"].to_numpy(dtype=float), 2)[keep]
+
+    # One sort by group then prediction, every metric is a segment reduction
+    order = np.lexsort((prediction, group_codes))
+    group_codes = group_codes[order]
+    prediction, cap_hit, gs_cap_hit = (
+        prediction[order],
+        cap_hit[order],
+        gs_cap_hit[order],
+    )
+    starts = np.flatnonzero(np.diff(group_codes, prepend=-1))
+    counts = np.diff(np.append(starts, len(group_codes)))
+
+    def segment_nansum(values: np.ndarray) -> tuple:
+        present = ~np.isnan(values)
+        sums = np.add.reduceat(np.where(present, values, 0), starts)
+        return sums, np.add.reduceat(present.astype(int), starts)
+
+    prediction_sum, prediction_count = segment_nansum(prediction)
+    cap_hit_sum, contract_count = segment_nansum(cap_hit)
+    gs_cap_hit_sum, gs_cap_hit_count = segment_nansum(gs_cap_hit)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        metrics = pd.DataFrame(
+            {
+                "players": counts,
+                "players_with_contract": contract_count,
+                "prediction_sum": prediction_sum,
+                "prediction_mean": prediction_sum / prediction_count,
+                "cap_hit_sum": cap_hit_sum,
+                "pred_gs_toi_cap_hit_sum": gs_cap_hit_sum,
+                "pred_gs_toi_cap_hit_mean": gs_cap_hit_sum / gs_cap_hit_count,
+            },
+            index=pd.MultiIndex.from_tuples(
+                groups[group_codes[starts]], names=["team", "position"]
+            ),
+        )
+
+    # Percentiles from the sorted predictions of each group (missing last),
+    # interpolated like np.percentile
+    for percentile in percentiles:
+        position = starts + (prediction_count - 1) * percentile / 100
+        lower = np.floor(position).astype(int)
+        upper = np.minimum(lower + 1, starts + prediction_count - 1)
+        fraction = position - lower
+        lower_values = prediction[np.maximum(lower, starts)]
+        upper_values = prediction[np.maximum(upper, starts)]
+        values = lower_values * (1 - fraction) + upper_values * fraction
+        metrics[f"prediction_p{percentile:02d}"] = np.where(
+            prediction_count > 0, values, np.nan
+        )
+
+    return metrics.sort_index()
+
+
+def get_batch_paths(pipeline_results_path: str = PIPELINE_RESULTS_PATH) -> list:
+    return sorted(
+        os.path.join(pipeline_results_path, f)
+        for f in os.listdir(pipeline_results_path)
+        if f.startswith("batch_")
+        and os.path.isdir(os.path.join(pipeline_results_path, f))
+    )
+
+
+def update_team_cube(
+    pipeline_results_path: str = PIPELINE_RESULTS_PATH, cube_path: str = None
+) -> pd.DataFrame:
+    """Add the team metrics of every new or rescored batch to the saved team
+    cube. Batches whose scored data and contract data are unchanged since
+    they were added are not read.
+
+    Args:
+        pipeline_results_path (str, optional): Folder of the batches.
+            Defaults to pipeline_results.
+        cube_path (str, optional): Saved cube. Defaults to team_cube.colz in
+            the pipeline results folder.
+
+    Returns:
+        pd.DataFrame: Cube indexed by action date, team and position.
+    """
+    if cube_path is None:
+        cube_path = os.path.join(pipeline_results_path, "team_cube.colz")
+    cube = read_artifact(cube_path) if os.path.exists(cube_path) else None
+    contract_hash = get_source_hash()
+
+    new_cubes = []
+    for pipeline_folder_path in get_batch_paths(pipeline_results_path):
+        try:
+            scored_data_path = get_batch_frame_path(pipeline_folder_path, "scored_data")
+        except FileNotFoundError:
+            continue
+        batch_name = os.path.basename(pipeline_folder_path)
+        source_mtime = os.path.getmtime(scored_data_path)
+
+        if cube is not None:
+            batch_cube = cube.loc[cube["batch_name"] == batch_name]
+            if (
+                batch_cube.shape[0] > 0
+                and (batch_cube["source_mtime"] == source_mtime).all()
+                and (batch_cube["contract_hash"] == contract_hash).all()
+            ):
+                continue
+            cube = cube.loc[cube["batch_name"] != batch_name]
+
+        data = get_batch_analysis_data(pipeline_folder_path)
+        batch_cube = aggregate_team_metrics(data).reset_index()
+        batch_cube.insert(0, "action_date", str(data["action_date"].iloc[0]))
+        batch_cube["batch_name"] = batch_name
+        batch_cube["source_mtime"] = source_mtime
+        batch_cube["contract_hash"] = contract_hash
+        new_cubes.append(batch_cube)
+
+    if len(new_cubes) > 0:
+        cube = pd.concat(([] if cube is None else [cube]) + new_cubes)
+        cube = cube.sort_values(by=CUBE_KEYS).reset_index(drop=True)
+        write_artifact(cube, cube_path)
+    if cube is None:
+        return pd.DataFrame(columns=CUBE_KEYS).set_index(CUBE_KEYS)
+    return cube.set_index(CUBE_KEYS)
+
+
+class TeamCube:
+    """Cross batch team queries answered from the saved team cube only."""
+
+    def __init__(self, cube_path: str = TEAM_CUBE_PATH):
+        self.cube = read_artifact(cube_path).set_index(CUBE_KEYS).sort_index()
+
+    @property
+    def action_dates(self) -> list:
+        return list(self.cube.index.unique("action_date"))
+
+    def rank_teams(
+        self,
+        action_date: str,
+        metric: str = "prediction_sum",
+        position: str = ALL_POSITIONS,
+        ascending: bool = False,
+    ) -> pd.Series:
+        return self.cube.xs((action_date, position), level=["action_date", "position"])[
+            metric
+        ].sort_values(ascending=ascending)
+
+    def team_history(
+        self, team: str, metric: str = "prediction_sum", position: str = None
+    ) -> pd.DataFrame:
+        # Metric by action date, one column per position
+        history = self.cube.xs(team, level="team")[metric].unstack("position")
+        return history if position is None else history.loc[:, [position]]
+
+    def compare_action_dates(
+        self,
+        action_date_1: str,
+        action_date_2: str,
+        metric: str = "prediction_sum",
+        position: str = ALL_POSITIONS,
+    ) -> pd.DataFrame:
+        comparison = pd.concat(
+            [
+                self.rank_teams(action_date_1, metric, position).rename(action_date_1),
+                self.rank_teams(action_date_2, metric, position).rename(action_date_2),
+            ],
+            axis=1,
+        )
+        comparison["change"] = comparison[action_date_2] - comparison[action_date_1]
+        return comparison.sort_values(by=["change"], ascending=False)
+
+
+if __name__ == "__main__":
+    update_team_cube()
+
+    team_cube = TeamCube()
+    print(team_cube.rank_teams("2024-06-29", "prediction_mean"))
+    print(team_cube.team_history("TOR", "prediction_sum"))
+    print(team_cube.compare_action_dates("2023-06-28", "2024-06-29"))
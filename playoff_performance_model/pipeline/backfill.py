@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from collect_data.read_local_data import read_in_all_mp_data
+from common_functions.profiling import profile_run, profile_stage
+from playoff_performance_model.pipeline.batch_artifacts import save_batch_frame
+from playoff_performance_model.pipeline.create_batch_data import (
+    get_nhl_api_roster_batch_data,
+    get_season_from_action_date,
+)
+from playoff_performance_model.pipeline.feature_store import (
+    PlayerFeatureStore,
+    select_batch_features,
+)
+from playoff_performance_model.pipeline.model_registry import get_model_path
+from playoff_performance_model.pipeline.score import MODEL_REGISTRY
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+PIPELINE_RESULTS_PATH = os.path.join(DIRNAME, "../pipeline_results")
+MP_DATA_PATH = os.path.join(DIRNAME, "../../data/moneypuck")
+
+# Marks a batch folder as built by the backfill
+BACKFILL_INFO_FILENAME = "backfill.json"
+
+# Shared backfill state, inherited by forked worker processes
+_BACKFILL = None
+
+
+def get_latest_input_mtime(model_version: str) -> float:
+    # Batches depend on the MoneyPuck data, the bio data and the model
+    input_paths = [
+        os.path.join(MP_DATA_PATH, "player_biography_data.csv"),
+        os.path.join(get_model_path(model_version), "model.json"),
+    ]
+    player_data_path = os.path.join(MP_DATA_PATH, "player_data")
+    input_paths += [
+        os.path.join(player_data_path, f) for f in os.listdir(player_data_path)
+    ]
+    return max(os.path.getmtime(p) for p in input_paths)
+
+
+def write_backfill_info(pipeline_folder_path: str, model_version: str, complete: bool):
+    with open(os.path.join(pipeline_folder_path, BACKFILL_INFO_FILENAME), "w") as f:
+        json.dump({"model_version": model_version, "complete": complete}, f)
+
+
+def get_batch_status(
+    pipeline_folder_path: str, model_version: str, latest_input_mtime: float
+) -> str:
+    """Whether the backfill should build a batch.
+
+    Returns:
+        str: "missing" when there is no batch, "unmarked" when it was built
+            outside the backfill (e.g. by create_batch_data), "current" when
+            backfilled with the model version after the last input change
+            and "stale" otherwise.
+    """
+    if not os.path.exists(pipeline_folder_path):
+        return "missing"
+    backfill_info_path = os.path.join(pipeline_folder_path, BACKFILL_INFO_FILENAME)
+    if not os.path.exists(backfill_info_path):
+        return "unmarked"
+    with open(backfill_info_path) as f:
+        backfill_info = json.load(f)
+    if (
+        backfill_info.get("complete", False)
+        and backfill_info["model_version"] == model_version
+        and os.path.getmtime(backfill_info_path) >= latest_input_mtime
+    ):
+        return "current"
+    return "stale"
+
+
+class BatchBackfill:
+    """Shared data and model for building and scoring many batches."""
+
+    def __init__(
+        self,
+        model_version: str,
+        nhl_rosters_flag: bool = False,
+        sample_profile: bool = False,
+    ):
+        self.model_version = model_version
+        self.nhl_rosters_flag = nhl_rosters_flag
+        self.sample_profile = sample_profile
+        self.feature_store = PlayerFeatureStore()
+        self.model = MODEL_REGISTRY.get_model(model_version)
+
+        # Players per season if not using NHL rosters
+        mp_regular_data = read_in_all_mp_data("regular")
+        self.mp_players = mp_regular_data.loc[
+            mp_regular_data["situation"] == "all",
+            ["playerId", "season", "name", "team"],
+        ].drop_duplicates(subset=["playerId", "season"])
+
+    def get_batch_data(self, action_date: str) -> pd.DataFrame:
+        season = int(get_season_from_action_date(action_date))
+        if self.nhl_rosters_flag:
+            batch_data = get_nhl_api_roster_batch_data(season)
+        else:
+            batch_data = self.mp_players.loc[self.mp_players["season"] == season]
+
+        batch_data = batch_data.loc[batch_data["playerId"].notna()].copy()
+        batch_data["playerId"] = batch_data["playerId"].astype(int)
+        batch_data = batch_data.rename(columns={"season": "action_season"})
+        batch_data["action_date"] = action_date
+        return batch_data.reset_index(drop=True)
+
+    def run_batch(self, action_date: str) -> dict:
+        """Build, score and save the batch for an action date. Features
+        come from the shared feature store with the rows and columns
+        create_batch_data keeps.
+
+        Args:
+            action_date (str): Action date (YYYY-MM-DD).
+
+        Returns:
+            dict: Row count and timings of the batch.
+        """
+        start_time = time.perf_counter()
+        pipeline_folder_path = os.path.join(
+            PIPELINE_RESULTS_PATH, f"batch_{action_date}"
+        )
+        Path(pipeline_folder_path).mkdir(parents=True, exist_ok=True)
+        # Marked before anything is written, so a failed batch is rebuilt
+        write_backfill_info(pipeline_folder_path, self.model_version, False)
+
+        # Each batch has its own run report, also in forked workers
+        with profile_run("backfill", sample_profile=self.sample_profile) as run:
+            # Save batch data
+            with profile_stage("batch_data") as stage:
+                batch_data = self.get_batch_data(action_date)
+                save_batch_frame(batch_data, pipeline_folder_path, "batch_data")
+                stage.rows_out = batch_data.shape[0]
+
+            # Get features for each player, same selection as create_batch_data
+            with profile_stage("feature_data", rows_in=batch_data.shape[0]) as stage:
+                feature_data = select_batch_features(
+                    self.feature_store.get_features(
+                        batch_data.loc[:, ["playerId", "action_season", "action_date"]]
+                    )
+                )
+                save_batch_frame(feature_data, pipeline_folder_path, "feature_data")
+                stage.rows_out = feature_data.shape[0]
+            features_seconds = time.perf_counter() - start_time
+
+            # Score players, same layout as score_players
+            with profile_stage("score", rows_in=feature_data.shape[0]) as stage:
+                scored_data = feature_data.loc[
+                    :, ["playerId", "action_season", "action_date"]
+                ].assign(prediction=self.model.predict(feature_data))
+                scored_data = pd.concat(
+                    [scored_data, feature_data.loc[:, self.model.feature_names]],
+                    axis=1,
+                )
+                save_batch_frame(scored_data, pipeline_folder_path, "scored_data")
+                stage.rows_out = scored_data.shape[0]
+        run.write_report(
+            pipeline_folder_path,
+            extra={"action_date": action_date, "model_version": self.model_version},
+        )
+
+        # Marks the batch as current for this model version
+        write_backfill_info(pipeline_folder_path, self.model_version, True)
+
+        return {
+            "action_date": action_date,
+            "status": "built",
+            "rows": scored_data.shape[0],
+            "features_seconds": features_seconds,
+            "total_seconds": time.perf_counter() - start_time,
+        }
+
+
+def run_backfill_batch(action_date: str) -> dict:
+    return _BACKFILL.run_batch(action_date)
+
+
+def backfill_batches(
+    action_dates: list,
+    model_version: str,
+    nhl_rosters_flag: bool = False,
+    max_workers: int = None,
+    force: bool = False,
+    sample_profile: bool = False,
+) -> pd.DataFrame:
+    """Build and score the batch of every action date in parallel. Player
+    data and the model are loaded once and shared by all batches. Batches
+    already built with the same model version after the last input change
+    are skipped, and batches not built by the backfill are only overwritten
+    with force.
+
+    Args:
+        action_dates (list): Action dates (YYYY-MM-DD).
+        model_version (str): Model version to score with.
+        nhl_rosters_flag (bool, optional): Use NHL API rosters instead of
+            MoneyPuck players. Defaults to False.
+        max_workers (int, optional): Batches built at once. Defaults to the
+            number of cores.
+        force (bool, optional): Rebuild current batches and batches built
+            outside the backfill (e.g. by create_batch_data). Defaults to
+            False.
+        sample_profile (bool, optional): Save a sampling profile of the
+            slowest stage with each batch's run report. Defaults to False.
+
+    Returns:
+        pd.DataFrame: Status and timings per action date.
+    """
+    start_time = time.perf_counter()
+    latest_input_mtime = get_latest_input_mtime(model_version)
+
+    batch_status = {
+        d: get_batch_status(
+            os.path.join(PIPELINE_RESULTS_PATH, f"batch_{d}"),
+            model_version,
+            latest_input_mtime,
+        )
+        for d in action_dates
+    }
+    # Batches built outside the backfill are left as they are unless forced
+    kept = [
+        d for d, status in batch_status.items() if status == "unmarked" and not force
+    ]
+    skipped = [
+        d for d, status in batch_status.items() if status == "current" and not force
+    ]
+    to_build = [d for d in action_dates if d not in kept and d not in skipped]
+
+    results = [{"action_date": d, "status": "skipped"} for d in skipped]
+    results += [{"action_date": d, "status": "not backfilled, use force"} for d in kept]
+    if len(to_build) > 0:
+        if max_workers is None:
+            max_workers = min(len(to_build), os.cpu_count() or 1)
+
+        global _BACKFILL
+        _BACKFILL = BatchBackfill(model_version, nhl_rosters_flag, sample_profile)
+        print(f"Loaded shared data in {time.perf_counter() - start_time:.2f}s")
+
+        # Forked workers share the loaded data without copying or pickling it
+        # Fall back to threads where fork is not available
+        if "fork" in multiprocessing.get_all_start_methods():
+            executor = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context("fork")
+            )
+        else:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+        with executor:
+            results += list(executor.map(run_backfill_batch, to_build))
+
+    results = pd.DataFrame(results).sort_values(by=["action_date"])
+    print(results.to_string(index=False))
+    print(f"Total time: {time.perf_counter() - start_time:.2f}s")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill batches for action dates.")
+    parser.add_argument("--dates", nargs="*", default=[], help="YYYY-MM-DD dates")
+    parser.add_argument("--start-date", help="First date of a date range")
+    parser.add_argument("--end-date", help="Last date of a date range")
+    parser.add_argument("--freq", default="YS-JUL", help="Pandas date range freq")
+    parser.add_argument("--model-version", default="version_2")
+    parser.add_argument("--nhl-rosters", action="store_true")
+    parser.add_argument("--max-workers", type=int, default=None)
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Also rebuild current batches and batches built by create_batch_data",
+    )
+    parser.add_argument("--sample-profile", action="store_true")
+    args = parser.parse_args()
+
+    action_dates = list(args.dates)
+    if args.start_date is not None:
+        action_dates += [
+            d.strftime("%Y-%m-%d")
+            for d in pd.date_range(args.start_date, args.end_date, freq=args.freq)
+        ]
+
+    backfill_batches(
+        sorted(set(action_dates)),
+        args.model_version,
+        nhl_rosters_flag=args.nhl_rosters,
+        max_workers=args.max_workers,
+        force=args.force,
+        sample_profile=args.sample_profile,
+    )
@@ -0,0 +1,180 @@
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from common_functions.columnar_store import read_artifact, write_artifact
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+# Extension of the compressed columnar frames in a batch folder
+ARTIFACT_EXTENSION = ".colz"
+
+
+def get_artifact_path(pipeline_folder_path: str, name: str) -> str:
+    return os.path.join(pipeline_folder_path, f"{name}{ARTIFACT_EXTENSION}")
+
+
+def get_batch_frame_path(pipeline_folder_path: str, name: str) -> str:
+    # Batches saved before the columnar artifacts have a pickle or CSV file
+    for path in [
+        get_artifact_path(pipeline_folder_path, name),
+        os.path.join(pipeline_folder_path, f"{name}.pkl"),
+        os.path.join(pipeline_folder_path, f"{name}.csv"),
+    ]:
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"No {name} saved in {pipeline_folder_path}.")
+
+
+def save_batch_frame(
+    data: pd.DataFrame, pipeline_folder_path: str, name: str, csv_export: bool = False
+) -> str:
+    """Save a batch frame (e.g. batch_data, feature_data, scored_data) as a
+    compressed columnar artifact.
+
+    Args:
+        data (pd.DataFrame): Frame to save.
+        pipeline_folder_path (str): Batch folder.
+        name (str): Name of the frame.
+        csv_export (bool, optional): Also save a CSV copy for reading by
+            hand. Defaults to False.
+
+    Returns:
+        str: Path of the artifact.
+    """
+    artifact_path = get_artifact_path(pipeline_folder_path, name)
+    write_artifact(data, artifact_path)
+    if csv_export:
+        data.to_csv(os.path.join(pipeline_folder_path, f"{name}.csv"))
+    return artifact_path
+
+
+def read_batch_frame(
+    pipeline_folder_path: str,
+    name: str,
+    columns: list = None,
+    start: int = 0,
+    stop: int = None,
+) -> pd.DataFrame:
+    """Read selected columns and rows of a batch frame. Batches saved before
+    the columnar artifacts are read from their pickle or CSV file.
+
+    Args:
+        pipeline_folder_path (str): Batch folder.
+        name (str): Name of the frame.
+        columns (list, optional): Columns to read. Defaults to all columns.
+        start (int, optional): First row to read. Defaults to 0.
+        stop (int, optional): Row to stop before. Defaults to the last row.
+
+    Raises:
+        FileNotFoundError: The batch has no frame with the name.
+
+    Returns:
+        pd.DataFrame: Requested data.
+    """
+    path = get_batch_frame_path(pipeline_folder_path, name)
+    if path.endswith(ARTIFACT_EXTENSION):
+        return read_artifact(path, columns=columns, start=start, stop=stop)
+
+    if path.endswith(".pkl"):
+        data = pd.read_pickle(path)
+    else:
+        data = pd.read_csv(path, index_col=0)
+
+    data = data.iloc[start:stop]
+    return data if columns is None else data.loc[:, columns]
+
+
+def benchmark_batch_artifacts(pipeline_folder_path: str) -> pd.DataFrame:
+    """Compare the artifact with the CSV and pickle pair written today for
+    each frame of a batch: write time, read time and disk usage. Files are
+    written to a temporary folder.
+
+    Args:
+        pipeline_folder_path (str): Batch folder.
+
+    Returns:
+        pd.DataFrame: Timings (seconds) and sizes (bytes) per frame and format.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        for name in ["batch_data", "feature_data", "scored_data"]:
+            try:
+                data = read_batch_frame(pipeline_folder_path, name)
+            except FileNotFoundError:
+                continue
+            csv_path = os.path.join(tmp_folder, f"{name}.csv")
+            pickle_path = os.path.join(tmp_folder, f"{name}.pkl")
+            artifact_path = get_artifact_path(tmp_folder, name)
+
+            start_time = time.perf_counter()
+            data.to_csv(csv_path)
+            data.to_pickle(pickle_path)
+            csv_pickle_write = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            save_batch_frame(data, tmp_folder, name)
+            artifact_write = time.perf_counter() - start_time
+
+            # batch_analysis reads CSVs, the pipeline reads pickles
+            start_time = time.perf_counter()
+            pd.read_csv(csv_path, index_col=0)
+            csv_read = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            pd.read_pickle(pickle_path)
+            pickle_read = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            read_batch_frame(tmp_folder, name)
+            artifact_read = time.perf_counter() - start_time
+
+            # Reading a few columns, e.g. identifiers and the prediction. The
+            # CSV still parses every line, a pickle is always read whole
+            start_time = time.perf_counter()
+            pd.read_csv(csv_path, index_col=0, usecols=range(5))
+            csv_read_columns = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            read_batch_frame(tmp_folder, name, columns=list(data.columns[:4]))
+            artifact_read_columns = time.perf_counter() - start_time
+
+            results += [
+                {
+                    "frame": name,
+                    "format": "csv + pkl",
+                    "rows": data.shape[0],
+                    "columns": data.shape[1],
+                    "write_seconds": csv_pickle_write,
+                    "read_seconds": csv_read,
+                    "read_4_columns_seconds": csv_read_columns,
+                    "bytes": os.path.getsize(csv_path) + os.path.getsize(pickle_path),
+                },
+                {
+                    "frame": name,
+                    "format": "pkl read",
+                    "rows": data.shape[0],
+                    "columns": data.shape[1],
+                    "read_seconds": pickle_read,
+                    "read_4_columns_seconds": pickle_read,
+                },
+                {
+                    "frame": name,
+                    "format": "artifact",
+                    "rows": data.shape[0],
+                    "columns": data.shape[1],
+                    "write_seconds": artifact_write,
+                    "read_seconds": artifact_read,
+                    "read_4_columns_seconds": artifact_read_columns,
+                    "bytes": os.path.getsize(artifact_path),
+                },
+            ]
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    for batch_name in ["batch_2023-06-28", "batch_2024-06-29"]:
+        pipeline_folder_path = os.path.join(DIRNAME, "../pipeline_results", batch_name)
+        print(f"\n{batch_name}")
+        print(benchmark_batch_artifacts(pipeline_folder_path).to_string(index=False))
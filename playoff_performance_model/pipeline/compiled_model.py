@@ -0,0 +1,429 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+# Name of the compiled model file saved next to model.json
+COMPILED_MODEL_FILENAME = "model_forest.npz"
+# Compiled files of an older format are recompiled on load
+COMPILED_MODEL_FORMAT = 2
+
+# Objectives whose prediction is the raw margin (no link function)
+IDENTITY_OBJECTIVES = [
+    "reg:squarederror",
+    "reg:squaredlogerror",
+    "reg:pseudohubererror",
+    "reg:absoluteerror",
+]
+
+
+class UnsupportedModelException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+class CompiledForest:
+    """Array based tree ensemble compiled from an XGBoost model.json.
+
+    All trees are stored in flat node arrays. Child indices are global
+    positions in those arrays and leaf nodes point back to themselves, so
+    every tree can be walked at the same time for a batch of rows.
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        default_left: np.ndarray,
+        leaf_value: np.ndarray,
+        tree_roots: np.ndarray,
+        max_depth: int,
+        base_score: float,
+        feature_names: list,
+        node_value: np.ndarray = None,
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.leaf_value = leaf_value
+        self.tree_roots = tree_roots
+        self.max_depth = max_depth
+        self.base_score = base_score
+        self.feature_names = feature_names
+        # Expected value of each node, used for feature contributions
+        self.node_value = node_value
+
+    @property
+    def num_trees(self) -> int:
+        return len(self.tree_roots)
+
+    def with_feature_order(self, feature_names: list) -> "CompiledForest":
+        """Get the same forest reading its features from a matrix with the
+        given column order, e.g. the union of several models' features.
+
+        Args:
+            feature_names (list): Column order of the matrices to predict on.
+
+        Returns:
+            CompiledForest: Forest sharing the node arrays of this one.
+        """
+        positions = np.array([feature_names.index(c) for c in self.feature_names])
+        return CompiledForest(
+            feature=positions[self.feature].astype(np.int32),
+            threshold=self.threshold,
+            left=self.left,
+            right=self.right,
+            default_left=self.default_left,
+            leaf_value=self.leaf_value,
+            tree_roots=self.tree_roots,
+            max_depth=self.max_depth,
+            base_score=self.base_score,
+            feature_names=list(feature_names),
+            node_value=self.node_value,
+        )
+
+    def predict_leaves(self, X: np.ndarray) -> np.ndarray:
+        """Get the leaf node index reached in every tree for every row.
+
+        Args:
+            X (np.ndarray): Feature matrix in model feature order.
+
+        Returns:
+            np.ndarray: Global leaf node indices, shape (rows, trees).
+        """
+        # XGBoost compares features as 32 bit floats
+        X = np.asarray(X, dtype=np.float32)
+        row_idx = np.arange(X.shape[0])[:, None]
+
+        # Start every row at the root of every tree
+        nodes = np.broadcast_to(self.tree_roots, (X.shape[0], self.num_trees))
+        for _ in range(self.max_depth):
+            x = X[row_idx, self.feature[nodes]]
+            # Missing values follow the default direction of the split
+            go_left = np.where(
+                np.isnan(x), self.default_left[nodes], x < self.threshold[nodes]
+            )
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict(self, X, batch_size: int = 4096) -> np.ndarray:
+        """Predict with the compiled forest.
+
+        Args:
+            X (pd.DataFrame | np.ndarray): Feature data. DataFrames are
+                reordered to the model's feature names.
+            batch_size (int, optional): Rows evaluated at once. Bounds the
+                (rows, trees) working arrays. Defaults to 4096.
+
+        Returns:
+            np.ndarray: Predictions, one per row.
+        """
+        if isinstance(X, pd.DataFrame):
+            X = X.loc[:, self.feature_names].to_numpy(dtype=np.float32)
+
+        predictions = np.empty(X.shape[0], dtype=np.float32)
+        for start in range(0, X.shape[0], batch_size):
+            leaves = self.predict_leaves(X[start : start + batch_size])
+            margin = self.leaf_value[leaves].sum(axis=1, dtype=np.float64)
+            predictions[start : start + batch_size] = margin + self.base_score
+        return predictions
+
+    def predict_contributions(self, X, batch_size: int = 1024) -> np.ndarray:
+        """Per feature contributions to each prediction. Every split on a
+        row's path credits its feature with the change in the node's
+        expected value (same as XGBoost's approx_contribs).
+
+        Args:
+            X (pd.DataFrame | np.ndarray): Feature data.
+            batch_size (int, optional): Rows evaluated at once. Defaults to 1024.
+
+        Returns:
+            np.ndarray: Contributions, shape (rows, features + 1). The last
+                column is the bias, each row sums to its prediction.
+        """
+        if isinstance(X, pd.DataFrame):
+            X = X.loc[:, self.feature_names].to_numpy(dtype=np.float32)
+        X = np.asarray(X, dtype=np.float32)
+        num_cols = len(self.feature_names) + 1
+
+        contributions = np.zeros((X.shape[0], num_cols), dtype=np.float64)
+        # Expected value of the whole forest
+        contributions[:, -1] = self.node_value[self.tree_roots].sum() + self.base_score
+        for start in range(0, X.shape[0], batch_size):
+            X_batch = X[start : start + batch_size]
+            row_idx = np.arange(X_batch.shape[0])[:, None]
+            nodes = np.broadcast_to(self.tree_roots, (X_batch.shape[0], self.num_trees))
+
+            batch_contributions = np.zeros(X_batch.shape[0] * num_cols)
+            for _ in range(self.max_depth):
+                split_feature = self.feature[nodes]
+                x = X_batch[row_idx, split_feature]
+                go_left = np.where(
+                    np.isnan(x), self.default_left[nodes], x < self.threshold[nodes]
+                )
+                children = np.where(go_left, self.left[nodes], self.right[nodes])
+                # Leaves point to themselves, so they add nothing
+                batch_contributions += np.bincount(
+                    (row_idx * num_cols + split_feature).ravel(),
+                    weights=(
+                        self.node_value[children] - self.node_value[nodes]
+                    ).ravel(),
+                    minlength=batch_contributions.shape[0],
+                )
+                nodes = children
+            contributions[
+                start : start + batch_size, :-1
+            ] += batch_contributions.reshape(X_batch.shape[0], num_cols)[:, :-1]
+        return contributions
+
+
+class CompiledEnsemble(CompiledForest):
+    """Several compiled forests merged into one set of node arrays, so all
+    members are evaluated in a single pass. Trees of a member are contiguous,
+    member_tree_starts holds the position of each member's first tree.
+    """
+
+    def __init__(self, forests: list):
+        # Shift node indices of each member past the nodes before it
+        node_offsets = np.cumsum([0] + [len(f.feature) for f in forests[:-1]])
+        super().__init__(
+            feature=np.concatenate([f.feature for f in forests]),
+            threshold=np.concatenate([f.threshold for f in forests]),
+            left=np.concatenate([f.left + o for f, o in zip(forests, node_offsets)]),
+            right=np.concatenate([f.right + o for f, o in zip(forests, node_offsets)]),
+            default_left=np.concatenate([f.default_left for f in forests]),
+            leaf_value=np.concatenate([f.leaf_value for f in forests]),
+            tree_roots=np.concatenate(
+                [f.tree_roots + o for f, o in zip(forests, node_offsets)]
+            ),
+            max_depth=max(f.max_depth for f in forests),
+            base_score=0.0,
+            feature_names=forests[0].feature_names,
+            node_value=np.concatenate([f.node_value for f in forests]),
+        )
+        self.member_tree_starts = np.cumsum([0] + [f.num_trees for f in forests[:-1]])
+        self.member_base_scores = np.array([f.base_score for f in forests])
+
+    @property
+    def num_members(self) -> int:
+        return len(self.member_tree_starts)
+
+    def predict_members(self, X, batch_size: int = 1024) -> np.ndarray:
+        """Predict with every ensemble member.
+
+        Args:
+            X (pd.DataFrame | np.ndarray): Feature data.
+            batch_size (int, optional): Rows evaluated at once. Defaults to 1024.
+
+        Returns:
+            np.ndarray: Predictions, shape (rows, members).
+        """
+        if isinstance(X, pd.DataFrame):
+            X = X.loc[:, self.feature_names].to_numpy(dtype=np.float32)
+
+        predictions = np.empty((X.shape[0], self.num_members), dtype=np.float32)
+        for start in range(0, X.shape[0], batch_size):
+            leaves = self.predict_leaves(X[start : start + batch_size])
+            # Sum the leaf values of each member's trees
+            margin = np.add.reduceat(
+                self.leaf_value[leaves].astype(np.float64),
+                self.member_tree_starts,
+                axis=1,
+            )
+            predictions[start : start + batch_size] = margin + self.member_base_scores
+        return predictions
+
+    def predict(self, X, batch_size: int = 1024) -> np.ndarray:
+        # Point prediction of the ensemble is the mean of its members
+        return self.predict_members(X, batch_size).mean(axis=1)
+
+
+def parse_base_score(base_score: str) -> float:
+    # Newer XGBoost versions store base_score as a vector, e.g. "[5.8E2]"
+    return float(base_score.strip("[]").split(",")[0])
+
+
+def compile_model(model_path: str) -> str:
+    """Compile models/<version>/model.json into a flat array forest.
+
+    Args:
+        model_path (str): Folder of the model version.
+
+    Raises:
+        UnsupportedModelException: Model is not a single target gbtree
+            regressor with numerical splits, or has no feature names.
+
+    Returns:
+        str: Filepath of the compiled model.
+    """
+    with open(os.path.join(model_path, "model.json")) as f:
+        learner = json.load(f)["learner"]
+
+    # Only plain regression tree boosters are supported
+    objective = learner["objective"]["name"]
+    if objective not in IDENTITY_OBJECTIVES:
+        raise UnsupportedModelException(
+            f"Objective must be in {IDENTITY_OBJECTIVES}. {objective} given."
+        )
+    booster = learner["gradient_booster"]
+    if booster["name"] != "gbtree":
+        raise UnsupportedModelException(
+            f"Booster must be gbtree. {booster['name']} given."
+        )
+    if int(learner["learner_model_param"]["num_target"]) != 1:
+        raise UnsupportedModelException("Only single target models are supported.")
+
+    # Splits refer to features by position, the names come from model.json
+    # or the feature_names.json saved next to it
+    feature_names = learner.get("feature_names") or []
+    feature_names_path = os.path.join(model_path, "feature_names.json")
+    if len(feature_names) == 0 and os.path.exists(feature_names_path):
+        with open(feature_names_path) as f:
+            feature_names = json.load(f)
+    num_features = int(learner["learner_model_param"]["num_feature"])
+    if len(feature_names) != num_features:
+        raise UnsupportedModelException(
+            f"{model_path} has {len(feature_names)} feature names for "
+            f"{num_features} features. Train the model with feature names."
+        )
+
+    # Node arrays for each tree, concatenated once all trees are read
+    features = []
+    thresholds = []
+    lefts = []
+    rights = []
+    default_lefts = []
+    leaf_values = []
+    node_values = []
+    tree_roots = []
+    max_depth = 0
+    offset = 0
+    for tree in booster["model"]["trees"]:
+        if any(split_type != 0 for split_type in tree["split_type"]):
+            raise UnsupportedModelException("Categorical splits are not supported.")
+
+        left = np.array(tree["left_children"], dtype=np.int32)
+        right = np.array(tree["right_children"], dtype=np.int32)
+        split_conditions = np.array(tree["split_conditions"], dtype=np.float32)
+        is_leaf = left == -1
+        node_ids = np.arange(len(left), dtype=np.int32)
+
+        # Leaves point back to themselves, children become global indices
+        features.append(np.where(is_leaf, 0, tree["split_indices"]))
+        thresholds.append(np.where(is_leaf, np.float32(0), split_conditions))
+        lefts.append(np.where(is_leaf, node_ids, left) + offset)
+        rights.append(np.where(is_leaf, node_ids, right) + offset)
+        default_lefts.append(np.array(tree["default_left"], dtype=bool))
+        # Leaf values are stored in split_conditions for leaf nodes
+        leaf_values.append(np.where(is_leaf, split_conditions, np.float32(0)))
+        tree_roots.append(offset)
+
+        # Expected node values, the cover weighted mean of the children
+        # Children are stored after their parents, so fill bottom up
+        sum_hessian = tree["sum_hessian"]
+        node_value = split_conditions.astype(np.float64)
+        for node in reversed(node_ids[~is_leaf]):
+            node_value[node] = (
+                sum_hessian[left[node]] * node_value[left[node]]
+                + sum_hessian[right[node]] * node_value[right[node]]
+            ) / (sum_hessian[left[node]] + sum_hessian[right[node]])
+        node_values.append(node_value)
+
+        # Depth of each node from parents, nodes are stored parent first
+        depth = np.zeros(len(left), dtype=np.int32)
+        for node, parent in enumerate(tree["parents"][1:], start=1):
+            depth[node] = depth[parent] + 1
+        max_depth = max(max_depth, int(depth.max()))
+
+        offset += len(left)
+
+    compiled_path = os.path.join(model_path, COMPILED_MODEL_FILENAME)
+    np.savez(
+        compiled_path,
+        feature=np.concatenate(features).astype(np.int32),
+        threshold=np.concatenate(thresholds).astype(np.float32),
+        left=np.concatenate(lefts).astype(np.int32),
+        right=np.concatenate(rights).astype(np.int32),
+        default_left=np.concatenate(default_lefts),
+        leaf_value=np.concatenate(leaf_values).astype(np.float32),
+        node_value=np.concatenate(node_values),
+        tree_roots=np.array(tree_roots, dtype=np.int32),
+        max_depth=np.array(max_depth),
+        base_score=np.array(
+            parse_base_score(learner["learner_model_param"]["base_score"])
+        ),
+        feature_names=np.array(feature_names),
+        format=np.array(COMPILED_MODEL_FORMAT),
+    )
+    return compiled_path
+
+
+def load_compiled_model(model_path: str) -> CompiledForest:
+    """Load the compiled forest for a model version. The forest is
+    (re)compiled when it is missing, older than model.json or of an older
+    format.
+
+    Args:
+        model_path (str): Folder of the model version.
+
+    Returns:
+        CompiledForest: Compiled model.
+    """
+    compiled_path = os.path.join(model_path, COMPILED_MODEL_FILENAME)
+    json_path = os.path.join(model_path, "model.json")
+    if not os.path.exists(compiled_path) or os.path.getmtime(
+        compiled_path
+    ) < os.path.getmtime(json_path):
+        compile_model(model_path)
+    else:
+        with np.load(compiled_path) as arrays:
+            if "format" not in arrays or int(arrays["format"]) != COMPILED_MODEL_FORMAT:
+                compile_model(model_path)
+
+    with np.load(compiled_path) as arrays:
+        return CompiledForest(
+            feature=arrays["feature"],
+            threshold=arrays["threshold"],
+            left=arrays["left"],
+            right=arrays["right"],
+            default_left=arrays["default_left"],
+            leaf_value=arrays["leaf_value"],
+            tree_roots=arrays["tree_roots"],
+            max_depth=int(arrays["max_depth"]),
+            base_score=float(arrays["base_score"]),
+            feature_names=arrays["feature_names"].tolist(),
+            node_value=arrays["node_value"],
+        )
+
+
+def load_compiled_ensemble(ensemble_path: str) -> CompiledEnsemble:
+    """Load every member model in a folder (e.g. models/<version>/bootstrap)
+    as a single compiled ensemble.
+
+    Args:
+        ensemble_path (str): Folder with one model folder per member.
+
+    Returns:
+        CompiledEnsemble: Compiled ensemble.
+    """
+    member_paths = sorted(
+        os.path.join(ensemble_path, member)
+        for member in os.listdir(ensemble_path)
+        if os.path.exists(os.path.join(ensemble_path, member, "model.json"))
+    )
+    return CompiledEnsemble([load_compiled_model(path) for path in member_paths])
+
+
+if __name__ == "__main__":
+    # Compile every saved model version
+    models_path = os.path.join(DIRNAME, "../models")
+    for model_version in sorted(os.listdir(models_path)):
+        print(compile_model(os.path.join(models_path, model_version)))
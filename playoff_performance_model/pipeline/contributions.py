@@ -0,0 +1,159 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from playoff_performance_model.pipeline.batch_artifacts import (
+    read_batch_frame,
+    save_batch_frame,
+)
+from playoff_performance_model.pipeline.prediction_cache import (
+    PredictionCache,
+    hash_feature_rows,
+)
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+# Name of the contribution cache saved next to model.json
+CONTRIBUTION_CACHE_FILENAME = "contribution_cache.npz"
+# Each entry holds a row of contributions, so fewer are kept than predictions
+MAX_CONTRIBUTION_CACHE_ENTRIES = 100_000
+# Batch frame of contributions saved next to scored_data
+CONTRIBUTIONS_FRAME = "contributions"
+
+IDENTIFIER_COLS = ["playerId", "action_season", "action_date"]
+
+
+def compute_contributions(model, model_path: str, X: pd.DataFrame) -> tuple:
+    """Per feature contributions of every row, only computing rows missing
+    from the model version's contribution cache.
+
+    Args:
+        model (CompiledForest): Model to compute contributions with.
+        model_path (str): Folder of the model version.
+        X (pd.DataFrame): Feature data in model feature order.
+
+    Returns:
+        tuple: Contributions (rows, features + bias) and the cache hit rate.
+    """
+    cache = PredictionCache(
+        model_path,
+        filename=CONTRIBUTION_CACHE_FILENAME,
+        value_width=len(model.feature_names) + 1,
+        max_entries=MAX_CONTRIBUTION_CACHE_ENTRIES,
+    )
+    keys = hash_feature_rows(X)
+
+    contributions, hit_mask = cache.lookup(keys)
+    if not hit_mask.all():
+        # All missing rows go through the model in one batched call
+        contributions[~hit_mask] = model.predict_contributions(X.loc[~hit_mask])
+        cache.update(keys[~hit_mask], contributions[~hit_mask])
+        cache.save()
+
+    return contributions, cache.hit_rate
+
+
+def write_contributions(
+    pipeline_folder_path: str,
+    identifier_data: pd.DataFrame,
+    contributions: np.ndarray,
+    feature_names: list,
+) -> str:
+    contribution_data = pd.DataFrame(
+        contributions.astype(np.float32), columns=[*feature_names, "bias"]
+    )
+    contribution_data = pd.concat(
+        [
+            identifier_data.loc[:, IDENTIFIER_COLS].reset_index(drop=True),
+            contribution_data,
+        ],
+        axis=1,
+    )
+
+    return save_batch_frame(
+        contribution_data, pipeline_folder_path, CONTRIBUTIONS_FRAME
+    )
+
+
+def top_k_contributions(contributions: pd.Series, k: int) -> pd.DataFrame:
+    # Largest contributions by size without sorting every feature
+    k = min(k, len(contributions))
+    top_idx = np.argpartition(-np.abs(contributions.values), k - 1)[:k]
+    top = contributions.iloc[top_idx]
+    top = top.iloc[np.argsort(-np.abs(top.values))]
+    return top.rename("contribution").rename_axis("feature").reset_index()
+
+
+class ContributionQuery:
+    """Top-k contribution queries over a scored batch's contributions
+    frame. Only the contributions and batch data are read, not the model.
+    """
+
+    def __init__(self, pipeline_folder_path: str):
+        contribution_data = read_batch_frame(pipeline_folder_path, CONTRIBUTIONS_FRAME)
+        self.feature_names = [
+            c for c in contribution_data.columns if c not in [*IDENTIFIER_COLS, "bias"]
+        ]
+        # A player can be scored for more than one season in a batch
+        self.contributions = contribution_data.set_index(
+            ["playerId", "action_season"]
+        ).loc[:, self.feature_names]
+
+        # Team of each player from the batch data
+        batch_data = read_batch_frame(
+            pipeline_folder_path, "batch_data", columns=["playerId", "team"]
+        )
+        self.teams = batch_data.drop_duplicates(subset=["playerId"]).set_index(
+            "playerId"
+        )["team"]
+
+    def top_features_for_player(
+        self, player_id: int, k: int = 5, action_season: int = None
+    ) -> pd.DataFrame:
+        """Largest contributions to a player's prediction.
+
+        Args:
+            player_id (int): Player id.
+            k (int, optional): Number of features. Defaults to 5.
+            action_season (int, optional): Season the player was scored for.
+                Only needed when the batch scored the player more than once.
+
+        Raises:
+            KeyError: The player (season) is not in the batch, or more than
+                one row matches.
+
+        Returns:
+            pd.DataFrame: Features and their contributions, largest first.
+        """
+        player_ids = self.contributions.index.get_level_values("playerId")
+        rows = self.contributions.loc[player_ids == player_id]
+        if action_season is not None:
+            rows = rows.loc[
+                rows.index.get_level_values("action_season") == action_season
+            ]
+        if rows.shape[0] != 1:
+            seasons = rows.index.get_level_values("action_season").tolist()
+            raise KeyError(
+                f"Player {player_id} must have one scored row in the batch, "
+                f"found {rows.shape[0]} (action seasons {seasons})."
+            )
+        return top_k_contributions(rows.iloc[0], k)
+
+    def top_features_for_team(self, team: str, k: int = 5) -> pd.DataFrame:
+        # Mean contribution over the team's scored players
+        team_players = self.teams.index[self.teams == team]
+        team_contributions = self.contributions.loc[
+            self.contributions.index.get_level_values("playerId").isin(team_players)
+        ].mean()
+        return top_k_contributions(team_contributions, k)
+
+
+if __name__ == "__main__":
+    pipeline_folder_path = os.path.join(
+        DIRNAME, "../pipeline_results", "batch_2024-06-29"
+    )
+    query = ContributionQuery(pipeline_folder_path)
+    print(query.top_features_for_player(8478402, k=5))
+    print(query.top_features_for_team("TOR", k=5))
@@ -1,22 +1,25 @@
 import os
 from pathlib import Path
-import sys
 from datetime import datetime
 
 import numpy as np
 import pandas as pd
 
-# Get path of current file's directory
-DIRNAME = os.path.dirname(os.path.realpath(__file__))
-
-# Insert path to all hockey analytics files
-sys.path.insert(0, os.path.join(DIRNAME, "../.."))
 from collect_data.nhl_apiPull import get_all_nhl_rosters
 from collect_data.read_local_data import read_mp_bio_data
 from common_functions.moneypuck_player_stats import get_mp_player_data_for_year
+from common_functions.profiling import profiled_stage
+from playoff_performance_model.pipeline.batch_artifacts import (
+    read_batch_frame,
+    save_batch_frame,
+)
 from playoff_performance_model.train_model.feature_collection import get_model_features
 
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
 
+@profiled_stage
 def get_all_players_for_given_season_mp(season: int) -> pd.DataFrame:
     player_data = get_mp_player_data_for_year(season, "regular")
 
@@ -30,6 +33,7 @@ def get_all_players_for_given_season_mp(season: int) -> pd.DataFrame:
     return player_data
 
 
+@profiled_stage
 def get_nhl_api_roster_batch_data(season: int):
     # Read in mhl rosters for the season
     nhl_rosters = get_all_nhl_rosters(season)
@@ -71,9 +75,13 @@ def get_season_from_action_date(action_date: str) -> int:
     return nhl_start_end_dates.loc[0, "Season"]
 
 
-def create_batch_data(
-    pipeline_folder_path: str, action_date: str, nhl_rosters_flag: bool
-):
+@profiled_stage
+def create_batch_player_data(
+    pipeline_folder_path: str,
+    action_date: str,
+    nhl_rosters_flag: bool,
+    csv_export: bool = False,
+) -> pd.DataFrame:
     # If pipeline_folder_path does not exist, create it
     Path(pipeline_folder_path).mkdir(parents=True, exist_ok=True)
 
@@ -98,17 +106,39 @@ def create_batch_data(
     batch_data.loc[:, "action_date"] = action_date
 
     # Save batch data
-    batch_data.to_csv(os.path.join(pipeline_folder_path, "batch_data.csv"))
-    batch_data.to_pickle(os.path.join(pipeline_folder_path, "batch_data.pkl"))
+    save_batch_frame(batch_data, pipeline_folder_path, "batch_data", csv_export)
+    return batch_data
+
+
+@profiled_stage
+def create_batch_feature_data(
+    pipeline_folder_path: str, csv_export: bool = False
+) -> pd.DataFrame:
+    batch_data = read_batch_frame(
+        pipeline_folder_path,
+        "batch_data",
+        columns=["playerId", "action_season", "action_date"],
+    )
 
     # Get features for each player
-    feature_data = get_model_features(
-        batch_data.loc[:, ["playerId", "action_season", "action_date"]]
-    )
+    feature_data = get_model_features(batch_data)
 
     # Save features to the batch
-    feature_data.to_csv(os.path.join(pipeline_folder_path, "feature_data.csv"))
-    feature_data.to_pickle(os.path.join(pipeline_folder_path, "feature_data.pkl"))
+    save_batch_frame(feature_data, pipeline_folder_path, "feature_data", csv_export)
+    return feature_data
+
+
+@profiled_stage
+def create_batch_data(
+    pipeline_folder_path: str,
+    action_date: str,
+    nhl_rosters_flag: bool,
+    csv_export: bool = False,
+):
+    create_batch_player_data(
+        pipeline_folder_path, action_date, nhl_rosters_flag, csv_export
+    )
+    create_batch_feature_data(pipeline_folder_path, csv_export)
 
 
 if __name__ == "__main__":
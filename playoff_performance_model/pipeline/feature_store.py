@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+
+from collect_data.read_local_data import read_in_all_mp_data, read_mp_bio_data
+from common_functions.profiling import profiled_stage
+from playoff_performance_model.train_model.feature_collection import (
+    get_age_in_days,
+    get_height_in_inches_from_str,
+)
+
+
+class SeasonStatsTable:
+    """MoneyPuck season stats for one season type held as sorted arrays,
+    so a player's seasons are found with a binary search.
+    """
+
+    def __init__(self, mp_data: pd.DataFrame, stat_columns: list):
+        mp_data = mp_data.sort_values(by=["playerId", "season"])
+        self.player_ids = mp_data["playerId"].to_numpy()
+        self.seasons = mp_data["season"].to_numpy()
+        self.values = mp_data.loc[:, stat_columns].to_numpy(dtype=np.float64)
+
+    def get_player_rows(self, player_id: int) -> slice:
+        lo = np.searchsorted(self.player_ids, player_id, side="left")
+        hi = np.searchsorted(self.player_ids, player_id, side="right")
+        return slice(lo, hi)
+
+    def get_season_stats(self, player_id: int, season: int) -> np.ndarray:
+        rows = self.get_player_rows(player_id)
+        match = np.flatnonzero(self.seasons[rows] == season)
+        if len(match) == 0:
+            return np.full(self.values.shape[1], np.nan)
+        return self.values[rows][match[0]]
+
+    def get_past_seasons_mean(
+        self, player_id: int, start_season: int, num_seasons: int
+    ) -> np.ndarray:
+        rows = self.get_player_rows(player_id)
+        seasons = self.seasons[rows]
+        in_window = (seasons < start_season) & (seasons >= start_season - num_seasons)
+        if not in_window.any():
+            return np.full(self.values.shape[1], np.nan)
+        return np.nanmean(self.values[rows][in_window], axis=0)
+
+
+def select_batch_features(feature_data: pd.DataFrame) -> pd.DataFrame:
+    """Rows and columns of store features that feature_selection_process
+    keeps in create_batch_data: rows missing any feature are dropped, then
+    columns over 30% empty or with a single value.
+
+    Args:
+        feature_data (pd.DataFrame): Output of PlayerFeatureStore.get_features.
+
+    Returns:
+        pd.DataFrame: Identifier data with the selected features.
+    """
+    identifier_cols = ["playerId", "action_season", "action_date"]
+    feature_cols = [c for c in feature_data.columns if c not in identifier_cols]
+    feature_data = feature_data.dropna(subset=feature_cols, how="any")
+    feature_data = feature_data.reset_index(drop=True)
+
+    features = feature_data.loc[:, feature_cols]
+    features = features.dropna(thresh=features.shape[0] * 0.7, axis=1)
+    nunique = features.nunique()
+    features = features.drop(nunique[nunique == 1].index, axis=1)
+    return pd.concat([feature_data.loc[:, identifier_cols], features], axis=1)
+
+
+class PlayerFeatureStore:
+    """In memory MoneyPuck and bio data for building one player's model
+    features at a time. Mirrors get_model_features: prior regular season
+    stats, 5 season regular and playoff means and bio data.
+    """
+
+    def __init__(self, num_seasons: int = 5, situation: str = "all"):
+        self.num_seasons = num_seasons
+        self.situation = situation
+
+        # Read in all moneypuck player data once
+        mp_regular_data = read_in_all_mp_data("regular")
+        mp_regular_data = mp_regular_data.loc[mp_regular_data["situation"] == situation]
+        mp_playoff_data = read_in_all_mp_data("playoffs")
+        mp_playoff_data = mp_playoff_data.loc[mp_playoff_data["situation"] == situation]
+
+        # Stats used as features are every numeric MoneyPuck column
+        self.stat_columns = [
+            c
+            for c in mp_regular_data.select_dtypes(include=np.number).columns
+            if c not in ["playerId", "season"]
+        ]
+        self.regular = SeasonStatsTable(mp_regular_data, self.stat_columns)
+        self.playoffs = SeasonStatsTable(mp_playoff_data, self.stat_columns)
+
+        # Read in MoneyPuck player bio data, one row per player
+        self.bio_data = (
+            read_mp_bio_data()
+            .drop_duplicates(subset=["playerId"])
+            .set_index("playerId")
+            .loc[:, ["birthDate", "weight", "height"]]
+        )
+
+    def has_player(self, player_id: int) -> bool:
+        # Players with at least one MoneyPuck regular or playoff season
+        for table in [self.regular, self.playoffs]:
+            rows = table.get_player_rows(player_id)
+            if rows.stop > rows.start:
+                return True
+        return False
+
+    def get_feature_names(self) -> list:
+        return [
+            *self.stat_columns,
+            *self.get_mean_feature_names("regular"),
+            *self.get_mean_feature_names("playoffs"),
+            "weight",
+            "age_in_days",
+            "height_inches",
+        ]
+
+    def get_mean_feature_names(self, season_type: str) -> list:
+        return [
+            f"mean_{self.num_seasons}years_{season_type}_{self.situation}_{col}"
+            for col in self.stat_columns
+        ]
+
+    def get_bio_features(self, player_id: int, action_date: str) -> list:
+        if player_id not in self.bio_data.index:
+            return [np.nan, np.nan, np.nan]
+        bio = self.bio_data.loc[player_id]
+        age_in_days = (
+            get_age_in_days(bio["birthDate"], action_date)
+            if pd.notna(bio["birthDate"])
+            else np.nan
+        )
+        height_inches = (
+            get_height_in_inches_from_str(bio["height"])
+            if pd.notna(bio["height"])
+            else np.nan
+        )
+        return [bio["weight"], age_in_days, height_inches]
+
+    def get_player_feature_values(
+        self, player_id: int, action_season: int, action_date: str
+    ) -> np.ndarray:
+        """Get the feature values of a player in get_feature_names order.
+
+        Args:
+            player_id (int): Player id.
+            action_season (int): Season the player is scored for.
+            action_date (str): Action date (YYYY-MM-DD).
+
+        Returns:
+            np.ndarray: Feature values.
+        """
+        return np.concatenate(
+            [
+                # Prior regular season stats
+                self.regular.get_season_stats(player_id, action_season - 1),
+                # Past regular and playoff season means
+                self.regular.get_past_seasons_mean(
+                    player_id, action_season, self.num_seasons
+                ),
+                self.playoffs.get_past_seasons_mean(
+                    player_id, action_season, self.num_seasons
+                ),
+                self.get_bio_features(player_id, action_date),
+            ]
+        )
+
+    @profiled_stage
+    def get_features(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Get features for each playerId, action_season and action_date row.
+        Unlike get_model_features, rows with missing data are kept.
+
+        Args:
+            data (pd.DataFrame): Identifier data.
+
+        Returns:
+            pd.DataFrame: Identifier data with features.
+        """
+        values = np.array(
+            [
+                self.get_player_feature_values(*row)
+                for row in data.loc[
+                    :, ["playerId", "action_season", "action_date"]
+                ].itertuples(index=False)
+            ]
+        ).reshape(len(data), len(self.get_feature_names()))
+        features = pd.DataFrame(
+            values, columns=self.get_feature_names(), index=data.index
+        )
+        return pd.concat([data, features], axis=1)
@@ -0,0 +1,137 @@
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from common_functions.profiling import record_cache_lookup
+from playoff_performance_model.pipeline.batch_artifacts import read_batch_frame
+from playoff_performance_model.pipeline.compiled_model import (
+    CompiledForest,
+    load_compiled_model,
+)
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+MODELS_PATH = os.path.join(DIRNAME, "../models")
+
+
+class ModelVersionNotFound(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+def get_model_path(model_version: str) -> str:
+    model_path = os.path.join(MODELS_PATH, model_version)
+    if not os.path.exists(os.path.join(model_path, "model.json")):
+        raise ModelVersionNotFound(f"No model.json for model version {model_version}.")
+    return model_path
+
+
+def list_model_versions() -> pd.DataFrame:
+    """List the saved model versions with their metadata.
+
+    Returns:
+        pd.DataFrame: One row per model version.
+    """
+    versions = []
+    for model_version in sorted(os.listdir(MODELS_PATH)):
+        model_path = os.path.join(MODELS_PATH, model_version)
+        if not os.path.exists(os.path.join(model_path, "model.json")):
+            continue
+
+        with open(os.path.join(model_path, "feature_names.json")) as f:
+            feature_names = json.load(f)
+        with open(os.path.join(model_path, "params.json")) as f:
+            params = {k: v for k, v in json.load(f).items() if v is not None}
+
+        model_json_path = os.path.join(model_path, "model.json")
+        versions.append(
+            {
+                "model_version": model_version,
+                "num_features": len(feature_names),
+                "objective": params.get("objective"),
+                "learning_rate": params.get("learning_rate"),
+                "max_depth": params.get("max_depth"),
+                "has_bootstrap": os.path.isdir(os.path.join(model_path, "bootstrap")),
+                "model_size_kb": os.path.getsize(model_json_path) / 1024,
+                "modified": datetime.fromtimestamp(os.path.getmtime(model_json_path)),
+            }
+        )
+    return pd.DataFrame(versions)
+
+
+class ModelRegistry:
+    """Bounded LRU cache of compiled models (with their feature lists).
+    A cached model is reloaded when its model.json changes on disk.
+    """
+
+    def __init__(self, max_models: int = 4):
+        self.max_models = max_models
+        self._models = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_model(self, model_version: str) -> CompiledForest:
+        model_path = get_model_path(model_version)
+        mtime = os.path.getmtime(os.path.join(model_path, "model.json"))
+
+        if model_version in self._models and self._models[model_version][0] == mtime:
+            self.hits += 1
+            record_cache_lookup(1, 1)
+            self._models.move_to_end(model_version)
+            return self._models[model_version][1]
+
+        self.misses += 1
+        record_cache_lookup(0, 1)
+        model = load_compiled_model(model_path)
+        self._models[model_version] = (mtime, model)
+        self._models.move_to_end(model_version)
+        # Evict the least recently used model
+        if len(self._models) > self.max_models:
+            self._models.popitem(last=False)
+        return model
+
+    def get_feature_names(self, model_version: str) -> list:
+        return self.get_model(model_version).feature_names
+
+    def predict_versions(self, X: pd.DataFrame, model_versions: list) -> pd.DataFrame:
+        """Predict with several model versions side by side.
+
+        Args:
+            X (pd.DataFrame): Feature data with every version's features.
+            model_versions (list): Model versions to predict with.
+
+        Returns:
+            pd.DataFrame: One prediction_<version> column per model version.
+        """
+        models = {v: self.get_model(v) for v in model_versions}
+
+        # Align the union of all versions' features once for the batch
+        # Features a batch does not have are scored as missing values
+        feature_names = list(
+            dict.fromkeys(c for model in models.values() for c in model.feature_names)
+        )
+        X_all = X.reindex(columns=feature_names).to_numpy(dtype=np.float32)
+
+        predictions = pd.DataFrame(index=X.index)
+        for model_version, model in models.items():
+            predictions[f"prediction_{model_version}"] = model.with_feature_order(
+                feature_names
+            ).predict(X_all)
+        return predictions
+
+
+if __name__ == "__main__":
+    print(list_model_versions())
+
+    # Compare model versions on the latest batch
+    registry = ModelRegistry()
+    X = read_batch_frame(
+        os.path.join(DIRNAME, "../pipeline_results", "batch_2024-06-29"),
+        "feature_data",
+    )
+    print(registry.predict_versions(X, ["version_1", "version_2"]))
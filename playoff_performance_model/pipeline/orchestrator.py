@@ -0,0 +1,458 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from common_functions.profiling import bind_context
+from playoff_performance_model.pipeline.batch_artifacts import (
+    get_artifact_path,
+    get_batch_frame_path,
+)
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+PIPELINE_RESULTS_PATH = os.path.join(DIRNAME, "../pipeline_results")
+MODELS_PATH = os.path.join(DIRNAME, "../models")
+TRAINING_DATA_PATH = os.path.join(DIRNAME, "../train_model/training_data")
+DATA_PATH = os.path.join(DIRNAME, "../../data")
+MP_DATA_PATH = os.path.join(DATA_PATH, "moneypuck")
+
+# Seconds each stage took when it last ran, for the dry run estimates
+STAGE_TIMINGS_PATH = os.path.join(PIPELINE_RESULTS_PATH, "stage_timings.json")
+
+
+class PipelineDefinitionException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+class PipelineStage:
+    """A pipeline step with the files it reads and writes. Inputs may be
+    folders, whose newest file counts.
+    """
+
+    def __init__(self, name: str, func, inputs: list, outputs: list):
+        self.name = name
+        self.func = func
+        self.inputs = [os.path.normpath(p) for p in inputs]
+        self.outputs = [os.path.normpath(p) for p in outputs]
+
+
+def get_path_mtime(path: str) -> float:
+    # Newest file of a folder, None when missing or empty
+    if os.path.isdir(path):
+        mtimes = [
+            os.path.getmtime(os.path.join(folder, f))
+            for folder, _, files in os.walk(path)
+            for f in files
+        ]
+        return max(mtimes) if len(mtimes) > 0 else None
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def get_stage_dependencies(stages: list) -> dict:
+    """Stages each stage depends on, those writing one of its inputs.
+
+    Raises:
+        PipelineDefinitionException: Two stages write the same file or the
+            stages depend on each other in a cycle.
+
+    Returns:
+        dict: Names of the upstream stages by stage name.
+    """
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers:
+                raise PipelineDefinitionException(
+                    f"{output} is written by {producers[output]} and {stage.name}."
+                )
+            producers[output] = stage.name
+
+    dependencies = {
+        stage.name: sorted(
+            {producers[p] for p in stage.inputs if p in producers} - {stage.name}
+        )
+        for stage in stages
+    }
+
+    # Stages must form a DAG
+    visiting, visited = set(), set()
+
+    def visit(name: str):
+        if name in visiting:
+            raise PipelineDefinitionException(f"Stage {name} depends on itself.")
+        if name not in visited:
+            visiting.add(name)
+            for upstream in dependencies[name]:
+                visit(upstream)
+            visiting.remove(name)
+            visited.add(name)
+
+    for name in dependencies:
+        visit(name)
+    return dependencies
+
+
+def get_stage_status(stage: PipelineStage, upstream_runs: bool = False) -> tuple:
+    """Whether a stage has to run, make style.
+
+    Args:
+        stage (PipelineStage): Stage to check.
+        upstream_runs (bool, optional): A stage it depends on will run
+            first. Defaults to False.
+
+    Returns:
+        tuple: Status ("run", "skip" or "missing_input") and the reason.
+    """
+    if upstream_runs:
+        return "run", "upstream stage runs"
+
+    input_mtimes = {p: get_path_mtime(p) for p in stage.inputs}
+    missing_inputs = [p for p, mtime in input_mtimes.items() if mtime is None]
+    if len(missing_inputs) > 0:
+        return "missing_input", f"missing {os.path.relpath(missing_inputs[0])}"
+
+    output_mtimes = {p: get_path_mtime(p) for p in stage.outputs}
+    missing_outputs = [p for p, mtime in output_mtimes.items() if mtime is None]
+    if len(missing_outputs) > 0:
+        return "run", f"no {os.path.basename(missing_outputs[0])}"
+
+    newest_input = max(input_mtimes, key=input_mtimes.get, default=None)
+    if newest_input is not None and input_mtimes[newest_input] > min(
+        output_mtimes.values()
+    ):
+        return "run", f"{os.path.basename(newest_input)} is newer"
+    return "skip", "up to date"
+
+
+def read_stage_timings() -> dict:
+    if not os.path.exists(STAGE_TIMINGS_PATH):
+        return {}
+    with open(STAGE_TIMINGS_PATH) as f:
+        return json.load(f)
+
+
+def plan_pipeline(stages: list, force: bool = False) -> pd.DataFrame:
+    """Expected work of a pipeline run without running anything.
+
+    Args:
+        stages (list): Pipeline stages.
+        force (bool, optional): Run every stage. Defaults to False.
+
+    Returns:
+        pd.DataFrame: Status, reason, upstream stages, the wave each stage
+            can start in and the seconds it took when it last ran.
+    """
+    dependencies = get_stage_dependencies(stages)
+    stages_by_name = {stage.name: stage for stage in stages}
+    timings = read_stage_timings()
+
+    plan = {}
+
+    def plan_stage(name: str) -> dict:
+        if name not in plan:
+            upstream = [plan_stage(u) for u in dependencies[name]]
+            if any(u["status"] in ["missing_input", "blocked"] for u in upstream):
+                status, reason = "blocked", "upstream stage can't run"
+            elif force:
+                status, reason = "run", "forced"
+            else:
+                status, reason = get_stage_status(
+                    stages_by_name[name], any(u["status"] == "run" for u in upstream)
+                )
+            plan[name] = {
+                "stage": name,
+                "status": status,
+                "reason": reason,
+                "depends_on": ", ".join(dependencies[name]),
+                # Stages of a wave only depend on earlier waves
+                "wave": max([u["wave"] + 1 for u in upstream], default=0),
+                "last_seconds": timings.get(name),
+            }
+        return plan[name]
+
+    for stage in stages:
+        plan_stage(stage.name)
+    return pd.DataFrame([plan[stage.name] for stage in stages]).sort_values(
+        by=["wave"], kind="stable"
+    )
+
+
+def run_pipeline(
+    stages: list, max_workers: int = None, dry_run: bool = False, force: bool = False
+) -> pd.DataFrame:
+    """Run the stages that are out of date, each once every stage it depends
+    on has finished. Independent stages run at the same time.
+
+    Args:
+        stages (list): Pipeline stages.
+        max_workers (int, optional): Stages run at once. Defaults to the
+            number of stages that can run at once.
+        dry_run (bool, optional): Only print the plan. Defaults to False.
+        force (bool, optional): Run every stage. Defaults to False.
+
+    Returns:
+        pd.DataFrame: Status and seconds of every stage.
+    """
+    plan = plan_pipeline(stages, force=force)
+    if dry_run:
+        to_run = plan.loc[plan["status"] == "run"]
+        print(plan.to_string(index=False))
+        # Waves run one after the other, the stages of a wave side by side
+        expected_seconds = to_run.groupby("wave")["last_seconds"].max().sum()
+        untimed = to_run["last_seconds"].isna().sum()
+        print(
+            f"\n{to_run.shape[0]} of {plan.shape[0]} stages to run, about "
+            f"{expected_seconds:.1f}s from their last runs"
+            + (f" ({untimed} not timed yet)" if untimed > 0 else "")
+        )
+        return plan
+
+    dependencies = get_stage_dependencies(stages)
+    timings = read_stage_timings()
+    results = {}
+    ran = set()
+
+    def run_stage(stage: PipelineStage) -> float:
+        start_time = time.perf_counter()
+        stage.func()
+        return time.perf_counter() - start_time
+
+    if max_workers is None:
+        max_workers = max(plan["wave"].value_counts().max(), 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while len(results) + len(running) < len(stages) or len(running) > 0:
+            # Start every stage whose upstream stages are done
+            for stage in stages:
+                name = stage.name
+                if name in results or name in running.values():
+                    continue
+                upstream = dependencies[name]
+                if not all(u in results for u in upstream):
+                    continue
+                if any(results[u]["status"] in ["failed", "blocked"] for u in upstream):
+                    results[name] = {"stage": name, "status": "blocked"}
+                    continue
+                # Checked now, so outputs written by upstream stages count
+                status, reason = (
+                    ("run", "forced")
+                    if force
+                    else get_stage_status(stage, any(u in ran for u in upstream))
+                )
+                if status != "run":
+                    results[name] = {"stage": name, "status": status, "reason": reason}
+                    continue
+                print(f"Running {name} ({reason})")
+                # In the caller's context, so a profiled run records its stages
+                running[executor.submit(bind_context(run_stage), stage)] = name
+
+            if len(running) == 0:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    seconds = future.result()
+                    results[name] = {"stage": name, "status": "ran", "seconds": seconds}
+                    timings[name] = seconds
+                    ran.add(name)
+                    print(f"Finished {name} in {seconds:.2f}s")
+                except Exception as e:
+                    results[name] = {
+                        "stage": name,
+                        "status": "failed",
+                        "reason": f"{type(e).__name__}: {e}",
+                    }
+                    print(f"Failed {name}: {e}")
+
+    if len(ran) > 0:
+        with open(STAGE_TIMINGS_PATH, "w") as f:
+            json.dump(timings, f, indent=2)
+    return pd.DataFrame([results[stage.name] for stage in stages])
+
+
+def get_production_stages(
+    action_date: str,
+    model_version: str,
+    nhl_rosters_flag: bool = False,
+    train: bool = False,
+) -> list:
+    """Stages of the production flow for an action date: build the batch,
+    score it with the model version and add it to the team cube. With train,
+    the target data, training features and model are rebuilt when out of
+    date too, otherwise the saved model is an input. Without train, only
+    load_model runs alongside another stage (batch_data), every other stage
+    needs the one before it. With train, the training stages run alongside
+    batch_data and feature_data.
+
+    Args:
+        action_date (str): Action date (YYYY-MM-DD).
+        model_version (str): Model version to score with.
+        nhl_rosters_flag (bool, optional): Use NHL API rosters instead of
+            MoneyPuck players. Defaults to False.
+        train (bool, optional): Include the training stages. Defaults to
+            False.
+
+    Returns:
+        list: Pipeline stages.
+    """
+    # Stage functions import their modules when they run
+    pipeline_folder_path = os.path.join(PIPELINE_RESULTS_PATH, f"batch_{action_date}")
+    model_path = os.path.join(MODELS_PATH, model_version)
+    player_data_path = os.path.join(MP_DATA_PATH, "player_data")
+    bio_data_path = os.path.join(MP_DATA_PATH, "player_biography_data.csv")
+    target_path = os.path.join(TRAINING_DATA_PATH, "target_variable.csv")
+    training_features_path = os.path.join(
+        TRAINING_DATA_PATH, "training_feature_data.pkl"
+    )
+    model_files = [
+        os.path.join(model_path, f)
+        for f in ["model.json", "feature_names.json", "params.json"]
+    ]
+    compiled_model_path = os.path.join(model_path, "model_forest.npz")
+
+    def batch_frame_path(name: str) -> str:
+        # Batches saved before the columnar artifacts have a pickle or CSV
+        try:
+            return get_batch_frame_path(pipeline_folder_path, name)
+        except FileNotFoundError:
+            return get_artifact_path(pipeline_folder_path, name)
+
+    def create_target():
+        from playoff_performance_model.train_model.target_variable import (
+            create_target_variable_data,
+        )
+
+        create_target_variable_data(
+            start_year=2014, min_games_played=4, situation="all"
+        ).to_csv(target_path)
+
+    def create_training_features():
+        from playoff_performance_model.train_model.feature_collection import (
+            collect_training_features,
+        )
+
+        feature_data = collect_training_features()
+        feature_data.to_csv(training_features_path.replace(".pkl", ".csv"))
+        feature_data.to_pickle(training_features_path)
+
+    def fit_model():
+        from playoff_performance_model.train_model.train_model import train_model
+
+        train_model(model_version, plot_importance=False)
+
+    def create_player_data():
+        from playoff_performance_model.pipeline.create_batch_data import (
+            create_batch_player_data,
+        )
+
+        create_batch_player_data(pipeline_folder_path, action_date, nhl_rosters_flag)
+
+    def create_feature_data():
+        from playoff_performance_model.pipeline.create_batch_data import (
+            create_batch_feature_data,
+        )
+
+        create_batch_feature_data(pipeline_folder_path)
+
+    def load_model():
+        from playoff_performance_model.pipeline.score import MODEL_REGISTRY
+
+        # Compiles the forest if needed, the registry keeps it for scoring
+        MODEL_REGISTRY.get_model(model_version)
+
+    def score():
+        from playoff_performance_model.pipeline.score import score_players
+
+        score_players(pipeline_folder_path, model_version)
+
+    def update_cube():
+        from playoff_performance_model.analysis.team_cube import update_team_cube
+
+        update_team_cube(PIPELINE_RESULTS_PATH)
+
+    stages = []
+    if train:
+        stages += [
+            PipelineStage("target", create_target, [player_data_path], [target_path]),
+            PipelineStage(
+                "training_features",
+                create_training_features,
+                [target_path, player_data_path, bio_data_path],
+                [training_features_path],
+            ),
+            PipelineStage("train", fit_model, [training_features_path], model_files),
+        ]
+    stages += [
+        PipelineStage(
+            "batch_data",
+            create_player_data,
+            [] if nhl_rosters_flag else [player_data_path],
+            [batch_frame_path("batch_data")],
+        ),
+        PipelineStage(
+            "feature_data",
+            create_feature_data,
+            [batch_frame_path("batch_data"), player_data_path, bio_data_path],
+            [batch_frame_path("feature_data")],
+        ),
+        PipelineStage("load_model", load_model, model_files[:1], [compiled_model_path]),
+        PipelineStage(
+            "score",
+            score,
+            [batch_frame_path("feature_data"), compiled_model_path, *model_files],
+            [batch_frame_path("scored_data")],
+        ),
+        PipelineStage(
+            "team_cube",
+            update_cube,
+            [
+                batch_frame_path("scored_data"),
+                os.path.join(DATA_PATH, "nhl_salaries_2024-2025.csv"),
+                os.path.join(DATA_PATH, "contract_crosswalk_overrides.csv"),
+            ],
+            [os.path.join(PIPELINE_RESULTS_PATH, "team_cube.colz")],
+        ),
+    ]
+    return stages
+
+
+def get_pipeline_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Run the out of date stages of the production flow."
+    )
+    parser.add_argument("--action-date", default="2024-06-29", help="YYYY-MM-DD")
+    parser.add_argument("--model-version", default="version_2")
+    parser.add_argument("--nhl-rosters", action="store_true")
+    parser.add_argument(
+        "--train", action="store_true", help="Also rebuild the model when stale"
+    )
+    parser.add_argument("--max-workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="Run every stage")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Print the plan without running"
+    )
+    return parser
+
+
+def run_production_pipeline(args: argparse.Namespace) -> pd.DataFrame:
+    stages = get_production_stages(
+        args.action_date,
+        args.model_version,
+        nhl_rosters_flag=args.nhl_rosters,
+        train=args.train,
+    )
+    return run_pipeline(
+        stages, max_workers=args.max_workers, dry_run=args.dry_run, force=args.force
+    )
+
+
+if __name__ == "__main__":
+    results = run_production_pipeline(get_pipeline_parser().parse_args())
+    print(results.to_string(index=False))
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from common_functions.profiling import record_cache_lookup
+
+# Name of the prediction cache saved next to model.json
+PREDICTION_CACHE_FILENAME = "prediction_cache.npz"
+# Most entries kept, the least recently used are dropped past it
+MAX_CACHE_ENTRIES = 1_000_000
+
+
+def get_model_hash(model_path: str) -> str:
+    with open(os.path.join(model_path, "model.json"), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def hash_feature_rows(X: pd.DataFrame) -> np.ndarray:
+    # Hash the values the model sees (32 bit floats), one key per row
+    X = X.astype(np.float32).reset_index(drop=True)
+    return pd.util.hash_pandas_object(X, index=False).to_numpy()
+
+
+class PredictionCache:
+    """Predictions of a model version keyed by the hash of the row's model
+    feature vector. The cache is dropped when the model's model.json changes.
+    With value_width, each key holds a vector (e.g. feature contributions).
+
+    The file is replaced whole on save, so concurrent scorers never leave a
+    partial file behind, the last one to save wins. An unreadable file is
+    treated as an empty cache.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        filename: str = PREDICTION_CACHE_FILENAME,
+        value_width: int = None,
+        max_entries: int = MAX_CACHE_ENTRIES,
+    ):
+        self.cache_path = os.path.join(model_path, filename)
+        self.model_hash = get_model_hash(model_path)
+        self.value_shape = () if value_width is None else (value_width,)
+        self.max_entries = max_entries
+        self.clear()
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.exists(self.cache_path):
+            try:
+                with np.load(self.cache_path) as cache:
+                    # Only use cached predictions of the current model.json
+                    if str(cache["model_hash"]) == self.model_hash:
+                        self.keys = cache["keys"]
+                        self.values = cache["values"]
+                        self.last_used = cache["last_used"]
+            except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+                # Truncated or older cache files are rebuilt
+                self.clear()
+        # Lookups and updates so far, the last one each entry was used in
+        self.use_count = int(self.last_used.max(initial=0))
+
+    def clear(self):
+        self.keys = np.array([], dtype=np.uint64)
+        self.values = np.empty((0, *self.value_shape), dtype=np.float32)
+        self.last_used = np.array([], dtype=np.int64)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def lookup(self, keys: np.ndarray) -> tuple:
+        """Get the cached predictions for the given keys.
+
+        Args:
+            keys (np.ndarray): Feature row hashes.
+
+        Returns:
+            tuple: Cached values (nan on a miss) and a mask of cache hits.
+        """
+        values = np.full((len(keys), *self.value_shape), np.nan)
+        if len(self.keys) == 0:
+            hit_mask = np.zeros(len(keys), dtype=bool)
+        else:
+            # Keys are kept sorted, so lookups are a binary search
+            positions = np.searchsorted(self.keys, keys)
+            positions = np.minimum(positions, len(self.keys) - 1)
+            hit_mask = self.keys[positions] == keys
+            values[hit_mask] = self.values[positions[hit_mask]]
+            self.use_count += 1
+            self.last_used[positions[hit_mask]] = self.use_count
+
+        self.hits += int(hit_mask.sum())
+        self.misses += int((~hit_mask).sum())
+        record_cache_lookup(hit_mask.sum(), len(keys))
+        return values, hit_mask
+
+    def update(self, keys: np.ndarray, values: np.ndarray):
+        self.use_count += 1
+        keys, first = np.unique(np.concatenate([self.keys, keys]), return_index=True)
+        self.values = np.concatenate([self.values, values]).astype(np.float32)[first]
+        self.last_used = np.concatenate(
+            [self.last_used, np.full(len(values), self.use_count)]
+        )[first]
+        self.keys = keys
+
+        # Drop the least recently used entries past the limit, keys stay sorted
+        if len(self.keys) > self.max_entries:
+            kept = np.sort(
+                np.argsort(-self.last_used, kind="stable")[: self.max_entries]
+            )
+            self.keys = self.keys[kept]
+            self.values = self.values[kept]
+            self.last_used = self.last_used[kept]
+
+    def save(self):
+        # Written to a temporary file and moved into place, like ArtifactWriter
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.cache_path),
+            prefix=f"{os.path.basename(self.cache_path)}.",
+            suffix=".tmp",
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    keys=self.keys,
+                    values=self.values,
+                    last_used=self.last_used,
+                    model_hash=np.array(self.model_hash),
+                )
+            os.replace(tmp_path, self.cache_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+def predict_with_cache(model, model_path: str, X: pd.DataFrame) -> tuple:
+    """Predict with a model, only computing rows missing from its cache.
+
+    Args:
+        model (CompiledForest): Model to predict misses with.
+        model_path (str): Folder of the model version.
+        X (pd.DataFrame): Feature data in model feature order.
+
+    Returns:
+        tuple: Predictions and the cache hit rate.
+    """
+    cache = PredictionCache(model_path)
+    keys = hash_feature_rows(X)
+
+    y_pred, hit_mask = cache.lookup(keys)
+    if not hit_mask.all():
+        y_pred[~hit_mask] = model.predict(X.loc[~hit_mask])
+        cache.update(keys[~hit_mask], y_pred[~hit_mask])
+        cache.save()
+
+    return y_pred.astype(np.float32), cache.hit_rate
@@ -1,49 +1,121 @@
 import json
 import os
-from pathlib import Path
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import xgboost as xgb
-from sklearn.metrics import root_mean_squared_error
-from sklearn.model_selection import GridSearchCV, train_test_split
-from xgboost import plot_importance
+
+from common_functions.profiling import profile_stage, profiled_stage
+from playoff_performance_model.pipeline.batch_artifacts import (
+    read_batch_frame,
+    save_batch_frame,
+)
+from playoff_performance_model.pipeline.compiled_model import load_compiled_ensemble
+from playoff_performance_model.pipeline.contributions import (
+    compute_contributions,
+    write_contributions,
+)
+from playoff_performance_model.pipeline.model_registry import ModelRegistry
+from playoff_performance_model.pipeline.prediction_cache import predict_with_cache
 
 # Get path of current file's directory
 DIRNAME = os.path.dirname(os.path.realpath(__file__))
 
+# Models stay loaded between scoring calls in the same process
+MODEL_REGISTRY = ModelRegistry()
+
 
-def score_players(pipeline_folder_path: str, model_version: str) -> pd.DataFrame:
+@profiled_stage
+def score_players(
+    pipeline_folder_path: str,
+    model_version: str,
+    prediction_intervals: bool = False,
+    percentiles: tuple = (5, 95),
+    use_cache: bool = True,
+    contributions: bool = False,
+    csv_export: bool = False,
+) -> pd.DataFrame:
     # Read in player feature data
-    X = pd.read_pickle(os.path.join(pipeline_folder_path, "feature_data.pkl"))
+    X = read_batch_frame(pipeline_folder_path, "feature_data")
 
     # Save identifier data
     identifier_data = X.loc[:, ["playerId", "action_season", "action_date"]]
     identifier_data = identifier_data.reset_index()
 
-    # Load in saved xgboost model
+    # Load in saved xgboost model as a compiled array forest
+    # Compiled from model.json on first use, xgboost is not needed to score
     model_path = os.path.join(DIRNAME, "../models", model_version)
-    model = xgb.XGBRegressor()
-    model.load_model(os.path.join(model_path, "model.json"))
+    model = MODEL_REGISTRY.get_model(model_version)
 
     # Read in feature names
     with open(os.path.join(model_path, "feature_names.json")) as f:
         cols_when_model_builds = json.load(f)
     X = X.loc[:, cols_when_model_builds]
 
-    # Compute model prediction
-    y_pred = model.predict(X)
+    # Compute model prediction, reusing cached predictions of unchanged rows
+    with profile_stage("predict", rows_in=X.shape[0]):
+        if use_cache:
+            y_pred, hit_rate = predict_with_cache(model, model_path, X)
+            print(f"Prediction cache hit rate: {hit_rate:.1%}")
+        else:
+            y_pred = model.predict(X)
     # Add model prediction to feature data
     identifier_data.loc[:, "prediction"] = y_pred
+
+    # Uncertainty from the model version's bootstrap ensemble
+    if prediction_intervals:
+        ensemble = load_compiled_ensemble(os.path.join(model_path, "bootstrap"))
+        # All members are scored in one pass over the batch
+        with profile_stage("predict_members", rows_in=X.shape[0]):
+            member_preds = ensemble.predict_members(X)
+        identifier_data.loc[:, "prediction_mean"] = member_preds.mean(axis=1)
+        for percentile in percentiles:
+            identifier_data.loc[:, f"prediction_p{percentile:02g}"] = np.percentile(
+                member_preds, percentile, axis=1
+            )
+
+    # Per feature contributions saved to a side file next to scored_data
+    if contributions:
+        with profile_stage("compute_contributions", rows_in=X.shape[0]):
+            feature_contributions, hit_rate = compute_contributions(
+                model, model_path, X
+            )
+        print(f"Contribution cache hit rate: {hit_rate:.1%}")
+        write_contributions(
+            pipeline_folder_path,
+            identifier_data,
+            feature_contributions,
+            model.feature_names,
+        )
+
     X = X.reset_index()
     all_scored_data = pd.merge(identifier_data, X, how="inner", on="index")
     all_scored_data = all_scored_data.drop(columns=["index"])
 
     # Save scored date
-    all_scored_data.to_csv(os.path.join(pipeline_folder_path, "scored_data.csv"))
+    save_batch_frame(all_scored_data, pipeline_folder_path, "scored_data", csv_export)
 
     print(all_scored_data.sort_values(by=["prediction"]))
+    return all_scored_data
+
+
+def score_players_versions(
+    pipeline_folder_path: str, model_versions: list
+) -> pd.DataFrame:
+    # Read in player feature data
+    X = read_batch_frame(pipeline_folder_path, "feature_data")
+
+    # Predictions of every model version side by side
+    predictions = MODEL_REGISTRY.predict_versions(X, model_versions)
+    scored_data = pd.concat(
+        [X.loc[:, ["playerId", "action_season", "action_date"]], predictions], axis=1
+    )
+
+    # Save scored data for all versions
+    save_batch_frame(
+        scored_data, pipeline_folder_path, "scored_data_versions", csv_export=True
+    )
+
+    return scored_data
 
 
 if __name__ == "__main__":
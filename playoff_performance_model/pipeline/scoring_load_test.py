@@ -0,0 +1,98 @@
+import argparse
+import http.client
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from playoff_performance_model.pipeline.batch_artifacts import read_batch_frame
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+
+def run_client(host: str, port: int, paths: list) -> list:
+    # One kept alive connection per client
+    connection = http.client.HTTPConnection(host, port)
+    latencies = []
+    for path in paths:
+        start_time = time.perf_counter()
+        connection.request("GET", path)
+        response = connection.getresponse()
+        json.loads(response.read())
+        latencies.append(time.perf_counter() - start_time)
+    connection.close()
+    return latencies
+
+
+def load_test(
+    host: str,
+    port: int,
+    player_ids: list,
+    action_date: str,
+    num_requests: int,
+    num_clients: int,
+) -> dict:
+    """Send score requests from concurrent clients and report latency and
+    throughput.
+
+    Args:
+        host (str): Scoring service host.
+        port (int): Scoring service port.
+        player_ids (list): Players to request, cycled through.
+        action_date (str): Action date of every request.
+        num_requests (int): Total number of requests.
+        num_clients (int): Number of concurrent clients.
+
+    Returns:
+        dict: Latency percentiles (ms) and throughput (requests/s).
+    """
+    paths = [
+        f"/score?playerId={player_ids[i % len(player_ids)]}&action_date={action_date}"
+        for i in range(num_requests)
+    ]
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_clients) as executor:
+        results = executor.map(
+            lambda i: run_client(host, port, paths[i::num_clients]),
+            range(num_clients),
+        )
+        latencies = np.concatenate([np.array(r) for r in results]) * 1000
+    total_seconds = time.perf_counter() - start_time
+
+    return {
+        "requests": num_requests,
+        "clients": num_clients,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "throughput_rps": num_requests / total_seconds,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scoring service load test.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--action-date", default="2024-06-29")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=8)
+    args = parser.parse_args()
+
+    # Request the players of the latest batch
+    batch_data = read_batch_frame(
+        os.path.join(DIRNAME, "../pipeline_results", f"batch_{args.action_date}"),
+        "batch_data",
+    )
+    print(
+        load_test(
+            args.host,
+            args.port,
+            batch_data["playerId"].tolist(),
+            args.action_date,
+            args.requests,
+            args.clients,
+        )
+    )
@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from playoff_performance_model.pipeline.compiled_model import load_compiled_model
+from playoff_performance_model.pipeline.create_batch_data import (
+    get_season_from_action_date,
+)
+from playoff_performance_model.pipeline.feature_store import PlayerFeatureStore
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+
+# Action dates whose season is remembered, requests can ask for any date
+ACTION_SEASON_CACHE_SIZE = 4096
+
+
+class ScoringRequestException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+class PlayerNotFoundException(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+class ScoringService:
+    """Holds the models and all player data in memory and scores a single
+    player as of an action date.
+    """
+
+    def __init__(self, model_versions: list):
+        self.feature_store = PlayerFeatureStore()
+        self.models = {
+            model_version: load_compiled_model(
+                os.path.join(DIRNAME, "../models", model_version)
+            )
+            for model_version in model_versions
+        }
+        # Column position of each model feature in the feature store values
+        store_features = self.feature_store.get_feature_names()
+        self.feature_positions = {
+            model_version: [store_features.index(c) for c in model.feature_names]
+            for model_version, model in self.models.items()
+        }
+
+    @staticmethod
+    @lru_cache(maxsize=ACTION_SEASON_CACHE_SIZE)
+    def get_action_season(action_date: str) -> int:
+        return int(get_season_from_action_date(action_date))
+
+    def check_player(self, player_id: int):
+        # Unknown players would be scored on a row of missing features
+        if not self.feature_store.has_player(player_id):
+            raise PlayerNotFoundException(f"No MoneyPuck data for player {player_id}.")
+
+    def score_player(
+        self, player_id: int, action_date: str, model_version: str
+    ) -> dict:
+        if model_version not in self.models:
+            raise ScoringRequestException(
+                f"Model version must be in {list(self.models)}. {model_version} given."
+            )
+        self.check_player(player_id)
+        action_season = self.get_action_season(action_date)
+
+        feature_values = self.feature_store.get_player_feature_values(
+            player_id, action_season, action_date
+        )
+        X = feature_values[self.feature_positions[model_version]].reshape(1, -1)
+        prediction = self.models[model_version].predict(X)[0]
+
+        return {
+            "playerId": player_id,
+            "action_season": action_season,
+            "action_date": action_date,
+            "model_version": model_version,
+            "prediction": float(prediction),
+        }
+
+
+def create_request_handler(service: ScoringService, default_model_version: str):
+    class ScoringRequestHandler(BaseHTTPRequestHandler):
+        # Keep connections open between requests and send small responses
+        # right away
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/health":
+                return self.send_json(200, {"models": list(service.models)})
+            if url.path != "/score":
+                return self.send_json(404, {"error": f"Unknown path {url.path}"})
+
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            try:
+                result = service.score_player(
+                    int(query["playerId"]),
+                    query["action_date"],
+                    query.get("model_version", default_model_version),
+                )
+            except PlayerNotFoundException as e:
+                return self.send_json(404, {"error": repr(e)})
+            except (KeyError, ValueError, ScoringRequestException) as e:
+                return self.send_json(400, {"error": repr(e)})
+            self.send_json(200, result)
+
+        def send_json(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            # Don't log every request
+            pass
+
+    return ScoringRequestHandler
+
+
+def serve(host: str, port: int, model_versions: list):
+    """Load models and player data once and answer score requests, e.g.
+    GET /score?playerId=8478402&action_date=2024-06-29&model_version=version_2
+
+    Args:
+        host (str): Host to bind to.
+        port (int): Port to bind to.
+        model_versions (list): Model versions to load. The first is the default.
+    """
+    service = ScoringService(model_versions)
+    server = ThreadingHTTPServer(
+        (host, port), create_request_handler(service, model_versions[0])
+    )
+    print(f"Scoring service listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Player scoring service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--model-versions", nargs="+", default=["version_2"])
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.model_versions)
@@ -0,0 +1,122 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from common_functions.columnar_store import ArtifactWriter
+from common_functions.feature_partitions import (
+    get_partition_paths,
+    write_feature_partition,
+)
+from playoff_performance_model.pipeline.batch_artifacts import (
+    get_artifact_path,
+    read_batch_frame,
+)
+from playoff_performance_model.pipeline.create_batch_data import (
+    get_season_from_action_date,
+)
+from playoff_performance_model.pipeline.feature_store import PlayerFeatureStore
+from playoff_performance_model.pipeline.score import MODEL_REGISTRY
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+IDENTIFIER_COLS = ["playerId", "action_season", "action_date"]
+
+# Batch frame of the streamed identifiers and predictions
+STREAMED_SCORES_FRAME = "streamed_scored_data"
+
+
+def iter_feature_partitions(pipeline_folder_path: str):
+    # Batches built in partitions are read one partition at a time
+    partition_folder = os.path.join(pipeline_folder_path, "feature_partitions")
+    if os.path.exists(partition_folder):
+        for partition_path in get_partition_paths(partition_folder):
+            yield pd.read_pickle(partition_path)
+    else:
+        yield read_batch_frame(pipeline_folder_path, "feature_data")
+
+
+def write_all_player_feature_partitions(
+    pipeline_folder_path: str, action_dates: list, rows_per_partition: int = 50000
+) -> int:
+    """Build feature partitions for every player with a prior regular season
+    at every action date. Features are built one partition at a time.
+
+    Args:
+        pipeline_folder_path (str): Batch folder.
+        action_dates (list): Action dates (YYYY-MM-DD).
+        rows_per_partition (int, optional): Max rows in a partition.
+            Defaults to 50000.
+
+    Returns:
+        int: Number of partitions written.
+    """
+    feature_store = PlayerFeatureStore()
+    partition_folder = os.path.join(pipeline_folder_path, "feature_partitions")
+
+    # Identifier rows for every player and action date
+    batch_data = []
+    for action_date in action_dates:
+        action_season = int(get_season_from_action_date(action_date))
+        rows = feature_store.regular.seasons == action_season - 1
+        batch_data.append(
+            pd.DataFrame(
+                {
+                    "playerId": np.unique(feature_store.regular.player_ids[rows]),
+                    "action_season": action_season,
+                    "action_date": action_date,
+                }
+            )
+        )
+    batch_data = pd.concat(batch_data).reset_index(drop=True)
+
+    num_partitions = 0
+    for start in range(0, batch_data.shape[0], rows_per_partition):
+        partition = feature_store.get_features(
+            batch_data.iloc[start : start + rows_per_partition]
+        )
+        write_feature_partition(partition, partition_folder, num_partitions)
+        num_partitions += 1
+    return num_partitions
+
+
+def score_players_streaming(
+    pipeline_folder_path: str, model_version: str, batch_size: int = 10000
+) -> str:
+    """Score feature partitions in fixed size batches and append identifiers
+    and predictions to a columnar artifact, one row group per batch. Peak
+    memory is bounded by the partition size.
+
+    Args:
+        pipeline_folder_path (str): Batch folder.
+        model_version (str): Model version to score with.
+        batch_size (int, optional): Rows predicted at once. Defaults to 10000.
+
+    Returns:
+        str: Path of the scored data, read with read_batch_frame.
+    """
+    model = MODEL_REGISTRY.get_model(model_version)
+
+    output_path = get_artifact_path(pipeline_folder_path, STREAMED_SCORES_FRAME)
+    with ArtifactWriter(output_path) as writer:
+        for partition in iter_feature_partitions(pipeline_folder_path):
+            for start in range(0, partition.shape[0], batch_size):
+                batch = partition.iloc[start : start + batch_size]
+                # Rows numbered across all batches
+                scored_batch = batch.loc[:, IDENTIFIER_COLS].reset_index(drop=True)
+                scored_batch.index += writer.num_rows
+                scored_batch["prediction"] = model.predict(batch)
+                writer.append(scored_batch)
+    return output_path
+
+
+if __name__ == "__main__":
+    # Score every player across every action date in one run
+    action_dates = [f"{year}-06-29" for year in range(2009, 2025)]
+    pipeline_folder_path = os.path.join(
+        DIRNAME, "../pipeline_results", "batch_all_action_dates"
+    )
+
+    write_all_player_feature_partitions(pipeline_folder_path, action_dates)
+    score_players_streaming(pipeline_folder_path, model_version="version_2")
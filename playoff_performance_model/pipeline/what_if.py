@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+from common_functions.moneypuck_player_stats import check_season_type_valid_mp
+from playoff_performance_model.pipeline.scoring_service import (
+    ScoringRequestException,
+    ScoringService,
+)
+
+
+class WhatIfScorer:
+    """Rescores a player with overridden season stats. Only the features an
+    override touches are recomputed: the prior regular season stats and the
+    regular or playoff lookback means whose window holds the season.
+
+    An override is a dict, e.g.
+    {"season_type": "regular", "season": 2023, "stats": {"gameScore": 60.0}}
+    """
+
+    def __init__(self, service: ScoringService):
+        self.service = service
+        self.feature_store = service.feature_store
+        self.stat_index = {
+            col: i for i, col in enumerate(self.feature_store.stat_columns)
+        }
+
+    def get_what_if_feature_values(
+        self,
+        base_values: np.ndarray,
+        player_id: int,
+        action_season: int,
+        overrides: list,
+    ) -> np.ndarray:
+        feature_store = self.feature_store
+        num_stats = len(feature_store.stat_columns)
+        num_seasons = feature_store.num_seasons
+        values = base_values.copy()
+
+        for season_type in ["regular", "playoffs"]:
+            season_overrides = [o for o in overrides if o["season_type"] == season_type]
+            if len(season_overrides) == 0:
+                continue
+            table = (
+                feature_store.regular
+                if season_type == "regular"
+                else feature_store.playoffs
+            )
+
+            # Player's seasons in the lookback window
+            rows = table.get_player_rows(player_id)
+            window_seasons = list(range(action_season - num_seasons, action_season))
+            window = np.full((num_seasons, num_stats), np.nan)
+            played = np.zeros(num_seasons, dtype=bool)
+            for season, stats in zip(table.seasons[rows], table.values[rows]):
+                if season in window_seasons:
+                    window[window_seasons.index(season)] = stats
+                    played[window_seasons.index(season)] = True
+
+            changed_cols = set()
+            for override in season_overrides:
+                cols = [self.stat_index[c] for c in override["stats"]]
+                changed_cols.update(cols)
+                if override["season"] in window_seasons:
+                    i = window_seasons.index(override["season"])
+                    window[i, cols] = list(override["stats"].values())
+                    played[i] = True
+
+                # The prior regular season stats are features themselves
+                if season_type == "regular" and override["season"] == action_season - 1:
+                    values[cols] = list(override["stats"].values())
+
+            # Recompute the lookback means of the changed stats only
+            changed_cols = sorted(changed_cols)
+            mean_offset = num_stats if season_type == "regular" else 2 * num_stats
+            if played.any():
+                values[[mean_offset + c for c in changed_cols]] = np.nanmean(
+                    window[played][:, changed_cols], axis=0
+                )
+        return values
+
+    def score_scenarios(
+        self,
+        player_id: int,
+        action_date: str,
+        scenarios: list,
+        model_version: str,
+    ) -> pd.DataFrame:
+        """Score a player under several what-if scenarios in one model call.
+
+        Args:
+            player_id (int): Player id.
+            action_date (str): Action date (YYYY-MM-DD).
+            scenarios (list): Scenarios, each a list of overrides.
+            model_version (str): Model version to score with.
+
+        Raises:
+            ScoringRequestException: Unknown model version or stat.
+            PlayerNotFoundException: No MoneyPuck data for the player.
+
+        Returns:
+            pd.DataFrame: Base and what-if prediction per scenario.
+        """
+        if model_version not in self.service.models:
+            raise ScoringRequestException(
+                f"Model version must be in {list(self.service.models)}. "
+                f"{model_version} given."
+            )
+        for overrides in scenarios:
+            for override in overrides:
+                check_season_type_valid_mp(override["season_type"])
+                unknown_stats = set(override["stats"]) - set(self.stat_index)
+                if len(unknown_stats) > 0:
+                    raise ScoringRequestException(
+                        f"Unknown MoneyPuck stats {sorted(unknown_stats)}."
+                    )
+
+        self.service.check_player(player_id)
+        action_season = self.service.get_action_season(action_date)
+        base_values = self.feature_store.get_player_feature_values(
+            player_id, action_season, action_date
+        )
+
+        # Base row followed by one row per scenario
+        X = np.vstack(
+            [
+                base_values,
+                *[
+                    self.get_what_if_feature_values(
+                        base_values, player_id, action_season, overrides
+                    )
+                    for overrides in scenarios
+                ],
+            ]
+        )
+        X = X[:, self.service.feature_positions[model_version]]
+        predictions = self.service.models[model_version].predict(X)
+
+        return pd.DataFrame(
+            {
+                "scenario": range(len(scenarios)),
+                "base_prediction": predictions[0],
+                "prediction": predictions[1:],
+                "prediction_change": predictions[1:] - predictions[0],
+            }
+        )
+
+    def score(
+        self, player_id: int, action_date: str, overrides: list, model_version: str
+    ) -> dict:
+        result = self.score_scenarios(
+            player_id, action_date, [overrides], model_version
+        )
+        return result.drop(columns=["scenario"]).iloc[0].to_dict()
+
+
+if __name__ == "__main__":
+    what_if = WhatIfScorer(ScoringService(["version_2"]))
+
+    # Sweep last regular season's game score for one player
+    scenarios = [
+        [{"season_type": "regular", "season": 2023, "stats": {"gameScore": gs}}]
+        for gs in np.linspace(0, 120, 200)
+    ]
+    print(what_if.score_scenarios(8478402, "2024-06-29", scenarios, "version_2"))
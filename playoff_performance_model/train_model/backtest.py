@@ -0,0 +1,129 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from playoff_performance_model.train_model.feature_collection import (
+    collect_training_features,
+)
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+TARGET_VARIABLE = "gamescore_toi"
+
+
+def get_backtest_feature_data() -> pd.DataFrame:
+    # Feature rows do not depend on the fold, collect them once and cache them
+    feature_data_path = os.path.join(
+        DIRNAME, "training_data", "training_feature_data.pkl"
+    )
+    if os.path.exists(feature_data_path):
+        return pd.read_pickle(feature_data_path)
+
+    feature_data = collect_training_features()
+    feature_data.to_pickle(feature_data_path)
+    return feature_data
+
+
+def rank_correlation(y_true: np.ndarray, y_pred: np.ndarray) -> float:
+    # Spearman correlation is the Pearson correlation of the ranks
+    return pd.Series(y_true).corr(pd.Series(y_pred), method="spearman")
+
+
+def run_backtest_fold(
+    season: int,
+    X: np.ndarray,
+    y: np.ndarray,
+    seasons: np.ndarray,
+    params: dict,
+    num_boost_round: int,
+) -> dict:
+    start_time = time.perf_counter()
+
+    # Only seasons before the scored season are used to train
+    train_rows = seasons < season
+    test_rows = seasons == season
+
+    dtrain = xgb.DMatrix(X[train_rows], label=y[train_rows])
+    booster = xgb.train(params, dtrain, num_boost_round=num_boost_round)
+    y_pred = booster.predict(xgb.DMatrix(X[test_rows]))
+
+    return {
+        "season": season,
+        "num_train": int(train_rows.sum()),
+        "num_test": int(test_rows.sum()),
+        "rmse": float(np.sqrt(np.mean((y_pred - y[test_rows]) ** 2))),
+        "rank_corr": rank_correlation(y[test_rows], y_pred),
+        "fold_seconds": time.perf_counter() - start_time,
+    }
+
+
+def walk_forward_backtest(
+    model_version: str,
+    start_season: int = 2015,
+    end_season: int = 2023,
+    num_boost_round: int = 500,
+    max_workers: int = None,
+) -> pd.DataFrame:
+    """Walk forward backtest of a model version's features and params. For
+    each season, train on all prior seasons and score that season's
+    playoffs. Season folds run in parallel processes.
+
+    Args:
+        model_version (str): Model version to take features and params from.
+        start_season (int, optional): First season scored. Defaults to 2015.
+        end_season (int, optional): Last season scored. Defaults to 2023.
+        num_boost_round (int, optional): Boosting rounds. Defaults to 500.
+        max_workers (int, optional): Folds run at once. Defaults to one per
+            season, capped at the number of cores.
+
+    Returns:
+        pd.DataFrame: RMSE and rank correlation per season.
+    """
+    start_time = time.perf_counter()
+
+    # Features and params of the model version being backtested
+    model_path = os.path.join(DIRNAME, "../models", model_version)
+    with open(os.path.join(model_path, "feature_names.json")) as f:
+        feature_names = json.load(f)
+    with open(os.path.join(model_path, "params.json")) as f:
+        params = {k: v for k, v in json.load(f).items() if v is not None}
+
+    feature_data = get_backtest_feature_data()
+    X = feature_data.reindex(columns=feature_names).to_numpy(dtype=np.float32)
+    y = feature_data[TARGET_VARIABLE].to_numpy(dtype=np.float64)
+    seasons = feature_data["action_season"].to_numpy()
+
+    backtest_seasons = range(start_season, end_season + 1)
+    if max_workers is None:
+        max_workers = min(len(backtest_seasons), os.cpu_count() or 1)
+    # Split the cores between the folds running at the same time
+    params["nthread"] = max(1, (os.cpu_count() or 1) // max_workers)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                run_backtest_fold, season, X, y, seasons, params, num_boost_round
+            )
+            for season in backtest_seasons
+        ]
+        results = pd.DataFrame([future.result() for future in futures])
+
+    total_seconds = time.perf_counter() - start_time
+    print(f"\nWalk forward backtest for {model_version}:")
+    print(results)
+    print(f"Total wall clock time: {total_seconds:.2f}s")
+
+    return results
+
+
+if __name__ == "__main__":
+    backtest_results = walk_forward_backtest("version_2")
+    backtest_results.to_csv(
+        os.path.join(DIRNAME, "training_data", "backtest_version_2.csv")
+    )
@@ -0,0 +1,110 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from common_functions.profiling import bind_context, profiled_stage
+from playoff_performance_model.train_model.partitioned_training import save_booster
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+TARGET_VARIABLE = "gamescore_toi"
+
+# Folder inside a model version that holds the bootstrap ensemble members
+BOOTSTRAP_FOLDER = "bootstrap"
+
+
+@profiled_stage
+def train_bootstrap_member(
+    X: np.ndarray,
+    y: np.ndarray,
+    seed: int,
+    feature_names: list,
+    shared_data: xgb.QuantileDMatrix,
+    params: dict,
+    num_boost_round: int,
+) -> xgb.Booster:
+    # A bootstrap sample is the same rows weighted by how often they are drawn
+    rng = np.random.default_rng(seed)
+    sample_counts = rng.multinomial(len(y), np.full(len(y), 1 / len(y)))
+
+    # Reuse the bins of the shared feature matrix instead of sketching again,
+    # ref doesn't carry the feature names over so the model is saved with them
+    dtrain = xgb.QuantileDMatrix(
+        X,
+        label=y,
+        weight=sample_counts,
+        feature_names=feature_names,
+        ref=shared_data,
+    )
+    return xgb.train({**params, "seed": seed}, dtrain, num_boost_round=num_boost_round)
+
+
+def train_bootstrap_ensemble(
+    model_version: str,
+    num_members: int,
+    num_boost_round: int = 500,
+    max_workers: int = None,
+):
+    """Fit bootstrap copies of a model version in parallel. Members share
+    the model's features and params and are saved to
+    models/<version>/bootstrap/member_<i>/.
+
+    Args:
+        model_version (str): Model version to build the ensemble for.
+        num_members (int): Number of bootstrap models.
+        num_boost_round (int, optional): Boosting rounds. Defaults to 500.
+        max_workers (int, optional): Members trained at once. Defaults to
+            the number of cores.
+    """
+    model_path = os.path.join(DIRNAME, "../models", model_version)
+    with open(os.path.join(model_path, "feature_names.json")) as f:
+        feature_names = json.load(f)
+    with open(os.path.join(model_path, "params.json")) as f:
+        params = {k: v for k, v in json.load(f).items() if v is not None}
+
+    # Read in data
+    all_data = pd.read_pickle(
+        os.path.join(DIRNAME, "training_data", "training_feature_data.pkl")
+    )
+    X = all_data.loc[:, feature_names].to_numpy(dtype=np.float32)
+    y = all_data[TARGET_VARIABLE].to_numpy(dtype=np.float64)
+
+    # Bin the feature matrix once, every member reuses its quantile cuts
+    params = {**params, "tree_method": "hist"}
+    shared_data = xgb.QuantileDMatrix(
+        X, feature_names=feature_names, max_bin=params.get("max_bin", 256)
+    )
+
+    # One thread per member so training scales with cores, not members
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    params["nthread"] = 1
+
+    print(f"\nTraining {num_members} bootstrap models...")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Members run in the caller's context, so a profiled run records them
+        boosters = executor.map(
+            bind_context(
+                lambda seed: train_bootstrap_member(
+                    X, y, seed, feature_names, shared_data, params, num_boost_round
+                )
+            ),
+            range(num_members),
+        )
+        for i, booster in enumerate(boosters):
+            save_booster(
+                booster,
+                os.path.join(model_path, BOOTSTRAP_FOLDER, f"member_{i:03d}"),
+                feature_names,
+                {**params, "num_boost_round": num_boost_round, "seed": i},
+            )
+    print("Finished training bootstrap models.")
+
+
+if __name__ == "__main__":
+    train_bootstrap_ensemble("version_2", num_members=50)
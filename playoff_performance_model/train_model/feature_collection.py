@@ -1,23 +1,22 @@
 import os
-import sys
 from datetime import datetime
 from functools import reduce
 
 import numpy as np
 import pandas as pd
 
-# Get path of current file's directory
-DIRNAME = os.path.dirname(os.path.realpath(__file__))
-
-# Insert path to all hockey analytics files
-sys.path.insert(0, os.path.join(DIRNAME, "../.."))
 from collect_data.read_local_data import read_in_all_mp_data, read_mp_bio_data
 from common_functions.moneypuck_player_stats import (
     check_season_type_valid_mp,
     get_mp_player_data_for_year,
 )
+from common_functions.profiling import profiled_stage
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
 
 
+@profiled_stage
 def get_past_x_seasons_average_score(
     data: pd.DataFrame,
     season_type: str,
@@ -45,7 +44,6 @@ def get_past_x_seasons_average_score(
     col_mean_names = [
         f"mean_{num_seasons}years_{season_type}_{situation}_{col}" for col in columns
     ]
-    print("here")
     data[col_mean_names] = data.apply(
         lambda x: get_past_x_seasons_average_score_helper(
             x["playerId"], x["action_season"], num_seasons, mp_data.copy()
@@ -72,6 +70,7 @@ def get_past_x_seasons_average_score_helper(
     return player_data.drop(columns=["playerId", "season"]).mean()
 
 
+@profiled_stage
 def add_player_biographical_data_mp(data: pd.DataFrame) -> pd.DataFrame:
     # Read in MoneyPuck player bio data
     mp_bio_data = read_mp_bio_data()
@@ -127,6 +126,7 @@ def get_age_in_days(start_date: str, end_date: str) -> int:
     return reduce(lambda x, y: (y - x).days, [sd, ed])
 
 
+@profiled_stage
 def add_offset_x_season_stats(
     data: pd.DataFrame, season_type: str, offset: int
 ) -> pd.DataFrame:
@@ -156,6 +156,7 @@ def add_offset_x_season_stats(
     return data
 
 
+@profiled_stage
 def feature_selection_process(feature_data: pd.DataFrame) -> pd.DataFrame:
 
     # Keep identifying information
@@ -217,6 +218,7 @@ def feature_selection_process(feature_data: pd.DataFrame) -> pd.DataFrame:
     return final_data
 
 
+@profiled_stage
 def get_model_features(feature_data: pd.DataFrame) -> pd.DataFrame:
     # Add regular season offset data
     # TODO: Larger lookback window than 1 year
@@ -247,6 +249,7 @@ def get_model_features(feature_data: pd.DataFrame) -> pd.DataFrame:
     return feature_data
 
 
+@profiled_stage
 def collect_training_features() -> pd.DataFrame:
     # Read in target variable data
     target_data = pd.read_csv(
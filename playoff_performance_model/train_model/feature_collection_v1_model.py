@@ -1,22 +1,19 @@
 import os
-import sys
 from datetime import datetime
 from functools import reduce
 
 import numpy as np
 import pandas as pd
 
-# Get path of current file's directory
-DIRNAME = os.path.dirname(os.path.realpath(__file__))
-
-# Insert path to all hockey analytics files
-sys.path.insert(0, os.path.join(DIRNAME, "../.."))
 from collect_data.read_local_data import read_mp_bio_data
 from common_functions.moneypuck_player_stats import (
     check_season_type_valid_mp,
     get_mp_player_data_for_year,
 )
 
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
 
 def add_player_biographical_data_mp(data: pd.DataFrame) -> pd.DataFrame:
     # Read in MoneyPuck player bio data
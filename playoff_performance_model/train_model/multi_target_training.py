@@ -0,0 +1,192 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from common_functions.profiling import bind_context, profiled_stage
+from playoff_performance_model.train_model.feature_collection import (
+    get_model_features,
+)
+from playoff_performance_model.train_model.partitioned_training import save_booster
+from playoff_performance_model.train_model.target_variable import (
+    create_target_variable_data,
+)
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+IDENTIFIER_COLS = ["playerId", "action_season", "action_date"]
+
+# Target variants: gamescore_toi for a situation and min playoff games played
+TARGET_VARIANTS = [
+    {"situation": "all", "min_games_played": 4},
+    {"situation": "all", "min_games_played": 8},
+    {"situation": "5on5", "min_games_played": 4},
+    {"situation": "5on4", "min_games_played": 4},
+]
+
+
+def get_target_name(situation: str, min_games_played: int) -> str:
+    return f"gamescore_toi_{situation}_min{min_games_played}gp"
+
+
+def collect_multi_target_training_data(
+    start_year: int, target_variants: list
+) -> pd.DataFrame:
+    """Collect features once for every player season in any target variant
+    and attach one target column per variant.
+
+    Args:
+        start_year (int): First season to get target data for.
+        target_variants (list): Dicts with situation and min_games_played.
+
+    Returns:
+        pd.DataFrame: Identifiers, one column per target and the features.
+    """
+    all_target_data = []
+    for variant in target_variants:
+        target_data = create_target_variable_data(
+            start_year, variant["min_games_played"], variant["situation"]
+        )
+        target_data = target_data.rename(
+            columns={"gamescore_toi": get_target_name(**variant)}
+        )
+        all_target_data.append(
+            target_data.loc[:, [*IDENTIFIER_COLS, get_target_name(**variant)]]
+        )
+    # Players missing a variant (e.g. too few games) have an empty target
+    target_data = reduce(
+        lambda x, y: pd.merge(x, y, on=IDENTIFIER_COLS, how="outer"), all_target_data
+    )
+    # Feature collection expects action dates as strings
+    target_data["action_date"] = target_data["action_date"].dt.strftime("%Y-%m-%d")
+
+    # Features only depend on the identifiers, so collect them a single time
+    feature_data = get_model_features(target_data.loc[:, IDENTIFIER_COLS].copy())
+
+    return pd.merge(target_data, feature_data, on=IDENTIFIER_COLS, how="inner")
+
+
+@profiled_stage
+def train_target_booster(
+    X: np.ndarray,
+    y: np.ndarray,
+    test_mask: np.ndarray,
+    feature_names: list,
+    shared_data: xgb.QuantileDMatrix,
+    params: dict,
+    num_boost_round: int,
+) -> tuple:
+    # Only rows where this target exists
+    has_target = ~np.isnan(y)
+    train_rows = has_target & ~test_mask
+    test_rows = has_target & test_mask
+
+    # Reuse the bins of the shared feature matrix instead of sketching again,
+    # ref doesn't carry the feature names over so the model is saved with them
+    dtrain = xgb.QuantileDMatrix(
+        X[train_rows],
+        label=y[train_rows],
+        feature_names=feature_names,
+        ref=shared_data,
+    )
+    dtest = xgb.QuantileDMatrix(
+        X[test_rows], label=y[test_rows], feature_names=feature_names, ref=shared_data
+    )
+    booster = xgb.train(params, dtrain, num_boost_round=num_boost_round)
+
+    rmse_test = np.sqrt(np.mean((booster.predict(dtest) - y[test_rows]) ** 2))
+    return booster, rmse_test
+
+
+def train_multi_target_models(
+    model_version: str,
+    training_data: pd.DataFrame,
+    target_names: list,
+    params: dict,
+    num_boost_round: int,
+    test_size: float = 0.2,
+):
+    """Train one booster per target concurrently on a shared binned feature
+    matrix. Each model is saved to models/<version>/<target>/.
+
+    Args:
+        model_version (str): Model version folder to save the models to.
+        training_data (pd.DataFrame): Output of collect_multi_target_training_data.
+        target_names (list): Target columns to train a model for.
+        params (dict): XGBoost training parameters shared by all targets.
+        num_boost_round (int): Number of boosting rounds.
+        test_size (float, optional): Share of rows held out. Defaults to 0.2.
+    """
+    feature_names = [
+        c
+        for c in training_data.select_dtypes(include=np.number).columns
+        if c not in [*IDENTIFIER_COLS, *target_names]
+    ]
+    X = training_data.loc[:, feature_names].to_numpy(dtype=np.float32)
+
+    # Same held out rows for every target so results are comparable
+    rng = np.random.default_rng(123)
+    test_mask = rng.random(X.shape[0]) < test_size
+
+    # Bin the feature matrix once, every target reuses its quantile cuts
+    params = {**params, "tree_method": "hist"}
+    shared_data = xgb.QuantileDMatrix(
+        X, feature_names=feature_names, max_bin=params.get("max_bin", 256)
+    )
+
+    # Split the cores between the targets trained at the same time
+    params["nthread"] = max(1, (os.cpu_count() or 1) // len(target_names))
+
+    print(f"\nTraining {len(target_names)} models...")
+    with ThreadPoolExecutor(max_workers=len(target_names)) as executor:
+        # Targets run in the caller's context, so a profiled run records them
+        futures = {
+            target: executor.submit(
+                bind_context(train_target_booster),
+                X,
+                training_data[target].to_numpy(dtype=np.float64),
+                test_mask,
+                feature_names,
+                shared_data,
+                params,
+                num_boost_round,
+            )
+            for target in target_names
+        }
+
+        for target, future in futures.items():
+            booster, rmse_test = future.result()
+            print(f"The RMSE test score for {target} is {rmse_test:.5f}")
+
+            model_path = os.path.join(DIRNAME, "../models", model_version, target)
+            save_booster(
+                booster,
+                model_path,
+                feature_names,
+                {**params, "num_boost_round": num_boost_round, "target": target},
+            )
+    print("Finished training models.")
+
+
+if __name__ == "__main__":
+    # Collect features once for all target variants
+    training_data = collect_multi_target_training_data(
+        start_year=2014, target_variants=TARGET_VARIANTS
+    )
+
+    train_multi_target_models(
+        "version_3",
+        training_data,
+        [get_target_name(**variant) for variant in TARGET_VARIANTS],
+        params={
+            "objective": "reg:squarederror",
+            "eval_metric": "rmse",
+            "learning_rate": 0.01,
+            "max_depth": 4,
+        },
+        num_boost_round=500,
+    )
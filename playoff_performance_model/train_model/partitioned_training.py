@@ -0,0 +1,190 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from common_functions.feature_partitions import (
+    get_partition_paths,
+    write_feature_partitions,
+)
+
+# Get path of current file's directory
+DIRNAME = os.path.dirname(os.path.realpath(__file__))
+
+# Identifier data will not be included in training or scoring
+IDENTIFIER_COLS = ["playerId", "action_season", "action_date"]
+TARGET_VARIABLE = "gamescore_toi"
+
+
+class FeaturePartitionIter(xgb.DataIter):
+    """Streams feature partitions from disk into XGBoost one at a time.
+    Only a single partition is held in memory, XGBoost keeps the rest in
+    its external memory cache.
+    """
+
+    def __init__(
+        self,
+        partition_paths: list,
+        feature_names: list,
+        target_variable: str,
+        cache_prefix: str,
+    ):
+        self.partition_paths = partition_paths
+        self.feature_names = feature_names
+        self.target_variable = target_variable
+        self._it = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data) -> bool:
+        # All partitions have been passed to XGBoost
+        if self._it == len(self.partition_paths):
+            return False
+
+        partition = pd.read_pickle(self.partition_paths[self._it])
+        # Partitions may not share every column, align to the model features
+        X = partition.reindex(columns=self.feature_names).astype(np.float32)
+        input_data(data=X, label=partition[self.target_variable].values)
+        self._it += 1
+        return True
+
+    def reset(self):
+        self._it = 0
+
+
+def get_partition_feature_names(partition_paths: list) -> list:
+    # Union of feature columns over all partitions, first seen order
+    feature_names = {}
+    for partition_path in partition_paths:
+        partition = pd.read_pickle(partition_path)
+        for col in partition.select_dtypes(include=np.number).columns:
+            if col not in [*IDENTIFIER_COLS, TARGET_VARIABLE]:
+                feature_names[col] = None
+    return list(feature_names)
+
+
+def create_partition_dmatrix(
+    partition_paths: list,
+    feature_names: list,
+    cache_prefix: str,
+    max_bin: int,
+    ref: xgb.DMatrix = None,
+) -> xgb.DMatrix:
+    data_iter = FeaturePartitionIter(
+        partition_paths, feature_names, TARGET_VARIABLE, cache_prefix
+    )
+    # Newer XGBoost builds the histogram index directly in external memory,
+    # evaluation data has to reuse the bins of the training data (ref)
+    if hasattr(xgb, "ExtMemQuantileDMatrix"):
+        return xgb.ExtMemQuantileDMatrix(data_iter, max_bin=max_bin, ref=ref)
+    return xgb.DMatrix(data_iter)
+
+
+def save_booster(
+    booster: xgb.Booster, model_path: str, feature_names: list, params: dict
+):
+    # Same layout as train_model: model, feature names and params
+    Path(model_path).mkdir(parents=True, exist_ok=True)
+    booster.save_model(os.path.join(model_path, "model.json"))
+
+    # Save the feature names (preserve order)
+    with open(os.path.join(model_path, "feature_names.json"), "w") as f:
+        json.dump(feature_names, f)
+
+    # Save model params to json file
+    with open(os.path.join(model_path, "params.json"), "w") as f:
+        json.dump(params, f)
+
+
+def train_model_partitioned(
+    model_version: str,
+    partition_folder: str,
+    params: dict,
+    num_boost_round: int,
+    feature_names: list = None,
+    num_eval_partitions: int = 1,
+):
+    """Train an XGBoost model over feature partitions on disk. Peak memory is
+    bounded by the partition size, not the total size of the training data.
+
+    Args:
+        model_version (str): Model version folder to save the model to.
+        partition_folder (str): Folder with the feature partitions.
+        params (dict): XGBoost training parameters.
+        num_boost_round (int): Number of boosting rounds.
+        feature_names (list, optional): Features to train on. Defaults to
+            every numeric column found in the partitions.
+        num_eval_partitions (int, optional): Trailing partitions held out to
+            evaluate the model on. Defaults to 1.
+    """
+    partition_paths = get_partition_paths(partition_folder)
+    if feature_names is None:
+        feature_names = get_partition_feature_names(partition_paths)
+
+    # Hold out the last partitions for evaluation
+    train_paths = partition_paths[: len(partition_paths) - num_eval_partitions]
+    eval_paths = partition_paths[len(partition_paths) - num_eval_partitions :]
+
+    # External memory requires the hist tree method
+    params = {**params, "tree_method": "hist"}
+    max_bin = params.get("max_bin", 256)
+
+    cache_folder = os.path.join(partition_folder, "cache")
+    Path(cache_folder).mkdir(parents=True, exist_ok=True)
+    dtrain = create_partition_dmatrix(
+        train_paths, feature_names, os.path.join(cache_folder, "train"), max_bin
+    )
+    evals = [(dtrain, "train")]
+    if len(eval_paths) > 0:
+        dtest = create_partition_dmatrix(
+            eval_paths,
+            feature_names,
+            os.path.join(cache_folder, "test"),
+            max_bin,
+            ref=dtrain,
+        )
+        evals.append((dtest, "test"))
+
+    print("\nTraining model...")
+    booster = xgb.train(
+        params, dtrain, num_boost_round=num_boost_round, evals=evals, verbose_eval=50
+    )
+
+    # Save the model
+    model_path = os.path.join(DIRNAME, "../models", model_version)
+    save_booster(
+        booster,
+        model_path,
+        feature_names,
+        {**params, "num_boost_round": num_boost_round},
+    )
+    print("Finished training model.")
+
+
+if __name__ == "__main__":
+    partition_folder = os.path.join(DIRNAME, "training_data", "partitions")
+
+    # Split the current training data into partitions if not already done
+    if not os.path.exists(partition_folder):
+        all_data = pd.read_pickle(
+            os.path.join(DIRNAME, "training_data", "training_feature_data.pkl")
+        )
+        # Shuffle so the held out partition is not a single season
+        all_data = all_data.sample(frac=1, random_state=123).reset_index(drop=True)
+        write_feature_partitions(all_data, partition_folder, rows_per_partition=500)
+
+    # Train on the same features as the version_2 model
+    with open(os.path.join(DIRNAME, "../models/version_2/feature_names.json")) as f:
+        feature_names = json.load(f)
+    with open(os.path.join(DIRNAME, "../models/version_2/params.json")) as f:
+        params = {k: v for k, v in json.load(f).items() if v is not None}
+
+    train_model_partitioned(
+        "version_2_partitioned",
+        partition_folder,
+        params,
+        num_boost_round=500,
+        feature_names=feature_names,
+    )
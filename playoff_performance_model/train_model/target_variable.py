@@ -1,17 +1,15 @@
 import os
-import sys
 
 import numpy as np
 import pandas as pd
 from datetime import datetime
 
+from collect_data.read_local_data import read_in_all_mp_data
+from common_functions.profiling import profiled_stage
+
 # Get path of current file's directory
 DIRNAME = os.path.dirname(os.path.realpath(__file__))
 
-# Insert path to all hockey analytics files
-sys.path.insert(0, os.path.join(DIRNAME, "../.."))
-from collect_data.read_local_data import read_in_all_mp_data
-
 
 def calc_game_score(
     goals: int,
@@ -109,6 +107,7 @@ def create_action_date_target_data(playoff_season_year: int) -> datetime:
     return datetime.strptime(season_end_dates[playoff_season_year - 1], "%Y-%m-%d")
 
 
+@profiled_stage
 def create_target_variable_data(
     start_year: int, min_games_played: int, situation: str
 ) -> pd.DataFrame:
@@ -5,19 +5,20 @@ from datetime import datetime
 from functools import reduce
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import xgboost as xgb
 from sklearn.feature_selection import SelectKBest, mutual_info_regression
 from sklearn.metrics import root_mean_squared_error
 from sklearn.model_selection import GridSearchCV, train_test_split
-from xgboost import plot_importance
+
+from common_functions.profiling import profile_stage, profiled_stage
 
 # Get path of current file's directory
 DIRNAME = os.path.dirname(os.path.realpath(__file__))
 
 
+@profiled_stage
 def select_features(features_df: pd.DataFrame, target: pd.Series, num_features: int):
     # configure to select num_features
     fs = SelectKBest(score_func=mutual_info_regression, k=num_features)
@@ -29,7 +30,8 @@ def select_features(features_df: pd.DataFrame, target: pd.Series, num_features:
     return features_df_new
 
 
-def train_model(model_version: str):
+@profiled_stage
+def train_model(model_version: str, plot_importance: bool = True):
     # Read in data
     all_data = pd.read_pickle(
         os.path.join(DIRNAME, "training_data", "training_feature_data.pkl")
@@ -77,7 +79,8 @@ def train_model(model_version: str):
     }
 
     # try out every combination of the above values
-    search = GridSearchCV(model, param_grid, cv=5).fit(X_train, y_train)
+    with profile_stage("grid_search", rows_in=X_train.shape[0]):
+        search = GridSearchCV(model, param_grid, cv=5).fit(X_train, y_train)
 
     print("The best hyperparameters are ", search.best_params_)
 
@@ -88,7 +91,8 @@ def train_model(model_version: str):
         eval_metric="rmse",
         enable_categorical=True,
     )
-    model.fit(X_train, y_train)
+    with profile_stage("fit", rows_in=X_train.shape[0]):
+        model.fit(X_train, y_train)
 
     # Save the model
     model_path = os.path.join(DIRNAME, "../models", model_version)
@@ -131,12 +135,17 @@ def train_model(model_version: str):
     rmse_test = np.sqrt(root_mean_squared_error(y_test, predictions))
     print("The RMSE test score is %.5f" % rmse_test)
 
-    # Plot feature importance
+    if not plot_importance:
+        return
+
+    # Plot feature importance, matplotlib is only imported to plot
+    import matplotlib.pyplot as plt
+
     plt.style.use("fivethirtyeight")
     plt.rcParams.update({"font.size": 16})
 
     fig, ax = plt.subplots(figsize=(12, 6))
-    plot_importance(model, max_num_features=8, ax=ax)
+    xgb.plot_importance(model, max_num_features=8, ax=ax)
     # plt.savefig(os.path.join(model_path, "feature_importance_xgboost.png"))
     plt.show()
 